@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+"""
+浏览器常驻进程：保持一个已登录的持久化浏览器上下文，并预先打开若干空白页
+- 浏览器开启 CDP 端口，流程用 connect_over_cdp 连接，租到一个现成的页面（毫秒级），
+  不再每次启动 Chromium、注入 Cookie、打开第一个页面
+- 租借/归还通过本地控制端口（HTTP JSON）完成；归还时页面 JS 堆超过 PAGE_RECYCLE_HEAP_MB 或
+  使用次数过多则关闭重建，否则回到 about:blank 继续复用
+- 守护进程里同时运行会话保持心跳（SessionKeeper + CookieBridge），登录状态一直是热的
+用法：
+  python browser_daemon.py [--headless]
+流程中：
+  lease = lease_page(p)   # 守护进程未运行时返回 None，按原方式自行启动浏览器
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import queue
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from browser_setup import CONTEXT_OPTIONS, STEALTH_SCRIPT, launch_options
+from config import (
+    BROWSER_DAEMON_CDP_PORT,
+    BROWSER_DAEMON_CONTROL_PORT,
+    BROWSER_POOL_SIZE,
+    PAGE_RECYCLE_HEAP_MB,
+)
+
+DAEMON_HOST = "127.0.0.1"
+DAEMON_URL = f"http://{DAEMON_HOST}:{BROWSER_DAEMON_CONTROL_PORT}"
+USER_DATA_DIR = "pw-daemon-data"
+# 池中页面的地址，# 后面是页面编号，客户端按地址在 context.pages 中找到租到的页面
+POOL_URL = "about:blank#pool-{}"
+# 单个页面最多被租借的次数
+PAGE_MAX_USES = 20
+# 租到的页面超过这个时间（秒）既没有归还也没有任何活动（请求、导航、renew），视为客户端已退出，收回页面
+LEASE_TTL = 30 * 60
+# 主循环每次处理 Playwright 事件的时长（毫秒）；其间每 COMMAND_POLL_MS 检查一次控制命令，有命令时立即处理
+TICK_MS = 200
+COMMAND_POLL_MS = 10
+# 检查租借超时和页面 JS 堆的间隔（秒）
+MAINTAIN_INTERVAL = 60
+
+HEAP_SCRIPT = "() => (performance.memory ? performance.memory.usedJSHeapSize : 0)"
+
+
+def log(msg):
+    try:
+        print(msg)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((str(msg) + "\n").encode("utf-8", errors="backslashreplace"))
+        sys.stdout.buffer.flush()
+
+
+class _Pooled:
+    __slots__ = ("page", "url", "uses", "leased_at", "active_at")
+
+    def __init__(self, page, url: str):
+        self.page = page
+        self.url = url
+        self.uses = 0
+        self.leased_at = None
+        # 租借期间最近一次活动的时间
+        self.active_at = None
+
+    def touch(self, *_args):
+        self.active_at = time.time()
+
+
+class BrowserDaemon:
+    """
+    所有 Playwright 调用都在 run() 所在的线程里执行；控制端口的请求通过队列交给它
+    """
+
+    def __init__(self, headless: bool = False, pool_size: int = BROWSER_POOL_SIZE,
+                 cdp_port: int = BROWSER_DAEMON_CDP_PORT, control_port: int = BROWSER_DAEMON_CONTROL_PORT,
+                 heap_limit_mb: float = PAGE_RECYCLE_HEAP_MB, user_data_dir: str = USER_DATA_DIR):
+        self.headless = headless
+        self.pool_size = pool_size
+        self.cdp_port = cdp_port
+        self.control_port = control_port
+        self.heap_limit = heap_limit_mb * 2**20
+        self.user_data_dir = user_data_dir
+        self.context = None
+        self.home = None
+        self.idle: list = []
+        self.leases: Dict[str, _Pooled] = {}
+        self.recycled = 0
+        self.served = 0
+        self._ids = itertools.count(1)
+        self._commands: "queue.Queue" = queue.Queue()
+        self._stop = threading.Event()
+        self.keeper = None
+        self.bridge = None
+
+    @property
+    def cdp_url(self) -> str:
+        return f"http://{DAEMON_HOST}:{self.cdp_port}"
+
+    # ---------- 页面池 ----------
+
+    def _new_page(self) -> _Pooled:
+        page = self.context.new_page()
+        url = POOL_URL.format(next(self._ids))
+        page.goto(url)
+        return _Pooled(page, url)
+
+    def _fill(self):
+        while len(self.idle) < self.pool_size:
+            self.idle.append(self._new_page())
+
+    def _heap(self, pooled: _Pooled) -> float:
+        try:
+            return float(pooled.page.evaluate(HEAP_SCRIPT) or 0)
+        except Exception:
+            return float("inf")
+
+    def _recycle(self, pooled: _Pooled):
+        """归还的页面：内存超限或用得太多就关闭重建，否则清空后放回池中"""
+        self._unwatch(pooled)
+        heap = self._heap(pooled)
+        if heap > self.heap_limit or pooled.uses >= PAGE_MAX_USES or pooled.page.is_closed():
+            try:
+                pooled.page.close()
+            except Exception:
+                pass
+            self.recycled += 1
+            log(f"[INFO] 页面已关闭重建（JS 堆 {heap / 2**20:.0f} MB，使用 {pooled.uses} 次）")
+            pooled = self._new_page()
+        else:
+            pooled.url = POOL_URL.format(next(self._ids))
+            pooled.page.goto(pooled.url)
+        pooled.leased_at = pooled.active_at = None
+        if len(self.idle) < self.pool_size:
+            self.idle.append(pooled)
+        else:
+            pooled.page.close()
+
+    # ---------- 控制命令（在 Playwright 线程中执行） ----------
+
+    def _lease(self, _body: Dict) -> Dict:
+        pooled = self.idle.pop(0) if self.idle else self._new_page()
+        pooled.uses += 1
+        pooled.leased_at = pooled.active_at = time.time()
+        # 客户端通过 CDP 操作页面时，这里同样收到页面的请求和导航事件，据此续租
+        pooled.page.on("request", pooled.touch)
+        pooled.page.on("framenavigated", pooled.touch)
+        lease_id = pooled.url.rsplit("-", 1)[-1]
+        self.leases[lease_id] = pooled
+        self.served += 1
+        return {"lease": lease_id, "url": pooled.url, "cdp": self.cdp_url}
+
+    def _release(self, body: Dict) -> Dict:
+        pooled = self.leases.pop(str(body.get("lease")), None)
+        if pooled is None:
+            return {"ok": False, "error": "unknown lease"}
+        self._recycle(pooled)
+        return {"ok": True}
+
+    def _renew(self, body: Dict) -> Dict:
+        """客户端长时间不操作页面（如等待扫码）时主动续租"""
+        pooled = self.leases.get(str(body.get("lease")))
+        if pooled is None:
+            return {"ok": False, "error": "unknown lease"}
+        pooled.touch()
+        return {"ok": True}
+
+    @staticmethod
+    def _unwatch(pooled: _Pooled):
+        for event in ("request", "framenavigated"):
+            try:
+                pooled.page.remove_listener(event, pooled.touch)
+            except Exception:
+                pass
+
+    def _status(self, _body: Dict) -> Dict:
+        return {"cdp": self.cdp_url, "idle": len(self.idle), "leased": len(self.leases),
+                "served": self.served, "recycled": self.recycled}
+
+    def _expire_leases(self):
+        """定期检查：收回超时的租借；检查页面 JS 堆，空闲页面超限直接重建，
+        租出的页面客户端正在使用，不能关闭，只提示（归还时 _recycle 会重建）"""
+        now = time.time()
+        for lease_id, pooled in list(self.leases.items()):
+            if now - pooled.active_at > LEASE_TTL:
+                log(f"[WARN] 租借 {lease_id} 超过 {LEASE_TTL // 60} 分钟没有活动，收回页面")
+                del self.leases[lease_id]
+                self._recycle(pooled)
+                continue
+            heap = self._heap(pooled)
+            # 读取失败（页面正在导航等）时为 inf，不提示
+            if self.heap_limit < heap < float("inf"):
+                log(f"[WARN] 租借 {lease_id} 的页面 JS 堆 {heap / 2**20:.0f} MB 超过上限，归还后重建")
+        for pooled in list(self.idle):
+            if self._heap(pooled) > self.heap_limit:
+                self.idle.remove(pooled)
+                self._recycle(pooled)
+
+    def call(self, name: str, body: Dict, timeout: float = 10) -> Dict:
+        """控制端口线程调用：把命令交给 Playwright 线程并等待结果"""
+        reply: "queue.Queue" = queue.Queue(maxsize=1)
+        self._commands.put((name, body, reply))
+        return reply.get(timeout=timeout)
+
+    # ---------- 运行 ----------
+
+    def _control_server(self) -> ThreadingHTTPServer:
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, code: int, data: Dict):
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self):
+                name = self.path.strip("/").split("?", 1)[0]
+                if name not in ("lease", "release", "renew", "status"):
+                    self._reply(404, {"error": "unknown command"})
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                    self._reply(200, daemon.call(name, body))
+                except Exception as e:
+                    self._reply(500, {"error": str(e)})
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((DAEMON_HOST, self.control_port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def _start_keeper(self):
+        """从保存的 Cookie 恢复登录，并在共享的 requests session 上保持会话"""
+        import requests
+
+        from config import HEADERS
+        from cookie_bridge import CookieBridge
+        from cookie_manager import load_cookies_full
+        from session_keeper import SessionKeeper
+
+        saved = load_cookies_full()
+        if saved:
+            self.context.add_cookies(saved)
+            log(f"[INFO] 已注入 {len(saved)} 个保存的 Cookie")
+        session = requests.Session()
+        session.headers.update(HEADERS)
+        session.verify = False
+        self.bridge = CookieBridge(self.context, session).attach()
+        self.keeper = SessionKeeper(session, bridge=self.bridge).start()
+
+    def _wait_tick(self):
+        """处理 Playwright 事件最多 TICK_MS 毫秒；控制命令到达时立即返回，租借不用等满一个周期"""
+        deadline = time.monotonic() + TICK_MS / 1000
+        while self._commands.empty() and time.monotonic() < deadline:
+            self.home.wait_for_timeout(COMMAND_POLL_MS)
+
+    def run(self):
+        from playwright.sync_api import sync_playwright
+
+        handlers = {"lease": self._lease, "release": self._release, "renew": self._renew, "status": self._status}
+        with sync_playwright() as p:
+            options = launch_options(self.headless, [f"--remote-debugging-port={self.cdp_port}"])
+            self.context = p.chromium.launch_persistent_context(self.user_data_dir, **options, **CONTEXT_OPTIONS)
+            self.context.add_init_script(STEALTH_SCRIPT)
+            # 主循环用这个页面处理 Playwright 事件，不出租
+            self.home = self.context.pages[0] if self.context.pages else self.context.new_page()
+            self._start_keeper()
+            self._fill()
+            server = self._control_server()
+            log(f"[OK] 浏览器常驻进程已启动：CDP {self.cdp_url}，控制端口 {DAEMON_URL}，空白页 {len(self.idle)} 个")
+            last_expire = time.time()
+            try:
+                while not self._stop.is_set():
+                    self._wait_tick()
+                    self.bridge.flush()
+                    while True:
+                        try:
+                            name, body, reply = self._commands.get_nowait()
+                        except queue.Empty:
+                            break
+                        try:
+                            reply.put(handlers[name](body))
+                        except Exception as e:
+                            reply.put({"error": str(e)})
+                    self._fill()
+                    if time.time() - last_expire > MAINTAIN_INTERVAL:
+                        self._expire_leases()
+                        last_expire = time.time()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.shutdown()
+                self.keeper.stop()
+                self.context.close()
+                log("[INFO] 浏览器常驻进程已退出")
+
+    def stop(self):
+        self._stop.set()
+
+
+# ---------- 客户端 ----------
+
+def _control(path: str, body: Optional[Dict] = None, url: str = DAEMON_URL, timeout: float = 2.0) -> Dict:
+    data = json.dumps(body or {}).encode("utf-8")
+    req = urllib.request.Request(f"{url}/{path}", data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+
+class PageLease:
+    """租到的页面；用完调用 release()（断开 CDP 连接时也会自动归还）"""
+
+    def __init__(self, lease_id: str, browser, context, page, url: str = DAEMON_URL):
+        self.lease_id = lease_id
+        self.browser = browser
+        self.context = context
+        self.page = page
+        self.url = url
+        self.released = False
+
+    def release(self):
+        """归还页面（阻塞的控制端口请求；事件循环里用 release_async）"""
+        if self.released:
+            return
+        self.released = True
+        try:
+            _control("release", {"lease": self.lease_id}, self.url)
+        except (OSError, ValueError):
+            pass
+
+    async def release_async(self):
+        await asyncio.to_thread(self.release)
+
+    def renew(self) -> bool:
+        """续租（页面有请求或导航时守护进程会自动续租，长时间不操作页面时调用）"""
+        try:
+            return bool(_control("renew", {"lease": self.lease_id}, self.url).get("ok"))
+        except (OSError, ValueError):
+            return False
+
+    def close(self):
+        """归还页面并断开 CDP 连接（不会关闭常驻浏览器）"""
+        self.release()
+        try:
+            self.browser.close()
+        except Exception:
+            pass
+
+
+def lease_page(p, url: str = DAEMON_URL) -> Optional[PageLease]:
+    """
+    从常驻进程租一个页面；守护进程未运行或租借失败时返回 None
+    p 为 sync_playwright() 返回的 Playwright 对象
+    """
+    try:
+        info = _control("lease", url=url, timeout=1.0)
+    except (OSError, ValueError):
+        return None
+    if "lease" not in info:
+        return None
+    try:
+        browser = p.chromium.connect_over_cdp(info["cdp"])
+        context = browser.contexts[0]
+        page = next((pg for pg in context.pages if pg.url == info["url"]), None)
+    except Exception as e:
+        log(f"[WARN] 连接浏览器常驻进程失败: {str(e)}")
+        _control("release", {"lease": info["lease"]}, url)
+        return None
+    lease = PageLease(info["lease"], browser, context, page, url)
+    if page is None:
+        log("[WARN] 常驻浏览器中没有找到租到的页面")
+        lease.close()
+        return None
+    # 流程里各处的 browser.close() 只是断开连接，这时把页面还回去
+    browser.on("disconnected", lambda _: lease.release())
+    return lease
+
+
+async def lease_page_async(p, url: str = DAEMON_URL) -> Optional[PageLease]:
+    """lease_page 的 async_playwright 版本；PageLease.close() 之外用 await lease.browser.close() 断开即可"""
+    try:
+        info = await asyncio.to_thread(_control, "lease", None, url, 1.0)
+    except (OSError, ValueError):
+        return None
+    if "lease" not in info:
+        return None
+    try:
+        browser = await p.chromium.connect_over_cdp(info["cdp"])
+    except Exception as e:
+        log(f"[WARN] 连接浏览器常驻进程失败: {str(e)}")
+        await asyncio.to_thread(_control, "release", {"lease": info["lease"]}, url)
+        return None
+    context = browser.contexts[0]
+    page = next((pg for pg in context.pages if pg.url == info["url"]), None)
+    lease = PageLease(info["lease"], browser, context, page, url)
+    if page is None:
+        log("[WARN] 常驻浏览器中没有找到租到的页面")
+        await lease.release_async()
+        await browser.close()
+        return None
+
+    async def on_disconnected(_):
+        # 归还是阻塞的 HTTP 请求，放到线程池，不占住事件循环
+        await lease.release_async()
+
+    browser.on("disconnected", on_disconnected)
+    return lease
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="浏览器常驻进程（CDP + 页面池）")
+    parser.add_argument("--headless", action="store_true")
+    parser.add_argument("--pool", type=int, default=BROWSER_POOL_SIZE, help="预先打开的空白页数量")
+    parser.add_argument("--heap-limit", type=float, default=PAGE_RECYCLE_HEAP_MB, help="页面 JS 堆上限（MB）")
+    args = parser.parse_args(argv)
+    BrowserDaemon(headless=args.headless, pool_size=args.pool, heap_limit_mb=args.heap_limit).run()
+
+
+if __name__ == "__main__":
+    main()
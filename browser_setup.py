@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Playwright 浏览器的启动参数、上下文配置和反检测脚本
+playwright_flow 与浏览器常驻进程（browser_daemon）共用，保证两种方式打开的页面环境一致
+"""
+import os
+
+# Playwright 浏览器安装路径（项目目录下）
+BROWSER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pw-browsers")
+os.environ["PLAYWRIGHT_BROWSERS_PATH"] = BROWSER_PATH
+
+# 启动参数，添加反检测措施
+LAUNCH_ARGS = [
+    "--disable-blink-features=AutomationControlled",  # 隐藏自动化特征
+    "--disable-dev-shm-usage",
+    "--no-sandbox",
+    "--disable-setuid-sandbox",
+    "--disable-web-security",
+    "--disable-features=IsolateOrigins,site-per-process",
+    "--disable-site-isolation-trials",
+    "--disable-infobars",  # 隐藏"Chrome正在受到自动测试软件的控制"提示
+    "--window-size=1920,1080",
+]
+
+# 浏览器上下文配置，模拟真实浏览器环境
+CONTEXT_OPTIONS = {
+    "locale": "zh-CN",
+    "timezone_id": "Asia/Shanghai",
+    "viewport": {"width": 1920, "height": 1080},
+    "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    # 添加额外的 HTTP headers
+    "extra_http_headers": {
+        "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+        "Accept-Encoding": "gzip, deflate, br",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
+        "Connection": "keep-alive",
+        "Upgrade-Insecure-Requests": "1",
+        "Sec-Fetch-Dest": "document",
+        "Sec-Fetch-Mode": "navigate",
+        "Sec-Fetch-Site": "none",
+        "Sec-Fetch-User": "?1",
+        "Cache-Control": "max-age=0",
+    },
+    # 设置地理位置（可选）
+    "geolocation": {"longitude": 116.3974, "latitude": 39.9093},  # 北京
+    "permissions": ["geolocation"],
+}
+
+# 注入脚本隐藏 webdriver 特征
+STEALTH_SCRIPT = """
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => undefined
+    });
+
+    // 覆盖 plugins
+    Object.defineProperty(navigator, 'plugins', {
+        get: () => [1, 2, 3, 4, 5]
+    });
+
+    // 覆盖 languages
+    Object.defineProperty(navigator, 'languages', {
+        get: () => ['zh-CN', 'zh', 'en']
+    });
+
+    // 覆盖 permissions
+    const originalQuery = window.navigator.permissions.query;
+    window.navigator.permissions.query = (parameters) => (
+        parameters.name === 'notifications' ?
+            Promise.resolve({ state: Notification.permission }) :
+            originalQuery(parameters)
+    );
+
+    // Chrome 特征
+    window.chrome = {
+        runtime: {}
+    };
+"""
+
+
+def find_browser_exe():
+    """使用已安装的浏览器（优先使用 chromium-1200，如果没有则使用 chromium-1187），都没有时返回 None"""
+    for version in ("chromium-1200", "chromium-1187"):
+        path = os.path.join(BROWSER_PATH, version, "chrome-win", "chrome.exe")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def launch_options(headless: bool = False, extra_args=()) -> dict:
+    options = {"headless": headless, "args": LAUNCH_ARGS + list(extra_args)}
+    exe = find_browser_exe()
+    if exe:
+        options["executable_path"] = exe
+    return options
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+网络捕获的落盘：每条请求/响应记录写成一行 JSON（NDJSON），压缩后追加到分段文件
+- 捕获回调只把记录放进队列，序列化、截断响应体、压缩、写文件都在后台线程完成
+- 每批记录压缩成一个独立的 gzip member / zstd frame 并立即 flush，进程崩溃最多丢失最后一批
+- 单个分段超过 CAPTURE_ROTATE_BYTES 后换下一个分段：
+  network_capture_YYYYMMDD_HHMMSS.000.ndjson.gz、.001.ndjson.gz ...
+- 响应体按 Content-Type 截断（CAPTURE_BODY_LIMITS）
+读取用 read_capture()，network_analyzer.load_network_log 可直接打开这些文件
+"""
+import glob
+import gzip
+import json
+import os
+import queue
+import re
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from config import CAPTURE_BODY_LIMITS, CAPTURE_COMPRESSION, CAPTURE_ROTATE_BYTES
+
+# zstandard 为可选依赖，未安装时使用 gzip
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+CAPTURE_PREFIX = "network_capture_"
+SUFFIXES = {"zstd": ".ndjson.zst", "gzip": ".ndjson.gz"}
+# network_capture_YYYYMMDD_HHMMSS.NNN.ndjson.gz|zst
+SEGMENT_RE = re.compile(r"^(network_capture_\d{8}_\d{6})\.(\d{3})\.ndjson\.(gz|zst)$")
+
+# 后台线程每批最多写入的记录数 / 等待凑批的时间（秒）
+BATCH_SIZE = 64
+BATCH_WAIT = 0.5
+
+# 读取时表示文件末尾不完整的异常
+READ_ERRORS = (EOFError, OSError) + ((zstandard.ZstdError,) if ZSTD_AVAILABLE else ())
+
+_STOP = object()
+
+
+def is_capture_file(path: str) -> bool:
+    return SEGMENT_RE.match(os.path.basename(path)) is not None
+
+
+def body_limit(content_type: str, limits: Dict[str, int] = CAPTURE_BODY_LIMITS) -> int:
+    """按 Content-Type 取响应体上限（字符数），没有配置的类型使用 "*" """
+    content_type = (content_type or "").split(";", 1)[0].strip().lower()
+    return limits.get(content_type, limits.get("*", 0))
+
+
+def cap_body(record: Dict, limits: Dict[str, int] = CAPTURE_BODY_LIMITS) -> Dict:
+    """返回响应体按上限截断后的记录（超限时 body 变为截断的文本，并记下原长度）"""
+    resp = record.get("response")
+    if not resp or "body" not in resp:
+        return record
+    body = resp["body"]
+    text = body if isinstance(body, str) else json.dumps(body, ensure_ascii=False, separators=(",", ":"))
+    limit = body_limit(resp.get("content_type", ""), limits)
+    if len(text) <= limit:
+        return record
+    resp = dict(resp, body=text[:limit], body_truncated=len(text))
+    return dict(record, response=resp)
+
+
+class CaptureSink:
+    """
+    后台写入压缩 NDJSON 分段文件
+    write() 可在任意线程调用，不会阻塞；close() 等待队列写完
+    """
+
+    def __init__(self, base: Optional[str] = None, compression: str = CAPTURE_COMPRESSION,
+                 rotate_bytes: int = CAPTURE_ROTATE_BYTES, body_limits: Dict[str, int] = CAPTURE_BODY_LIMITS,
+                 directory: str = "."):
+        if compression == "zstd" and not ZSTD_AVAILABLE:
+            print("[WARN] zstandard 未安装，网络捕获改用 gzip 压缩")
+            compression = "gzip"
+        if compression not in SUFFIXES:
+            raise ValueError(f"不支持的压缩方式: {compression}")
+        self.compression = compression
+        self.rotate_bytes = rotate_bytes
+        self.body_limits = body_limits
+        self.base = os.path.join(directory, base or f"{CAPTURE_PREFIX}{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        self.segment = -1
+        self.paths: List[str] = []
+        self.written = 0
+        self.dropped = 0
+        self._file = None
+        self._compressor = zstandard.ZstdCompressor(level=3) if compression == "zstd" else None
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def path(self) -> Optional[str]:
+        """第一个分段的路径（load_network_log 打开它时会读取同一次捕获的全部分段）"""
+        return self.paths[0] if self.paths else None
+
+    def write(self, record: Dict):
+        self._queue.put(record)
+
+    __call__ = write
+
+    def close(self, timeout: float = 10):
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+
+    # ---------- 后台线程 ----------
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < BATCH_SIZE:
+                    batch.append(self._queue.get(timeout=BATCH_WAIT))
+            except queue.Empty:
+                pass
+            if _STOP in batch:
+                stopping = True
+                batch = [r for r in batch if r is not _STOP]
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    self.dropped += len(batch)
+                    print(f"[WARN] 写入网络捕获失败: {str(e)}")
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _encode(self, batch: List[Dict]) -> bytes:
+        lines = []
+        for record in batch:
+            record = cap_body(record, self.body_limits)
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def _compress(self, data: bytes) -> bytes:
+        if self._compressor is not None:
+            return self._compressor.compress(data)
+        return gzip.compress(data, compresslevel=6)
+
+    def _write_batch(self, batch: List[Dict]):
+        frame = self._compress(self._encode(batch))
+        if self._file is None or self._file.tell() + len(frame) > self.rotate_bytes:
+            self._rotate()
+        self._file.write(frame)
+        self._file.flush()
+        self.written += len(batch)
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        self.segment += 1
+        path = f"{self.base}.{self.segment:03d}{SUFFIXES[self.compression]}"
+        self._file = open(path, "ab")
+        self.paths.append(path)
+
+
+# ---------- 读取 ----------
+
+def capture_segments(path: str) -> List[str]:
+    """同一次捕获的全部分段（按分段序号排列）；path 可以是任一分段"""
+    m = SEGMENT_RE.match(os.path.basename(path))
+    if m is None:
+        return [path]
+    directory = os.path.dirname(path)
+    pattern = os.path.join(directory, f"{glob.escape(m.group(1))}.[0-9][0-9][0-9].ndjson.{m.group(3)}")
+    return sorted(glob.glob(pattern))
+
+
+def _open_segment(path: str):
+    if path.endswith(".zst"):
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("读取 .zst 捕获文件需要安装 zstandard")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+    return gzip.open(path, "rb")
+
+
+def iter_segment(path: str) -> Iterator[Dict]:
+    """逐条读取一个分段；末尾不完整的一批（写入时崩溃）会被忽略"""
+    buf = b""
+    with _open_segment(path) as f:
+        try:
+            while True:
+                # read1：有多少解压出多少，末尾不完整时前面完整的批次已经交出
+                chunk = f.read1(1 << 16)
+                if not chunk:
+                    break
+                buf += chunk
+                *lines, buf = buf.split(b"\n")
+                for line in lines:
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError as e:
+                        print(f"[WARN] 捕获文件 {path} 中有无法解析的记录，已跳过: {str(e)}")
+                        continue
+                    yield record
+        except READ_ERRORS as e:
+            print(f"[WARN] 捕获文件 {path} 末尾不完整: {str(e)}")
+
+
+def read_capture(path: str) -> Iterator[Dict]:
+    """按顺序读取同一次捕获全部分段中的记录"""
+    for segment in capture_segments(path):
+        yield from iter_segment(segment)
@@ -2,6 +2,7 @@
 """
 12306抢票系统配置文件
 """
+import os
 
 # 用户登录信息
 USERNAME = "egoistsaber"
@@ -17,8 +18,9 @@ RAIL_DEVICEID = ""
 RAIL_EXPIRATION = ""
 
 # 12306网站配置
-BASE_URL = "https://kyfw.12306.cn"
-LOGIN_URL = "https://kyfw.12306.cn/otn/login/userLogin"
+# 可用环境变量 KYFW_BASE_URL 指向本地回放服务器（replay_server.py），离线做性能测试，如 http://127.0.0.1:8306
+BASE_URL = os.environ.get("KYFW_BASE_URL", "https://kyfw.12306.cn").rstrip("/")
+LOGIN_URL = f"{BASE_URL}/otn/login/userLogin"
 
 # Cookie信息（如果已从浏览器获取，可直接填入）
 INITIAL_COOKIES = {
@@ -51,6 +53,44 @@ DEFAULT_PASSENGER = "刘锋"
 DEFAULT_START_TIME = "07:00"
 DEFAULT_END_TIME = "20:00"
 
+# 登录状态确认的有效期（秒）：最近一次确认（任一需要登录的接口正常返回）在此时间内时，不再单独请求 checkUser
+SESSION_CHECK_TTL = 300
+# 会话保持心跳的最长间隔（秒）：12306 约 30 分钟无请求会掉线；实际间隔还会参考 Cookie 过期时间
+KEEPALIVE_INTERVAL = 1200
+
+# 提交排队确认后是否轮询 queryOrderWaitTime 直到拿到 orderId（并输出查询->orderId 耗时分解）
+POLL_ORDER_QUEUE = False
+
+# 浏览器常驻进程（browser_daemon.py）：CDP 端口、租借页面的控制端口、预先打开的空白页数量，
+# 以及页面 JS 堆超过多少 MB 时归还后直接关闭重建
+BROWSER_DAEMON_CDP_PORT = 9222
+BROWSER_DAEMON_CONTROL_PORT = 9223
+BROWSER_POOL_SIZE = 2
+PAGE_RECYCLE_HEAP_MB = 256
+
+# 页面资源拦截（resource_blocker.py）：拦截的资源类型、是否拦截第三方域名（主机不以下列后缀结尾），
+# 以及估算节省流量时各类型单个请求的大小（字节），"*" 为其它类型
+BLOCK_RESOURCE_TYPES = ("image", "media", "font", "texttrack", "manifest")
+BLOCK_THIRD_PARTY = True
+FIRST_PARTY_HOST_SUFFIXES = ("12306.cn",)
+BLOCK_ESTIMATED_BYTES = {
+    "image": 15 * 1024,
+    "media": 200 * 1024,
+    "font": 60 * 1024,
+    "script": 40 * 1024,
+    "*": 5 * 1024,
+}
+
+# 网络捕获落盘：压缩方式（"gzip"；安装 zstandard 后可改为 "zstd"，未安装时自动改用 "gzip"）、单个分段文件的大小上限（字节）
+CAPTURE_COMPRESSION = "gzip"
+CAPTURE_ROTATE_BYTES = 8 * 1024 * 1024
+# 响应体按 Content-Type 保留的最大字符数，"*" 为其它类型
+CAPTURE_BODY_LIMITS = {
+    "application/json": 64 * 1024,
+    "text/html": 2000,
+    "*": 1000,
+}
+
 # 请求头
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Playwright 浏览器上下文与 requests session 之间的 Cookie 实时同步（内存中，不经过 cookies.json）
+- 浏览器收到带 Set-Cookie 的响应后，把变化同步到 requests session
+- requests 收到带 Set-Cookie 的响应后，把变化同步到浏览器
+同步时保留域名、路径、过期时间、secure/httpOnly，不再按 Cookie 名称猜域名
+CookieBridge 用于 sync Playwright（浏览器常驻进程），AsyncCookieBridge 用于 async Playwright（playwright_flow）
+"""
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.cookies import create_cookie
+
+# 只同步这些域名下的 Cookie
+COOKIE_DOMAIN_SUFFIX = "12306.cn"
+
+
+def _key(domain: str, name: str, path: str) -> Tuple[str, str, str]:
+    return (domain or "", name or "", path or "/")
+
+
+def pw_to_requests_cookie(c: Dict):
+    """Playwright Cookie -> http.cookiejar.Cookie"""
+    expires = c.get("expires")
+    rest = {"HttpOnly": None} if c.get("httpOnly") else {}
+    if c.get("sameSite"):
+        rest["SameSite"] = c["sameSite"]
+    return create_cookie(
+        c.get("name", ""),
+        c.get("value", ""),
+        domain=c.get("domain", ""),
+        path=c.get("path") or "/",
+        # Playwright 用 -1 表示会话 Cookie
+        expires=int(expires) if expires is not None and expires >= 0 else None,
+        secure=bool(c.get("secure")),
+        rest=rest,
+    )
+
+
+def requests_to_pw_cookie(c) -> Dict:
+    """http.cookiejar.Cookie -> Playwright add_cookies 的格式"""
+    cookie = {
+        "name": c.name,
+        "value": c.value or "",
+        "domain": c.domain,
+        "path": c.path or "/",
+        "secure": bool(c.secure),
+        "httpOnly": c.has_nonstandard_attr("HttpOnly"),
+    }
+    if c.expires:
+        cookie["expires"] = float(c.expires)
+    same_site = c.get_nonstandard_attr("SameSite")
+    if same_site in ("Strict", "Lax", "None"):
+        cookie["sameSite"] = same_site
+    return cookie
+
+
+class CookieBridge:
+    """
+    绑定一个 Playwright BrowserContext 和一个 requests.Session，双向同步 Cookie
+    sync Playwright 对象只能在创建它的线程里调用：其它线程（如会话保持线程）里的 requests
+    响应只记下待同步，由浏览器线程在下一次 flush()/pull() 时写入浏览器
+    """
+
+    def __init__(self, context, session: requests.Session):
+        self.context = context
+        self.session = session
+        self._owner = threading.get_ident()
+        # 上次同步后的状态：(domain, name, path) -> (value, expires)
+        self._synced: Dict[Tuple[str, str, str], Tuple[str, Optional[float]]] = {}
+        self._pending_push = False
+        self._lock = threading.Lock()
+        self.pulls = 0
+        self.pushes = 0
+
+    # ---------- 挂载 ----------
+
+    def attach(self) -> "CookieBridge":
+        """注册浏览器响应事件与 requests 响应 hook，并先做一次浏览器 -> requests 同步"""
+        self.context.on("response", self._on_browser_response)
+        hooks = self.session.hooks.setdefault("response", [])
+        if self._on_requests_response not in hooks:
+            hooks.append(self._on_requests_response)
+        self.pull()
+        return self
+
+    def _on_browser_response(self, response):
+        self.flush()
+        if not self._wanted(urlsplit(response.url).hostname):
+            return
+        if response.request.resource_type not in ("document", "xhr", "fetch"):
+            return
+        try:
+            # headers 属性不包含 Set-Cookie，需要单独取
+            if response.header_value("set-cookie"):
+                self.pull()
+        except Exception:
+            pass
+
+    def _on_requests_response(self, resp, *args, **kwargs):
+        if "Set-Cookie" in resp.headers:
+            self.schedule_push()
+        return resp
+
+    def schedule_push(self):
+        """requests 侧 Cookie 有变化：在浏览器线程里立即写入，其它线程里等下一次 flush"""
+        if threading.get_ident() == self._owner:
+            self.push()
+        else:
+            self._pending_push = True
+
+    # ---------- 同步 ----------
+
+    @staticmethod
+    def _wanted(domain: str) -> bool:
+        return (domain or "").lstrip(".").endswith(COOKIE_DOMAIN_SUFFIX)
+
+    def pull(self) -> int:
+        """浏览器 -> requests，返回变化的 Cookie 数"""
+        self.flush()
+        return self._apply_pull(self.context.cookies())
+
+    def _apply_pull(self, browser_cookies: List[Dict]) -> int:
+        cookies = [c for c in browser_cookies if self._wanted(c.get("domain"))]
+        changed = 0
+        seen = set()
+        with self._lock:
+            for c in cookies:
+                key = _key(c.get("domain"), c.get("name"), c.get("path"))
+                seen.add(key)
+                state = (c.get("value", ""), c.get("expires"))
+                if self._synced.get(key) == state:
+                    continue
+                self.session.cookies.set_cookie(pw_to_requests_cookie(c))
+                self._synced[key] = state
+                changed += 1
+            # 浏览器里已删除（或过期）的 Cookie，requests 里同样删除
+            for key in [k for k in self._synced if k not in seen]:
+                try:
+                    self.session.cookies.clear(key[0], key[2], key[1])
+                except KeyError:
+                    pass
+                del self._synced[key]
+                changed += 1
+        if changed:
+            self.pulls += 1
+        return changed
+
+    def push(self) -> int:
+        """requests -> 浏览器，返回变化的 Cookie 数；必须在浏览器线程调用"""
+        changed = self._collect_push()
+        if changed:
+            self.context.add_cookies(changed)
+            self.pushes += 1
+        return len(changed)
+
+    def _collect_push(self) -> List[Dict]:
+        """requests 侧相对上次同步有变化的 Cookie（Playwright 格式），并记为已同步"""
+        self._pending_push = False
+        now = time.time()
+        changed: List[Dict] = []
+        with self._lock:
+            for c in self.session.cookies:
+                if not self._wanted(c.domain) or (c.expires and c.expires < now):
+                    continue
+                key = _key(c.domain, c.name, c.path)
+                state = (c.value or "", float(c.expires) if c.expires else -1)
+                old = self._synced.get(key)
+                if old is not None and old[0] == state[0]:
+                    continue
+                changed.append(requests_to_pw_cookie(c))
+                self._synced[key] = state
+        return changed
+
+    def flush(self):
+        """浏览器线程调用：把其它线程里 requests 收到的 Cookie 变化写入浏览器"""
+        if self._pending_push and threading.get_ident() == self._owner:
+            self.push()
+
+
+class AsyncCookieBridge(CookieBridge):
+    """
+    async Playwright 版本：必须在事件循环里创建，浏览器操作都是协程
+    requests 响应可能在线程池里（如会话保持的 asyncio.to_thread）收到，变化通过 call_soon_threadsafe
+    交给事件循环立即写入浏览器，不用等下一次浏览器响应
+    """
+
+    def __init__(self, context, session: requests.Session):
+        super().__init__(context, session)
+        self._loop = asyncio.get_running_loop()
+        self._tasks = set()
+
+    async def attach(self) -> "AsyncCookieBridge":
+        self.context.on("response", self._on_browser_response)
+        hooks = self.session.hooks.setdefault("response", [])
+        if self._on_requests_response not in hooks:
+            hooks.append(self._on_requests_response)
+        await self.pull()
+        return self
+
+    async def _on_browser_response(self, response):
+        await self.flush()
+        if not self._wanted(urlsplit(response.url).hostname):
+            return
+        if response.request.resource_type not in ("document", "xhr", "fetch"):
+            return
+        try:
+            if await response.header_value("set-cookie"):
+                await self.pull()
+        except Exception:
+            pass
+
+    def schedule_push(self):
+        self._pending_push = True
+        if threading.get_ident() == self._owner:
+            self._spawn()
+        else:
+            self._loop.call_soon_threadsafe(self._spawn)
+
+    def _spawn(self):
+        task = self._loop.create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def pull(self) -> int:
+        await self.flush()
+        return self._apply_pull(await self.context.cookies())
+
+    async def push(self) -> int:
+        changed = self._collect_push()
+        if changed:
+            await self.context.add_cookies(changed)
+            self.pushes += 1
+        return len(changed)
+
+    async def flush(self):
+        if self._pending_push:
+            await self.push()
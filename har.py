@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+HAR 1.2 与本项目捕获记录（network_requests_*.json / network_capture_*.ndjson.*）之间的转换
+- 导出：逐条写出 entries，不把整个会话读进内存
+- 导入：浏览器 DevTools 导出的 .har 可直接交给 network_analyzer.load_network_log，
+  按 entries 建索引（与捕获日志相同的旁路 .idx），读取时转换为捕获记录格式
+用法：
+  python har.py export [捕获文件] [输出.har]   不指定捕获文件时使用最新的捕获
+  python har.py import 录制.har                建立索引并输出接口统计
+"""
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+HAR_VERSION = "1.2"
+HAR_CREATOR = {"name": "12306-ticket", "version": "1.0"}
+HTTP_VERSION = "HTTP/1.1"
+
+
+def _log(msg):
+    try:
+        print(msg)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((str(msg) + "\n").encode("utf-8", errors="backslashreplace"))
+        sys.stdout.buffer.flush()
+
+
+def _har_headers(headers: Optional[Dict[str, str]]) -> List[Dict[str, str]]:
+    return [{"name": k, "value": str(v)} for k, v in (headers or {}).items()]
+
+
+def _iso_time(ts: Optional[float]) -> str:
+    ts = ts if ts is not None else 0.0
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def _parse_time(value: str) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+# ---------- 捕获记录 -> HAR entry ----------
+
+def record_to_entry(record: Dict[str, Any]) -> Dict[str, Any]:
+    """一条捕获记录 -> HAR entry（捕获中没有的字段按 HAR 规范填 -1 / 空）"""
+    url = record.get("url", "")
+    headers = record.get("headers") or {}
+    request = {
+        "method": record.get("method", "GET"),
+        "url": url,
+        "httpVersion": HTTP_VERSION,
+        "cookies": [],
+        "headers": _har_headers(headers),
+        "queryString": [{"name": k, "value": v} for k, v in parse_qsl(urlsplit(url).query, keep_blank_values=True)],
+        "headersSize": -1,
+        "bodySize": -1,
+    }
+    post_data = record.get("post_data")
+    if post_data is not None:
+        mime = next((v for k, v in headers.items() if k.lower() == "content-type"), "")
+        request["postData"] = {"mimeType": mime, "text": post_data}
+        request["bodySize"] = len(post_data.encode("utf-8"))
+
+    resp = record.get("response") or {}
+    resp_headers = resp.get("headers") or {}
+    body = resp.get("body")
+    content = {"size": -1, "mimeType": resp.get("content_type", "")}
+    if body is not None:
+        text = body if isinstance(body, str) else json.dumps(body, ensure_ascii=False, separators=(",", ":"))
+        content["text"] = text
+        content["size"] = resp.get("body_truncated") or len(text.encode("utf-8"))
+    if resp.get("error") or record.get("failure"):
+        content["comment"] = resp.get("error") or record.get("failure")
+    response = {
+        "status": resp.get("status", 0),
+        "statusText": "",
+        "httpVersion": HTTP_VERSION,
+        "cookies": [],
+        "headers": _har_headers(resp_headers),
+        "content": content,
+        "redirectURL": resp_headers.get("location", ""),
+        "headersSize": -1,
+        "bodySize": -1,
+    }
+    elapsed = record.get("elapsed")
+    total = round(elapsed * 1000, 3) if elapsed is not None else -1
+    return {
+        "startedDateTime": _iso_time(record.get("timestamp")),
+        "time": total,
+        "request": request,
+        "response": response,
+        "cache": {},
+        "timings": {"send": 0, "wait": max(total, 0), "receive": 0},
+    }
+
+
+def export_har(records: Iterable[Dict[str, Any]], out_path: str) -> int:
+    """逐条写出 HAR 文件，返回写出的 entry 数"""
+    count = 0
+    with open(out_path, "w", encoding="utf-8") as f:
+        head = json.dumps({"version": HAR_VERSION, "creator": HAR_CREATOR, "pages": []}, ensure_ascii=False)
+        # 去掉末尾的 }，接着写 entries 数组
+        f.write('{"log":' + head[:-1] + ',"entries":[\n')
+        for record in records:
+            if count:
+                f.write(",\n")
+            f.write(json.dumps(record_to_entry(record), ensure_ascii=False, separators=(",", ":")))
+            count += 1
+        f.write("\n]}}\n")
+    return count
+
+
+# ---------- HAR entry -> 捕获记录 ----------
+
+def entry_to_record(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """HAR entry -> 捕获记录格式（请求头名转小写，去掉 HTTP/2 伪头）"""
+    req = entry.get("request") or {}
+    resp = entry.get("response") or {}
+    headers = {h["name"].lower(): h["value"] for h in req.get("headers", ()) if not h["name"].startswith(":")}
+    resp_headers = {h["name"].lower(): h["value"] for h in resp.get("headers", ()) if not h["name"].startswith(":")}
+    post = req.get("postData")
+    record = {
+        "url": req.get("url", ""),
+        "method": req.get("method", ""),
+        "headers": headers,
+        "post_data": post.get("text") if post else None,
+        "timestamp": _parse_time(entry.get("startedDateTime", "")),
+    }
+    if entry.get("time") is not None and entry["time"] >= 0:
+        record["elapsed"] = entry["time"] / 1000
+    if not resp.get("status"):
+        # 浏览器里失败的请求（status 0）没有响应
+        return record
+    content = resp.get("content") or {}
+    content_type = content.get("mimeType") or resp_headers.get("content-type", "")
+    response = {"status": resp["status"], "headers": resp_headers, "content_type": content_type}
+    text = content.get("text")
+    if text is not None and content.get("encoding") != "base64":
+        body = text
+        if "json" in content_type:
+            try:
+                body = json.loads(text)
+            except ValueError:
+                pass
+        response["body"] = body
+    record["response"] = response
+    return record
+
+
+def main(argv: List[str] = None):
+    from network_analyzer import find_latest_network_log, iter_log_records, load_network_log
+
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in ("export", "import"):
+        _log(__doc__)
+        return
+    if argv[0] == "export":
+        src = argv[1] if len(argv) > 1 else find_latest_network_log()
+        if src is None:
+            _log("[FAIL] 没有找到捕获日志")
+            return
+        name = os.path.basename(src).split(".", 1)[0]
+        out = argv[2] if len(argv) > 2 else os.path.join(os.path.dirname(src), f"{name}.har")
+        count = export_har(iter_log_records(src), out)
+        _log(f"[OK] 已导出 {count} 条请求: {out}")
+        return
+    if len(argv) < 2:
+        _log("[FAIL] 请指定 .har 文件")
+        return
+    log = load_network_log(argv[1])
+    if log is None:
+        return
+    _log(f"[OK] 已建立索引: {argv[1]}（{len(log)} 条请求）")
+    for endpoint, indexes in sorted(log.by_endpoint.items(), key=lambda kv: -len(kv[1]))[:20]:
+        _log(f"  {endpoint:<32} {len(indexes):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP 请求耗时统计：挂在 requests.Session 上，按接口记录
+- 连接是复用还是新建（新建连接的耗时包含 TCP + TLS 握手）
+- 首字节时间（发出请求到收到响应头）
+- 总耗时（含响应体下载）与响应字节数
+数据保存在内存中的 HDR 风格直方图里，运行结束时可导出 JSON，并按 OrderFlow 步骤汇总
+"""
+import json
+import sys
+import threading
+import time
+import weakref
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 接口 -> OrderFlow 步骤（用于汇总表）
+STEP_OF_ENDPOINT = {
+    "queryZ": "query",
+    "queryG": "query",
+    "submitOrderRequest": "submit",
+    "initDc": "init_dc",
+    "getPassengerDTOs": "passenger",
+    "checkOrderInfo": "check_order",
+    "getQueueCount": "queue_count",
+    "confirmSingleForQueue": "confirm",
+    "queryOrderWaitTime": "queue_wait",
+    "checkUser": "login_check",
+}
+
+
+class LatencyHistogram:
+    """
+    HDR 风格的对数-线性直方图（单位：微秒）
+    小于 2**sub_bits 的值精确记录，更大的值保留最高 sub_bits 位，相对误差约 1/2**(sub_bits-1)
+    """
+
+    def __init__(self, sub_bits: int = 7):
+        self.sub_bits = sub_bits
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _bucket(self, v: int) -> int:
+        shift = v.bit_length() - self.sub_bits
+        if shift <= 0:
+            return v
+        return (v >> shift) << shift
+
+    def record(self, seconds: float):
+        v = max(0, int(seconds * 1_000_000))
+        b = self._bucket(v)
+        self.counts[b] = self.counts.get(b, 0) + 1
+        self.count += 1
+        self.total += v
+        self.min = v if self.min is None else min(self.min, v)
+        self.max = v if self.max is None else max(self.max, v)
+
+    def percentile(self, p: float) -> int:
+        """返回第 p 百分位（微秒）"""
+        if not self.count:
+            return 0
+        target = max(1, int(round(self.count * p / 100.0)))
+        seen = 0
+        for b in sorted(self.counts):
+            seen += self.counts[b]
+            if seen >= target:
+                return min(b, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "min_us": self.min or 0,
+            "max_us": self.max or 0,
+            "mean_us": int(self.total / self.count) if self.count else 0,
+            "p50_us": self.percentile(50),
+            "p90_us": self.percentile(90),
+            "p99_us": self.percentile(99),
+            "buckets": {str(b): c for b, c in sorted(self.counts.items())},
+        }
+
+
+class EndpointStats:
+    def __init__(self):
+        self.ttfb = LatencyHistogram()
+        self.total = LatencyHistogram()
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.bytes = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.total.count,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "bytes": self.bytes,
+            "ttfb": self.ttfb.to_dict(),
+            "total": self.total.to_dict(),
+        }
+
+
+def endpoint_of(url: str) -> str:
+    """URL -> 接口名（路径最后一段，如 /otn/leftTicket/queryZ -> queryZ）"""
+    path = urlsplit(url).path.rstrip("/")
+    return path.rsplit("/", 1)[-1] or path
+
+
+class RequestMetrics:
+    """按接口聚合的请求耗时统计（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints: Dict[str, EndpointStats] = {}
+        self.started_at = time.time()
+
+    def record(self, url: str, reused: Optional[bool], ttfb: float, total: float, nbytes: int):
+        name = endpoint_of(url)
+        with self._lock:
+            st = self.endpoints.get(name)
+            if st is None:
+                st = self.endpoints[name] = EndpointStats()
+            st.ttfb.record(ttfb)
+            st.total.record(total)
+            st.bytes += nbytes
+            if reused is True:
+                st.reused_connections += 1
+            elif reused is False:
+                st.new_connections += 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "endpoints": {name: st.to_dict() for name, st in self.endpoints.items()},
+            }
+
+    def export_json(self, path: str = None) -> str:
+        if path is None:
+            path = f"http_metrics_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        return path
+
+    def summary_table(self) -> str:
+        """按 OrderFlow 步骤汇总：请求数、新建/复用连接、首字节与总耗时 p50/p99、字节数"""
+        with self._lock:
+            items = sorted(self.endpoints.items(), key=lambda kv: kv[0])
+            lines = [
+                f"{'step':<12} {'endpoint':<22} {'n':>4} {'new':>4} {'reuse':>5} "
+                f"{'ttfb p50':>9} {'ttfb p99':>9} {'total p50':>10} {'total p99':>10} {'bytes':>9}"
+            ]
+            for name, st in items:
+                lines.append(
+                    f"{STEP_OF_ENDPOINT.get(name, '-'):<12} {name[:22]:<22} {st.total.count:>4} "
+                    f"{st.new_connections:>4} {st.reused_connections:>5} "
+                    f"{st.ttfb.percentile(50) / 1000:>7.1f}ms {st.ttfb.percentile(99) / 1000:>7.1f}ms "
+                    f"{st.total.percentile(50) / 1000:>8.1f}ms {st.total.percentile(99) / 1000:>8.1f}ms "
+                    f"{st.bytes:>9}"
+                )
+        return "\n".join(lines)
+
+    def print_summary(self):
+        text = "[INFO] HTTP 请求耗时汇总:\n" + self.summary_table()
+        try:
+            print(text)
+        except UnicodeEncodeError:
+            sys.stdout.buffer.write((text + "\n").encode("utf-8", errors="backslashreplace"))
+            sys.stdout.buffer.flush()
+
+
+# 进程内共享的统计（query / login / OrderFlow 的 session 都记到这里）
+METRICS = RequestMetrics()
+
+
+class MetricsAdapter(HTTPAdapter):
+    """在 HTTPAdapter.send 外层计时的适配器"""
+
+    def __init__(self, metrics: RequestMetrics, *args, **kwargs):
+        self.metrics = metrics
+        # 见过的连接对象；再次出现说明是 keep-alive 复用
+        self._seen_connections = weakref.WeakSet()
+        super().__init__(*args, **kwargs)
+
+    def _connection_reused(self, resp) -> Optional[bool]:
+        conn = getattr(resp.raw, "_connection", None)
+        if conn is None:
+            return None
+        try:
+            if conn in self._seen_connections:
+                return True
+            self._seen_connections.add(conn)
+            return False
+        except TypeError:
+            return None
+
+    def send(self, request, stream=False, **kwargs):
+        t0 = time.perf_counter()
+        resp = super().send(request, stream=stream, **kwargs)
+        # adapter.send 返回时已收到响应头、响应体尚未读取
+        ttfb = time.perf_counter() - t0
+        reused = self._connection_reused(resp)
+        nbytes = 0
+        if not stream:
+            nbytes = len(resp.content or b"")
+        else:
+            try:
+                nbytes = int(resp.headers.get("Content-Length") or 0)
+            except ValueError:
+                nbytes = 0
+        total = time.perf_counter() - t0
+        self.metrics.record(request.url, reused, ttfb, total, nbytes)
+        return resp
+
+
+def instrument_session(session: requests.Session, metrics: RequestMetrics = None) -> RequestMetrics:
+    """
+    给 session 挂上耗时统计（重复调用不会重复挂载），返回使用的统计对象
+    已挂载时：传入 metrics 则改为记录到它，否则沿用原来的统计对象
+    """
+    current = session.get_adapter("https://")
+    if isinstance(current, MetricsAdapter):
+        if metrics is not None:
+            for prefix in ("https://", "http://"):
+                adapter = session.get_adapter(prefix)
+                if isinstance(adapter, MetricsAdapter):
+                    adapter.metrics = metrics
+        return current.metrics
+    metrics = metrics or METRICS
+    adapter = MetricsAdapter(metrics)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return metrics
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+余票列表页（leftTicket/init）表格的一次性提取
+一次 page.evaluate 在浏览器内遍历 #queryLeftTable 的全部车次行，取回车次、站名、时间、各席别余票文字和预订按钮状态，
+替代逐行逐格的 locator(...).inner_text()（每次都是一个浏览器往返，60 个车次的表格需要几百次）
+返回的每一行与 query.parse_train_item 的结构相同，可直接交给 filter_by_time / filter_by_seat / rank_candidates，
+另外附带：
+- row_id：车次行的 id（tr#ticket_<train_no>_<出发站序>_<到达站序>），用于定位行内的预订按钮
+- book_text / bookable：预订按钮文字，以及是否为可点击的"预订"
+- cells：各列文字（调试输出用）
+页面上没有的字段（start_train_date，以及按钮上取不到时的 secret_str）为空字符串
+
+更快的方式是不等表格渲染：expect_left_tickets 在点击查询按钮时用 response 监听截获页面自己发出的
+queryZ/queryG 请求的 JSON，经 response_decoder.decode_browser_response 归类后交给 query.trains_from_result；DOM 提取只作为截获失败时的后备
+"""
+import asyncio
+import re
+from typing import Awaitable, Callable, Dict, List
+
+from query import trains_from_result
+from response_decoder import SERVER_ERROR, Decoded, decode_browser_response
+
+LEFT_TABLE_SELECTOR = "#queryLeftTable"
+
+# 页面发出的余票查询：/otn/leftTicket/queryZ?...（也可能是 queryG / queryA / queryO 等，不含 queryTicketPrice）
+LEFT_TICKET_QUERY_RE = re.compile(r"/otn/leftTicket/query[A-Z]\?")
+# 接口提示换用其它查询地址（c_url）时，页面会自己再请求一次，最多跟随这么多次
+MAX_QUERY_SWITCHES = 2
+
+# 席别列：单元格 id 前缀（如 ZE_240000G1234）-> parse_train_item 字段
+# 前缀取不到时按表头文字匹配（按顺序取第一个命中的，None 表示不关心的席别）
+LEFT_TABLE_JS = """
+(selector) => {
+    const root = document.querySelector(selector);
+    if (!root) return [];
+    const PREFIX_FIELDS = {SWZ: "business", TZ: "business", ZY: "first", ZE: "second",
+                           RW: "soft_sleep", YW: "hard_sleep", YZ: "hard_seat", WZ: "no_seat"};
+    const HEADER_FIELDS = [["商务", "business"], ["特等", "business"], ["优选", null], ["一等座", "first"],
+                           ["二等座", "second"], ["高级软卧", null], ["软卧", "soft_sleep"], ["硬卧", "hard_sleep"],
+                           ["硬座", "hard_seat"], ["无座", "no_seat"]];
+    const text = (el) => (el ? el.innerText || el.textContent || "" : "").trim();
+
+    // 表头列序 -> 字段（表头可能在同一个 table 的 thead 里）
+    const headerFields = [];
+    const table = root.closest("table");
+    const head = table && table.tHead ? table.tHead.rows[0] : null;
+    if (head) {
+        for (const th of head.cells) {
+            const h = text(th);
+            const hit = HEADER_FIELDS.find(([needle]) => h.includes(needle));
+            headerFields.push(hit ? hit[1] : null);
+        }
+    }
+
+    const rows = [];
+    for (const tr of root.querySelectorAll("tr[id^='ticket_']")) {
+        const cells = Array.from(tr.cells);
+        const cellTexts = cells.map(text);
+        const one = (sel) => text(tr.querySelector(sel));
+        // 时间：优先取固定 class，否则按出现顺序取 HH:MM（出发、到达、历时）
+        const times = cellTexts.slice(0, 4).join(" ").match(/\\b\\d{1,2}:\\d{2}\\b/g) || [];
+        const idParts = tr.id.split("_");
+        const row = {
+            row_id: tr.id,
+            secret_str: "",
+            train_code: one("a.number") || (cellTexts[0] || "").split(/\\s+/)[0] || "",
+            train_no: idParts[1] || "",
+            from: one(".cdz .start-t"),
+            to: one(".cdz .end-t"),
+            start: one(".cds .start-t") || times[0] || "",
+            arrive: one(".cds .color999") || times[1] || "",
+            duration: one(".ls strong") || times[2] || "",
+            from_station_no: idParts[2] || "",
+            to_station_no: idParts[3] || "",
+            start_train_date: "",
+            business: "", first: "", second: "", soft_sleep: "", hard_sleep: "", hard_seat: "", no_seat: "",
+            book_text: "",
+            bookable: false,
+            cells: cellTexts,
+        };
+        cells.forEach((td, i) => {
+            const field = PREFIX_FIELDS[(td.id || "").split("_")[0]] || headerFields[i];
+            if (field && !row[field]) row[field] = cellTexts[i];
+        });
+        // 预订按钮在最后一列；onclick 的第一个长参数是 secretStr
+        const btn = tr.querySelector("a.btn72") || Array.from(tr.querySelectorAll("a")).find((a) => text(a).includes("预订"));
+        if (btn) {
+            row.book_text = text(btn);
+            row.bookable = row.book_text.includes("预订") && !btn.classList.contains("btn72-disabled");
+            const m = (btn.getAttribute("onclick") || "").match(/['"]([^'"]{20,})['"]/);
+            if (m) row.secret_str = m[1];
+        }
+        rows.push(row);
+    }
+    return rows;
+}
+"""
+
+
+async def extract_left_table(page, selector: str = LEFT_TABLE_SELECTOR) -> List[Dict]:
+    """一次 page.evaluate 取出整张余票表（表格不存在时返回空列表）"""
+    return await page.evaluate(LEFT_TABLE_JS, selector)
+
+
+def row_locator(page, train: Dict):
+    """车次对应的表格行（点击行内的预订按钮用）；JSON 截获的车次没有 row_id，按 train_no 前缀匹配"""
+    if train.get("row_id"):
+        return page.locator(f"tr[id='{train['row_id']}']")
+    return page.locator(f"tr[id^='ticket_{train['train_no']}']").first
+
+
+def is_left_ticket_response(response) -> bool:
+    """页面发出的余票查询的最终响应（跟随重定向后的那个）"""
+    return bool(LEFT_TICKET_QUERY_RE.search(response.url)) and not 300 <= response.status < 400
+
+
+async def expect_left_tickets(page, trigger: Callable[[], Awaitable], timeout: float = 15000) -> Decoded:
+    """
+    执行 trigger（协程函数，如点击查询按钮），截获页面因此发出的余票查询响应并解码
+    接口返回 c_url（提示换用其它查询地址）时页面会立即自动重发：响应由 trigger 之前注册的 response 监听
+    放入队列，读取上一个响应体期间到达的重发响应也不会漏掉
+    timeout（毫秒）为每个响应的等待上限，超时返回 SERVER_ERROR 类别；trigger 抛出的异常原样抛出
+    """
+    responses: "asyncio.Queue" = asyncio.Queue()
+
+    def on_response(response):
+        if is_left_ticket_response(response):
+            responses.put_nowait(response)
+
+    page.on("response", on_response)
+    try:
+        await trigger()
+        decoded = None
+        for _ in range(MAX_QUERY_SWITCHES + 1):
+            try:
+                response = await asyncio.wait_for(responses.get(), timeout / 1000)
+            except asyncio.TimeoutError:
+                return Decoded(SERVER_ERROR, reason=f"未截获余票查询响应（等待 {timeout / 1000:.0f} 秒）")
+            decoded = await decode_browser_response(response)
+            if not (isinstance(decoded.data, dict) and decoded.data.get("c_url")):
+                return decoded
+            # 页面会按 c_url 自己重发，继续从队列取
+        return decoded
+    finally:
+        page.remove_listener("response", on_response)
+
+
+def left_tickets_from_response(decoded: Decoded) -> List[Dict]:
+    """截获的余票 JSON -> parse_train_item 列表"""
+    return trains_from_result(decoded.data) if decoded.ok else []
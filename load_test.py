@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+查询/解析/挑选循环的压力测试：N 个并发的盯票循环请求本地回放服务器（replay_server.py）
+- 回放服务器在子进程中运行，返回指定车次数的合成 queryG 结果，不占用被测进程的 CPU
+- 每个循环：query_and_pick（查询 -> 解析 -> 时间/席别过滤 -> 排序挑选），或 --mode query 时
+  query_left_tickets + 过滤 + rank_candidates
+- 输出持续吞吐量、单次循环 p50/p99、每次查询的 CPU 时间，以及运行期间的内存增长
+用法（BASE_URL 必须指向本地）：
+  KYFW_BASE_URL=http://127.0.0.1:8306 python load_test.py --watches 20 --duration 30 --trains 60
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from config import BASE_URL, TRAVEL_DATE, FROM_STATION, TO_STATION, DEFAULT_START_TIME, DEFAULT_END_TIME
+from http_metrics import LatencyHistogram
+
+# psutil 为可选依赖，没有时从 /proc 或 resource 读取内存
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    psutil = None
+    PSUTIL_AVAILABLE = False
+
+# 合成车次的余票取值（按权重随机）
+SEAT_VALUES = ("有", "无", "--", "3", "12", "少", "")
+# 合成结果中出发时间的范围（分钟）
+DEPART_RANGE = (6 * 60, 22 * 60)
+# 内存采样间隔（秒）
+MEM_SAMPLE_INTERVAL = 1.0
+
+
+def _log(msg):
+    try:
+        print(msg)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((str(msg) + "\n").encode("utf-8", errors="backslashreplace"))
+        sys.stdout.buffer.flush()
+
+
+def rss_bytes() -> Optional[int]:
+    """当前进程常驻内存（字节）；无法获取时返回 None"""
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Linux 上 ru_maxrss 单位为 KB（只能拿到峰值）
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return None
+
+
+# ---------- 合成查询结果 ----------
+
+def synthetic_row(i: int, rnd: random.Random) -> str:
+    """一行 queryG 结果（| 分隔，字段位置与 query.parse_train_item 一致）"""
+    parts = [""] * 40
+    depart = rnd.randint(*DEPART_RANGE)
+    duration = rnd.randint(150, 480)
+    arrive = (depart + duration) % (24 * 60)
+    parts[0] = f"secret{i:05d}%2B{rnd.getrandbits(64):016x}"
+    parts[1] = "预订"
+    parts[2] = f"6i000G{i:04d}0{rnd.randint(0, 9)}"
+    parts[3] = f"G{1000 + i}"
+    parts[4], parts[5] = "IOQ", "CWQ"
+    parts[6], parts[7] = FROM_STATION, TO_STATION
+    parts[8] = f"{depart // 60:02d}:{depart % 60:02d}"
+    parts[9] = f"{arrive // 60:02d}:{arrive % 60:02d}"
+    parts[10] = f"{duration // 60:02d}:{duration % 60:02d}"
+    parts[11] = "Y"
+    parts[13] = TRAVEL_DATE.replace("-", "")
+    parts[16], parts[17] = "01", "09"
+    for field in (26, 27, 28, 29, 30, 31, 32):
+        parts[field] = rnd.choice(SEAT_VALUES)
+    return "|".join(parts)
+
+
+def synthetic_query_result(trains: int, seed: int = 0) -> Dict:
+    rnd = random.Random(seed)
+    return {"httpstatus": 200, "status": True, "messages": "",
+            "data": {"flag": "1", "map": {FROM_STATION: "", TO_STATION: ""},
+                     "result": [synthetic_row(i, rnd) for i in range(trains)]}}
+
+
+def _serve(host: str, port: int, trains: int, latency: float, jitter: float, ready):
+    """子进程：只提供 queryZ/queryG 的回放服务器"""
+    from replay_server import ReplayServer, Reply, default_replies, _json_body
+
+    replies = default_replies()
+    replies["queryG"] = Reply(200, _json_body(synthetic_query_result(trains)))
+    server = ReplayServer(replies, host, port, latency=latency, jitter=jitter)
+    ready.set()
+    server.httpd.serve_forever()
+
+
+# ---------- 盯票循环 ----------
+
+class WatchLoop(threading.Thread):
+    """一个盯票循环：不停查询并挑选车次，记录每轮耗时与线程 CPU 时间"""
+
+    def __init__(self, mode: str, stop: threading.Event, interval: float = 0.0):
+        super().__init__(daemon=True)
+        self.mode = mode
+        self.stop_event = stop
+        self.interval = interval
+        self.latency = LatencyHistogram()
+        self.loops = 0
+        self.failures = 0
+        self.cpu = 0.0
+        self.counting = False
+        self.flow = None
+        self.error = None
+
+    def _build(self):
+        from order_flow import OrderFlow
+
+        flow = OrderFlow()
+        # 压测时不输出每轮日志
+        flow.log = lambda msg: None
+        return flow
+
+    def _once(self) -> bool:
+        if self.mode == "pick":
+            return self.flow.query_and_pick(DEFAULT_START_TIME, DEFAULT_END_TIME) is not None
+        from query import query_left_tickets, filter_by_time, filter_by_seat, rank_candidates
+
+        trains = query_left_tickets(self.flow.session, TRAVEL_DATE, FROM_STATION, TO_STATION)
+        trains = filter_by_seat(filter_by_time(trains, DEFAULT_START_TIME, DEFAULT_END_TIME))
+        return bool(rank_candidates(trains))
+
+    def run(self):
+        try:
+            self.flow = self._build()
+            while not self.stop_event.is_set():
+                t0 = time.perf_counter()
+                c0 = time.thread_time()
+                ok = self._once()
+                c1 = time.thread_time()
+                t1 = time.perf_counter()
+                if self.counting:
+                    self.latency.record(t1 - t0)
+                    self.cpu += c1 - c0
+                    self.loops += 1
+                    if not ok:
+                        self.failures += 1
+                if self.interval:
+                    self.stop_event.wait(self.interval)
+        except Exception as e:
+            self.error = e
+
+
+def _merge(histograms: List[LatencyHistogram]) -> LatencyHistogram:
+    merged = LatencyHistogram()
+    for h in histograms:
+        for b, c in h.counts.items():
+            merged.counts[b] = merged.counts.get(b, 0) + c
+        merged.count += h.count
+        merged.total += h.total
+        if h.min is not None:
+            merged.min = h.min if merged.min is None else min(merged.min, h.min)
+            merged.max = h.max if merged.max is None else max(merged.max, h.max)
+    return merged
+
+
+def run_load(watches: int = 10, duration: float = 30.0, warmup: float = 3.0, mode: str = "pick",
+             interval: float = 0.0) -> Dict:
+    """在当前进程中运行 watches 个盯票循环，返回统计结果"""
+    stop = threading.Event()
+    loops = [WatchLoop(mode, stop, interval) for _ in range(watches)]
+    for w in loops:
+        w.start()
+    time.sleep(warmup)
+
+    gc.collect()
+    mem_start = rss_bytes()
+    mem_samples = []
+    cpu_start = time.process_time()
+    t_start = time.perf_counter()
+    for w in loops:
+        w.counting = True
+    deadline = t_start + duration
+    while time.perf_counter() < deadline:
+        time.sleep(min(MEM_SAMPLE_INTERVAL, max(0.0, deadline - time.perf_counter())))
+        mem_samples.append(rss_bytes())
+    for w in loops:
+        w.counting = False
+    elapsed = time.perf_counter() - t_start
+    cpu_total = time.process_time() - cpu_start
+    stop.set()
+    for w in loops:
+        w.join(timeout=10)
+
+    errors = [repr(w.error) for w in loops if w.error is not None]
+    hist = _merge([w.latency for w in loops])
+    total_loops = hist.count
+    mem_end = mem_samples[-1] if mem_samples else rss_bytes()
+    return {
+        "watches": watches,
+        "mode": mode,
+        "duration_s": round(elapsed, 3),
+        "loops": total_loops,
+        "failures": sum(w.failures for w in loops),
+        "errors": errors,
+        "throughput_qps": round(total_loops / elapsed, 2) if elapsed else 0.0,
+        "latency_p50_ms": hist.percentile(50) / 1000,
+        "latency_p99_ms": hist.percentile(99) / 1000,
+        "latency_max_ms": (hist.max or 0) / 1000,
+        # 线程 CPU 只含循环本身；进程 CPU 另含请求统计、GC 等
+        "cpu_per_query_ms": round(sum(w.cpu for w in loops) / total_loops * 1000, 3) if total_loops else 0.0,
+        "process_cpu_per_query_ms": round(cpu_total / total_loops * 1000, 3) if total_loops else 0.0,
+        "mem_start_mb": round(mem_start / 2**20, 1) if mem_start else None,
+        "mem_end_mb": round(mem_end / 2**20, 1) if mem_end else None,
+        "mem_growth_mb_per_min": (round((mem_end - mem_start) / 2**20 / elapsed * 60, 2)
+                                  if mem_start and mem_end and elapsed else None),
+    }
+
+
+def print_report(result: Dict):
+    _log(f"[INFO] 压测结果（{result['watches']} 个循环，{result['mode']} 模式，{result['duration_s']} 秒）:")
+    _log(f"  循环次数        {result['loops']}（未挑到车次 {result['failures']}）")
+    _log(f"  吞吐量          {result['throughput_qps']} 次/秒")
+    _log(f"  循环耗时        p50 {result['latency_p50_ms']:.1f} ms  p99 {result['latency_p99_ms']:.1f} ms  "
+         f"max {result['latency_max_ms']:.1f} ms")
+    _log(f"  每次查询 CPU    {result['cpu_per_query_ms']} ms（整个进程 {result['process_cpu_per_query_ms']} ms）")
+    if result["mem_start_mb"] is not None:
+        _log(f"  内存            {result['mem_start_mb']} MB -> {result['mem_end_mb']} MB"
+             f"（{result['mem_growth_mb_per_min']} MB/分钟）")
+    for err in result["errors"]:
+        _log(f"[WARN] 循环异常退出: {err}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查询/解析/挑选循环压力测试（对本地回放服务器）")
+    parser.add_argument("--watches", type=int, default=10, help="并发盯票循环数")
+    parser.add_argument("--duration", type=float, default=30.0, help="统计时长（秒）")
+    parser.add_argument("--warmup", type=float, default=3.0, help="预热时长（秒，不计入统计）")
+    parser.add_argument("--trains", type=int, default=60, help="合成查询结果中的车次数")
+    parser.add_argument("--mode", choices=("pick", "query"), default="pick")
+    parser.add_argument("--interval", type=float, default=0.0, help="每个循环两次查询之间的间隔（秒）")
+    parser.add_argument("--latency", type=float, default=0.0, help="回放服务器延迟（毫秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="回放服务器延迟抖动（毫秒）")
+    parser.add_argument("--external", action="store_true", help="不启动回放服务器，使用已运行的服务器")
+    parser.add_argument("--output", help="结果另存为 JSON 文件")
+    args = parser.parse_args(argv)
+
+    parts = urlsplit(BASE_URL)
+    if parts.hostname not in ("127.0.0.1", "localhost", "::1"):
+        _log(f"[FAIL] BASE_URL={BASE_URL} 不是本地地址，请设置 KYFW_BASE_URL=http://127.0.0.1:8306")
+        return 1
+
+    server = None
+    if not args.external:
+        ready = multiprocessing.Event()
+        server = multiprocessing.Process(
+            target=_serve, args=(parts.hostname, parts.port or 80, args.trains, args.latency, args.jitter, ready),
+            daemon=True,
+        )
+        server.start()
+        if not ready.wait(10):
+            _log("[FAIL] 回放服务器启动失败")
+            return 1
+        _log(f"[OK] 回放服务器已启动: {BASE_URL}（{args.trains} 个车次）")
+
+    _log(f"[STEP] {args.watches} 个盯票循环，预热 {args.warmup} 秒，统计 {args.duration} 秒")
+    try:
+        result = run_load(args.watches, args.duration, args.warmup, args.mode, args.interval)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join(timeout=5)
+    result["trains"] = args.trains
+    print_report(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(dict(result, time=datetime.now().isoformat(timespec="seconds")), f, ensure_ascii=False, indent=2)
+        _log(f"[INFO] 已保存: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
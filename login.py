@@ -10,6 +10,7 @@ from PIL import Image
 import io
 from urllib.parse import urlencode
 import urllib3
+from http_metrics import instrument_session
 from config import (
     USERNAME, PASSWORD, PHONE, ID_CARD_LAST_FOUR,
     BASE_URL, LOGIN_URL, INITIAL_COOKIES, HEADERS,
@@ -38,6 +39,8 @@ class Ticker12306Login:
         self.session.headers.update(HEADERS)
         self.session.cookies.update(INITIAL_COOKIES)
         self.session.verify = False  # 禁用 SSL 验证（仅用于12306）
+        # 记录每个接口的连接复用/首字节/总耗时
+        self.metrics = instrument_session(self.session)
         # 可选：手动注入设备指纹Cookie（若从浏览器复制）
         if RAIL_DEVICEID and RAIL_EXPIRATION:
             self.session.cookies.set("RAIL_DEVICEID", RAIL_DEVICEID, domain="kyfw.12306.cn")
@@ -4,14 +4,47 @@
 """
 import json
 import os
+import re
 import glob
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Iterator, Tuple
 
+from http_metrics import endpoint_of
+from capture_sink import is_capture_file, read_capture
+from har import entry_to_record
 
-def find_latest_network_log() -> Optional[str]:
-    """查找最新的网络请求日志文件"""
-    pattern = "network_requests_*.json"
-    files = glob.glob(pattern)
+NETWORK_LOG_PATTERN = "network_requests_*.json"
+# 文件名中带时间戳，按时间戳即可排序：
+# network_requests_YYYYMMDD_HHMMSS.json（整体写入的 JSON 数组）
+# network_capture_YYYYMMDD_HHMMSS.NNN.ndjson.gz|zst（capture_sink 写入的压缩分段，只取第一个分段）
+NETWORK_LOG_NAME_RE = re.compile(
+    r"^network_(?:requests|capture)_(\d{8}_\d{6})(?:\.json|\.000\.ndjson\.(?:gz|zst))$"
+)
+# 索引文件：<日志文件>.idx
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+# 浏览器 DevTools 导出的 HAR 文件
+HAR_SUFFIX = ".har"
+
+
+def find_latest_network_log(directory: str = ".") -> Optional[str]:
+    """
+    查找最新的网络请求日志文件
+    文件名带时间戳（见 NETWORK_LOG_NAME_RE）时直接按时间戳取最新，不逐个 stat；
+    只有存在不符合该格式的文件时才按修改时间排序
+    """
+    named = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                m = NETWORK_LOG_NAME_RE.match(entry.name)
+                if m:
+                    named.append((m.group(1), entry.name))
+    except OSError:
+        return None
+    if named:
+        latest = max(named)[1]
+        return os.path.join(directory, latest) if directory != "." else latest
+    files = glob.glob(os.path.join(directory, NETWORK_LOG_PATTERN))
     if not files:
         return None
     # 按修改时间排序，返回最新的
@@ -19,8 +52,277 @@ def find_latest_network_log() -> Optional[str]:
     return files[0]
 
 
-def load_network_log(file_path: Optional[str] = None) -> Optional[list]:
-    """加载网络请求日志"""
+# 建索引时逐块读取的大小（字节）
+SCAN_CHUNK = 1 << 20
+# 建索引时从每条记录中取的字段（路径 -> 值），其余内容（响应体等）只跳过不解析
+RECORD_FIELDS = (("url",), ("method",), ("timestamp",), ("response", "status"))
+HAR_FIELDS = (("request", "url"), ("request", "method"), ("startedDateTime",), ("response", "status"))
+# 记录数组在文件中的位置：捕获日志为顶层数组，HAR 为 log.entries
+RECORD_ARRAY_PATH = ()
+HAR_ARRAY_PATH = ("log", "entries")
+
+_STRUCT_RE = re.compile(rb'["{}\[\],:]')
+_STRING_END_RE = re.compile(rb'["\\]')
+
+
+def scan_array_items(f, array_path=RECORD_ARRAY_PATH, fields=RECORD_FIELDS,
+                     chunk_size: int = SCAN_CHUNK) -> Iterator[Tuple[Dict[tuple, Any], int, int]]:
+    """
+    逐块扫描二进制文件 f 中位于 array_path 的 JSON 数组，对其中每个对象元素返回 (字段, 起始字节, 字节长度)
+    字段只包含 fields 中列出的路径上的标量值；字符串内容（如 HTML 响应体）只查找结束引号，不解码、不保留，
+    内存占用与文件大小无关，字节偏移直接计数，不需要字符位置到字节位置的换算
+    """
+    wanted = set(fields)
+    array_depth = len(array_path)
+    # 每层容器：[类型, 当前键]（数组的键为 None）
+    stack: List[list] = []
+    expect_key = False
+    in_string = escaped = string_is_key = False
+    string_buf: Optional[bytearray] = None
+    scalar: Optional[bytearray] = None
+    elem_level = None
+    elem_start = 0
+    found: Dict[tuple, Any] = {}
+    base = 0
+
+    def field_path():
+        # 当前值在元素内的路径；元素内嵌套数组中的值不取
+        if elem_level is None:
+            return None
+        frames = stack[elem_level:]
+        if any(fr[0] != 0x7b for fr in frames):
+            return None
+        path = tuple(fr[1] for fr in frames)
+        return path if path in wanted else None
+
+    def finish_scalar():
+        nonlocal scalar
+        if scalar is not None:
+            raw = bytes(scalar).strip()
+            if raw:
+                try:
+                    found[field_path()] = json.loads(raw)
+                except ValueError:
+                    pass
+            scalar = None
+
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        pos, n = 0, len(chunk)
+        while pos < n:
+            if in_string:
+                if escaped:
+                    if string_buf is not None:
+                        string_buf += chunk[pos:pos + 1]
+                    escaped = False
+                    pos += 1
+                    continue
+                m = _STRING_END_RE.search(chunk, pos)
+                if m is None:
+                    if string_buf is not None:
+                        string_buf += chunk[pos:]
+                    break
+                i = m.start()
+                if string_buf is not None:
+                    string_buf += chunk[pos:i]
+                pos = i + 1
+                if chunk[i] == 0x5c:
+                    if string_buf is not None:
+                        string_buf += b"\\"
+                    escaped = True
+                    continue
+                in_string = False
+                if string_buf is not None:
+                    text = json.loads(b'"' + bytes(string_buf) + b'"')
+                    if string_is_key:
+                        stack[-1][1] = text
+                    else:
+                        found[field_path()] = text
+                    string_buf = None
+                continue
+
+            m = _STRUCT_RE.search(chunk, pos)
+            end = m.start() if m else n
+            if scalar is not None:
+                scalar += chunk[pos:end]
+            if m is None:
+                break
+            c = chunk[end]
+            pos = end + 1
+            if c == 0x22:  # "
+                in_string = True
+                scalar = None
+                string_is_key = bool(stack) and stack[-1][0] == 0x7b and expect_key
+                string_buf = bytearray() if string_is_key or field_path() else None
+            elif c in (0x7b, 0x5b):  # { [
+                scalar = None
+                if (c == 0x7b and elem_level is None and len(stack) == array_depth + 1 and stack[-1][0] == 0x5b
+                        and tuple(fr[1] for fr in stack[:-1]) == tuple(array_path)):
+                    elem_level = len(stack)
+                    elem_start = base + end
+                    found = {}
+                stack.append([c, None])
+                expect_key = c == 0x7b
+            elif c == 0x3a:  # :
+                expect_key = False
+                scalar = bytearray() if field_path() else None
+            elif c == 0x2c:  # ,
+                finish_scalar()
+                expect_key = bool(stack) and stack[-1][0] == 0x7b
+            else:  # } ]
+                finish_scalar()
+                stack.pop()
+                expect_key = False
+                if elem_level is not None and len(stack) == elem_level:
+                    yield found, elem_start, base + end + 1 - elem_start
+                    elem_level = None
+        base += n
+
+
+def _nest(found: Dict[tuple, Any]) -> Dict[str, Any]:
+    """{("response", "status"): 200} -> {"response": {"status": 200}}"""
+    item: Dict[str, Any] = {}
+    for path, value in found.items():
+        d = item
+        for key in path[:-1]:
+            d = d.setdefault(key, {})
+        d[path[-1]] = value
+    return item
+
+
+def _index_entry(item: Dict[str, Any], offset: Optional[int], length: Optional[int]) -> Dict[str, Any]:
+    resp = item.get("response") or {}
+    url = item.get("url", "")
+    return {
+        "endpoint": endpoint_of(url),
+        "url": url,
+        "method": item.get("method", ""),
+        "status": resp.get("status"),
+        "timestamp": item.get("timestamp"),
+        "offset": offset,
+        "length": length,
+    }
+
+
+class NetworkLog:
+    """
+    Playwright 捕获日志（network_requests_*.json）的索引读取器
+    第一次打开时扫描一遍，生成旁路索引文件（接口 -> 字节偏移、长度、方法、状态码、时间戳），
+    之后只按偏移读取需要的那一条记录，不再解析整个文件（里面有完整的 HTML 响应体）
+    capture_sink 写入的压缩 NDJSON 分段（network_capture_*.ndjson.gz|zst）读入内存后同样使用
+    HAR 文件按 log.entries 建索引，读取时转换为捕获记录格式
+    """
+
+    def __init__(self, path: str, entries: List[Dict[str, Any]]):
+        self.path = path
+        self.is_har = path.lower().endswith(HAR_SUFFIX)
+        # 索引行：{"endpoint", "url", "method", "status", "timestamp", "offset", "length"}
+        self.entries = entries
+        self.by_endpoint: Dict[str, List[int]] = {}
+        for i, e in enumerate(entries):
+            self.by_endpoint.setdefault(e["endpoint"], []).append(i)
+        self._cache: Dict[int, Dict[str, Any]] = {}
+
+    # ---------- 打开 / 建索引 ----------
+
+    @classmethod
+    def from_records(cls, path: str, records) -> "NetworkLog":
+        """由已读出的记录构建（压缩的 NDJSON 捕获不能按偏移读取，记录直接保存在内存中）"""
+        records = list(records)
+        entries = [_index_entry(item, None, None) for item in records]
+        log = cls(path, entries)
+        log._cache = dict(enumerate(records))
+        return log
+
+    @classmethod
+    def open(cls, path: str) -> "NetworkLog":
+        if is_capture_file(path):
+            return cls.from_records(path, read_capture(path))
+        st = os.stat(path)
+        index_path = path + INDEX_SUFFIX
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if (index.get("version") == INDEX_VERSION and index.get("size") == st.st_size
+                    and index.get("mtime_ns") == st.st_mtime_ns):
+                return cls(path, index["entries"])
+        except (OSError, ValueError, KeyError):
+            pass
+        entries = cls.build_index(path)
+        index = {"version": INDEX_VERSION, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "entries": entries}
+        tmp = index_path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, index_path)
+        except OSError as e:
+            print(f"[WARN] 写入网络日志索引失败: {str(e)}")
+        return cls(path, entries)
+
+    @staticmethod
+    def build_index(path: str) -> List[Dict[str, Any]]:
+        """逐块扫描日志文件，记录每条请求的字节偏移与摘要（不解析、不保留响应体）"""
+        is_har = path.lower().endswith(HAR_SUFFIX)
+        array_path, fields = (HAR_ARRAY_PATH, HAR_FIELDS) if is_har else (RECORD_ARRAY_PATH, RECORD_FIELDS)
+        entries = []
+        with open(path, "rb") as f:
+            for found, offset, length in scan_array_items(f, array_path, fields):
+                item = _nest(found)
+                if is_har:
+                    item = entry_to_record(item)
+                entries.append(_index_entry(item, offset, length))
+        return entries
+
+    # ---------- 读取 ----------
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def read(self, i: int) -> Dict[str, Any]:
+        """读取第 i 条完整记录（只读这一条的字节范围）"""
+        item = self._cache.get(i)
+        if item is None:
+            item = self._read_at(self.entries[i])
+            self._cache[i] = item
+        return item
+
+    def _read_at(self, e: Dict[str, Any], f=None) -> Dict[str, Any]:
+        if f is None:
+            with open(self.path, "rb") as f:
+                return self._read_at(e, f)
+        f.seek(e["offset"])
+        item = json.loads(f.read(e["length"]).decode("utf-8"))
+        return entry_to_record(item) if self.is_har else item
+
+    def stream(self) -> Iterator[Dict[str, Any]]:
+        """按顺序逐条读取，不放入缓存（导出等一次性遍历使用，内存占用不随日志大小增长）"""
+        with open(self.path, "rb") as f:
+            for i, e in enumerate(self.entries):
+                item = self._cache.get(i)
+                yield item if item is not None else self._read_at(e, f)
+
+    def find(self, endpoint: str, method: str = None) -> Optional[Dict[str, Any]]:
+        """按接口名（如 getQueueCount）取第一条记录"""
+        for i in self.by_endpoint.get(endpoint, ()):
+            if method is None or self.entries[i]["method"] == method:
+                return self.read(i)
+        return None
+
+    def find_all(self, endpoint: str) -> List[Dict[str, Any]]:
+        return [self.read(i) for i in self.by_endpoint.get(endpoint, ())]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self.entries)):
+            yield self.read(i)
+
+
+def load_network_log(file_path: Optional[str] = None) -> Optional[NetworkLog]:
+    """加载网络请求日志（返回带索引的 NetworkLog，可像列表一样遍历）"""
     if file_path is None:
         file_path = find_latest_network_log()
     
@@ -28,112 +330,24 @@ def load_network_log(file_path: Optional[str] = None) -> Optional[list]:
         return None
     
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return NetworkLog.open(file_path)
     except Exception as e:
         print(f"[WARN] 加载网络请求日志失败: {str(e)}")
         return None
 
 
-def get_queue_count_request_info(network_log: list) -> Optional[Dict[str, Any]]:
+def iter_log_records(file_path: str) -> Iterator[Dict[str, Any]]:
+    """逐条读取任一格式的捕获日志（JSON 数组 / 压缩 NDJSON 分段 / HAR），不在内存中保留"""
+    if is_capture_file(file_path):
+        return read_capture(file_path)
+    return NetworkLog.open(file_path).stream()
+
+
+def get_queue_count_request_info(network_log) -> Optional[Dict[str, Any]]:
     """从网络日志中提取 getQueueCount 请求信息"""
+    if isinstance(network_log, NetworkLog):
+        return network_log.find("getQueueCount")
     for req in network_log:
         if "getQueueCount" in req.get("url", ""):
             return req
     return None
-
-
-def update_get_queue_count_from_network_log(flow, network_log: list):
-    """
-    根据网络日志更新 OrderFlow 的 get_queue_count 方法
-    这会在运行时动态更新方法，使用捕获的真实请求信息
-    """
-    queue_req = get_queue_count_request_info(network_log)
-    if not queue_req:
-        print("[WARN] 未找到 getQueueCount 请求信息")
-        return False
-    
-    # 保存原始方法
-    original_method = flow.get_queue_count
-    
-    def new_get_queue_count(self):
-        """根据捕获的网络请求信息执行 getQueueCount"""
-        self.log("[STEP] 获取排队信息 getQueueCount（使用捕获的请求信息）")
-        
-        # 使用捕获的 URL
-        url = queue_req["url"]
-        
-        # 解析 POST 数据
-        import urllib.parse
-        ti = self.ticket_info or {}
-        post_data_str = queue_req.get("post_data", "")
-        if post_data_str:
-            # 解析 URL 编码的 POST 数据
-            parsed = urllib.parse.parse_qs(post_data_str, keep_blank_values=True)
-            # 将列表值转换为单个值（保留最后一个值，因为有些参数可能重复）
-            data = {}
-            for k, v in parsed.items():
-                if isinstance(v, list):
-                    # 对于某些参数，可能需要保留所有值，但通常取最后一个
-                    data[k] = v[-1] if v else ""
-                else:
-                    data[k] = v
-            
-            # 更新动态参数（使用当前会话的值）
-            data["REPEAT_SUBMIT_TOKEN"] = self.repeat_token
-            # 更新其他可能变化的参数
-            if "train_date" not in data or not data["train_date"]:
-                train_date = ti.get("queryLeftTicketRequestDTO", {}).get("train_date") or "2026-02-01"
-                data["train_date"] = train_date
-            if "seatType" not in data or not data["seatType"]:
-                data["seatType"] = "O" if self.selected_seat_name == "二等座" else "WZ"
-        else:
-            # 如果没有 POST 数据，使用默认数据
-            train_date = ti.get("queryLeftTicketRequestDTO", {}).get("train_date") or "2026-02-01"
-            data = {
-                "train_date": train_date,
-                "train_no": ti.get("queryLeftTicketRequestDTO", {}).get("train_no", ""),
-                "stationTrainCode": ti.get("queryLeftTicketRequestDTO", {}).get("station_train_code", ""),
-                "seatType": "O" if self.selected_seat_name == "二等座" else "WZ",
-                "fromStationTelecode": ti.get("queryLeftTicketRequestDTO", {}).get("from_station", ""),
-                "toStationTelecode": ti.get("queryLeftTicketRequestDTO", {}).get("to_station", ""),
-                "leftTicket": ti.get("leftTicketStr", ""),
-                "purpose_codes": ti.get("purpose_codes", "00"),
-                "train_location": ti.get("train_location", ""),
-                "_json_att": "",
-                "REPEAT_SUBMIT_TOKEN": self.repeat_token,
-            }
-        
-        # 使用捕获的 headers（完全模拟浏览器）
-        headers = queue_req.get("headers", {}).copy()
-        
-        # 确保必要的 headers 存在
-        if "Content-Type" not in headers:
-            headers["Content-Type"] = "application/x-www-form-urlencoded; charset=UTF-8"
-        if "Origin" not in headers:
-            headers["Origin"] = "https://kyfw.12306.cn"
-        if "Referer" not in headers:
-            headers["Referer"] = "https://kyfw.12306.cn/otn/confirmPassenger/initDc"
-        if "X-Requested-With" not in headers:
-            headers["X-Requested-With"] = "XMLHttpRequest"
-        
-        # 发送请求
-        resp = self.session.post(url, data=data, headers=headers, timeout=10, verify=False)
-        try:
-            res = resp.json()
-        except Exception:
-            self.log(f"[FAIL] getQueueCount 非JSON: {resp.text[:200]}")
-            return False
-        if not res.get("status"):
-            self.log(f"[FAIL] getQueueCount 返回失败: {res}")
-            return False
-        self.log(f"[OK] getQueueCount result: {res.get('data')}")
-        import time
-        time.sleep(1.0)
-        return True
-    
-    # 替换方法
-    import types
-    flow.get_queue_count = types.MethodType(new_get_queue_count, flow)
-    print("[OK] 已根据网络日志更新 getQueueCount 方法")
-    return True
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Playwright 网络请求捕获：按 Request 对象本身关联请求与响应
+- request 事件登记一条记录，response / requestfinished / requestfailed 事件直接用 response.request 找到它（O(1)）
+- 同一个 URL 请求多次时各自对应，不会再把响应挂到别的请求上
+- 只有白名单内接口才读取响应体，并且等 requestfinished（响应体已接收完）时才读
+记录格式与 network_requests_*.json 相同，network_analyzer 可直接加载
+配合 capture_sink.CaptureSink（on_record）时可不在内存中保留记录（keep_records=False）
+用于 async Playwright：读取响应体放在单独的 asyncio 任务里，事件处理本身不等待；close() 时等这些任务结束
+"""
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional
+
+from capture_sink import body_limit
+from http_metrics import endpoint_of
+
+# 只捕获这些请求
+CAPTURE_HOST = "kyfw.12306.cn"
+CAPTURE_PATH = "/otn/"
+# 读取响应体的接口
+CAPTURE_BODY_ENDPOINTS = frozenset({
+    "submitOrderRequest", "getPassengerDTOs", "checkOrderInfo", "getQueueCount",
+    "confirmSingleForQueue", "queryOrderWaitTime", "resultOrderForDcQueue",
+})
+# 在控制台输出请求/响应的接口
+CAPTURE_LOG_ENDPOINTS = frozenset({"getQueueCount", "checkOrderInfo", "getPassengerDTOs"})
+
+
+class NetworkCapture:
+    """
+    page.on(...) 的事件处理集合
+    records 按请求发出顺序保存全部记录（keep_records=False 时不保存）；
+    完成（或失败）的记录同时交给 on_record 回调
+    """
+
+    def __init__(self, log: Callable = print, body_endpoints=CAPTURE_BODY_ENDPOINTS,
+                 log_endpoints=CAPTURE_LOG_ENDPOINTS, on_record: Optional[Callable[[Dict], None]] = None,
+                 keep_records: bool = True):
+        self.log = log
+        self.body_endpoints = frozenset(body_endpoints)
+        self.log_endpoints = frozenset(log_endpoints)
+        self.on_record = on_record
+        self.keep_records = keep_records
+        self.records: List[Dict] = []
+        # Playwright Request 对象 -> 记录（同一个请求在各事件里是同一个 Python 对象）
+        self._inflight: Dict[object, Dict] = {}
+        # 正在读取响应体的任务
+        self._tasks = set()
+
+    def attach(self, page) -> "NetworkCapture":
+        page.on("request", self.on_request)
+        page.on("response", self.on_response)
+        page.on("requestfinished", self.on_finished)
+        page.on("requestfailed", self.on_failed)
+        return self
+
+    @staticmethod
+    def wanted(url: str) -> bool:
+        return CAPTURE_HOST in url and CAPTURE_PATH in url
+
+    # ---------- 事件 ----------
+
+    def on_request(self, request):
+        url = request.url
+        if not self.wanted(url):
+            return
+        endpoint = endpoint_of(url)
+        record = {
+            "url": url,
+            "method": request.method,
+            "headers": dict(request.headers),
+            "post_data": request.post_data,
+            "timestamp": time.time(),
+        }
+        self._inflight[request] = record
+        if self.keep_records:
+            self.records.append(record)
+        if endpoint in self.log_endpoints:
+            self.log(f"[NETWORK] {record['method']} {url}")
+            if record["post_data"]:
+                self.log(f"[NETWORK] POST Data: {record['post_data'][:300]}")
+
+    def on_response(self, response):
+        # 只记录状态和响应头，不在这里等待响应体
+        record = self._inflight.get(response.request)
+        if record is None:
+            return
+        headers = response.headers
+        record["response"] = {
+            "status": response.status,
+            "headers": dict(headers),
+            "content_type": headers.get("content-type", ""),
+        }
+
+    def on_finished(self, request):
+        record = self._inflight.pop(request, None)
+        if record is None:
+            return
+        record["elapsed"] = time.time() - record["timestamp"]
+        endpoint = endpoint_of(record["url"])
+        resp = record.get("response")
+        if resp is not None and endpoint in self.body_endpoints:
+            # 读取响应体要和浏览器往返，放到任务里，不阻塞其它事件
+            task = asyncio.get_running_loop().create_task(self._finish_with_body(request, record, endpoint))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return
+        self._emit(record)
+
+    async def _finish_with_body(self, request, record: Dict, endpoint: str):
+        resp = record["response"]
+        await self._read_body(request, resp)
+        if endpoint in self.log_endpoints:
+            if "error" in resp:
+                self.log(f"[NETWORK] Response {resp['status']}: (无法解析)")
+            else:
+                self.log(f"[NETWORK] Response {resp['status']}: {str(resp.get('body'))[:300]}")
+        self._emit(record)
+
+    def on_failed(self, request):
+        record = self._inflight.pop(request, None)
+        if record is None:
+            return
+        record["elapsed"] = time.time() - record["timestamp"]
+        record["failure"] = request.failure
+        self._emit(record)
+
+    async def close(self):
+        """等正在读取的响应体读完，再把还没有完成的请求（页面关闭、导航中断等）也交给 on_record"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        inflight, self._inflight = self._inflight, {}
+        for record in inflight.values():
+            self._emit(record)
+
+    # ---------- 内部 ----------
+
+    async def _read_body(self, request, resp: Dict):
+        try:
+            response = await request.response()
+            if response is None:
+                return
+            if "application/json" in resp["content_type"]:
+                resp["body"] = await response.json()
+            else:
+                # 文本响应体按 CAPTURE_BODY_LIMITS 截断（JSON 在落盘时截断）
+                resp["body"] = (await response.text())[:body_limit(resp["content_type"])]
+        except Exception as e:
+            resp["error"] = str(e)
+
+    def _emit(self, record: Dict):
+        if self.on_record is not None:
+            try:
+                self.on_record(record)
+            except Exception as e:
+                self.log(f"[WARN] 处理捕获记录失败: {str(e)}")
+
+    def find_all(self, endpoint: str) -> List[Dict]:
+        return [r for r in self.records if endpoint_of(r["url"]) == endpoint]
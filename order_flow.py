@@ -2,10 +2,17 @@ import re
 import json
 import sys
 import urllib.parse
+import os
 import requests
 import urllib3
 import time
-from query import query_left_tickets, filter_by_time, filter_by_seat, _has_ticket_value
+from http_metrics import instrument_session
+from session_validity import track_session
+from order_state import OrderState, PhaseTimer, CHECKPOINT_FILE, STATE_START, STATE_DONE
+from response_decoder import decode_response, BUSINESS_FAIL, SESSION_EXPIRED
+from queue_poller import OrderQueuePoller
+from request_templates import compile_templates, js_date_str
+from query import fetch_left_tickets, trains_from_result, filter_by_time, filter_by_seat, rank_candidates
 from config import (
     BASE_URL,
     HEADERS,
@@ -18,68 +25,174 @@ from config import (
     DEFAULT_PASSENGER,
     DEFAULT_START_TIME,
     DEFAULT_END_TIME,
+    POLL_ORDER_QUEUE,
 )
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# 接口返回 messages 中出现这些关键字时，认为是当前车次/席别余票不足，可直接换下一个候选
+SOLD_OUT_KEYWORDS = ("余票不足", "无余票", "已售完", "没有足够的票", "票已售完", "席位已售完")
+
+
+def is_sold_out(res) -> bool:
+    """判断接口返回是否为余票不足类失败"""
+    if not isinstance(res, dict):
+        return False
+    data_obj = res.get("data") if isinstance(res.get("data"), dict) else {}
+    texts = list(res.get("messages") or [])
+    texts.append(data_obj.get("errMsg") or "")
+    return any(k in str(t) for t in texts for k in SOLD_OUT_KEYWORDS)
+
+
+# 限流/服务端错误时，同一步骤的重试次数与退避基数（秒）
+STEP_RETRIES = 2
+RETRY_BACKOFF = 1.0
+
+
+def _state_attr(name):
+    """把进度字段代理到 self.state，保持 flow.xxx 的读写方式不变"""
+    return property(
+        lambda self: getattr(self.state, name),
+        lambda self, value: setattr(self.state, name, value),
+    )
+
 
 class OrderFlow:
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update(HEADERS)
-        self.session.cookies.update(INITIAL_COOKIES)
-        self.session.verify = False
-        self.repeat_token = ""
-        self.ticket_info = None
+    # 下单进度统一保存在 OrderState 中（可写入检查点），这里只是代理
+    ticket_info = _state_attr("ticket_info")
+    selected_train = _state_attr("selected_train")
+    selected_seat_name = _state_attr("selected_seat_name")
+    selected_passenger = _state_attr("selected_passenger")
+    # 排好序的候选（车次 + 席别），以及当前使用的候选下标
+    candidates = _state_attr("candidates")
+    candidate_index = _state_attr("candidate_index")
+    # 乘车人列表与 token 无关，换候选时直接复用
+    passengers = _state_attr("passengers")
+
+    def __init__(self, state: OrderState = None):
+        session = requests.Session()
+        session.headers.update(HEADERS)
+        session.cookies.update(INITIAL_COOKIES)
+        session.verify = False
+        self.session = session
+        self.state = state or OrderState()
         self.ticket_info_raw = None
         self.init_html = None
-        self.selected_train = None
-        self.selected_seat_name = None
-        self.selected_passenger = None
+        # 最近一次失败是否因为余票不足（用于决定是否切换候选）
+        self.last_sold_out = False
+        # 最近一次接口调用的解码结果（重试逻辑按类别处理）
+        self.last_result = None
+        # 各步骤内解析/等待/日志耗时（演练模式输出瀑布图）
+        self.phases = PhaseTimer()
+        # 本次 run 开始时 state.history 的长度（之前的记录来自检查点，不计入本次耗时分解）
+        self.run_history_start = 0
+        # 下单接口请求模板；有捕获日志时可替换为 compile_templates(network_log)
+        self.templates = compile_templates()
         # 不再尝试显示票价，只记录席别
 
+    @property
+    def session(self):
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        # 外部替换 session（如加载了 Cookie 的 session）时同样挂上耗时统计与登录状态跟踪
+        self._session = session
+        self.metrics = instrument_session(session)
+        self.validity = track_session(session)
+
+    @property
+    def repeat_token(self):
+        return self.state.repeat_token
+
+    @repeat_token.setter
+    def repeat_token(self, token):
+        self.state.set_token(token)
+
+    @classmethod
+    def from_checkpoint(cls, path: str = CHECKPOINT_FILE):
+        """从检查点恢复；没有检查点时返回全新的流程"""
+        state = OrderState.load(path)
+        return cls(state)
+
     def log(self, msg):
-        try:
-            print(msg)
-        except UnicodeEncodeError:
-            # Windows 控制台可能是 GBK，直接 print 会炸；用 utf-8 写入 buffer 避免崩溃
+        with self.phases.measure("log"):
             try:
-                sys.stdout.buffer.write((str(msg) + "\n").encode("utf-8", errors="backslashreplace"))
-                sys.stdout.buffer.flush()
-            except Exception:
-                pass
+                print(msg)
+            except UnicodeEncodeError:
+                # Windows 控制台可能是 GBK，直接 print 会炸；用 utf-8 写入 buffer 避免崩溃
+                try:
+                    sys.stdout.buffer.write((str(msg) + "\n").encode("utf-8", errors="backslashreplace"))
+                    sys.stdout.buffer.flush()
+                except Exception:
+                    pass
+
+    def _pace(self, seconds: float):
+        """步骤之间的节奏等待（计入 pace 耗时）"""
+        with self.phases.measure("pace"):
+            time.sleep(seconds)
+
+    def _decode(self, resp, name: str, expect: str = "json"):
+        """解码并归类响应；失败时统一打日志，余票不足时设置 last_sold_out"""
+        with self.phases.measure("parse"):
+            dec = decode_response(resp, expect)
+        self.last_result = dec
+        if not dec.ok:
+            self.last_sold_out = dec.kind == BUSINESS_FAIL and is_sold_out(dec.data)
+            self.log(f"[FAIL] {name} {dec.describe()}")
+        return dec
 
     def query_and_pick(self, start_time="07:00", end_time="20:00"):
         self.log(f"[STEP] 查询 {TRAVEL_DATE} {FROM_STATION_NAME}({FROM_STATION})->{TO_STATION_NAME}({TO_STATION}) 车次")
-        trains = query_left_tickets(self.session, TRAVEL_DATE, FROM_STATION, TO_STATION)
+        dec = fetch_left_tickets(self.session, TRAVEL_DATE, FROM_STATION, TO_STATION)
+        self.last_result = dec
+        if not dec.ok:
+            self.log(f"[FAIL] 查询失败 {dec.describe()[:300]}")
+            return None
+        # 解析与过滤一次算完，日志放在后面输出（不计入 parse 耗时）
+        with self.phases.measure("parse"):
+            trains = trains_from_result(dec.data)
+            filtered = filter_by_time(trains, start_time, end_time)
+            seat_filtered = filter_by_seat(filtered, allow_second=True, allow_no_seat=True)
+            candidates = rank_candidates(seat_filtered, allow_second=True, allow_no_seat=True)
         if not trains:
             self.log("[FAIL] 查询结果为空")
             return None
-        filtered = filter_by_time(trains, start_time, end_time)
         self.log(f"[INFO] 过滤出 {len(filtered)} 个车次，时间段 {start_time}-{end_time}")
         if not filtered:
             return None
-        seat_filtered = filter_by_seat(filtered, allow_second=True, allow_no_seat=True)
         self.log(f"[INFO] 仅保留二等座或无座有票：{len(seat_filtered)} 个车次")
         if not seat_filtered:
             self.log("[WARN] 时间段内无符合（二等座/无座有票）的车次")
             return None
-        # 选第一个
-        pick = seat_filtered[0]
+        self.candidates = candidates
+        self.candidate_index = -1
+        self.log(f"[INFO] 候选（车次+席别）共 {len(self.candidates)} 个，按席别/余票/出发时间排序")
+        return self.next_candidate()
+
+    def next_candidate(self):
+        """切换到下一个候选，返回对应车次；没有更多候选时返回 None"""
+        self.candidate_index += 1
+        if self.candidate_index >= len(self.candidates):
+            self.selected_train = None
+            self.selected_seat_name = None
+            return None
+        cand = self.candidates[self.candidate_index]
+        # 换车次后旧 token 对应的是上一个车次的确认页，不能再用
+        self.state.invalidate_token()
+        pick = cand["train"]
         self.selected_train = pick
-        # 席别选择策略：优先二等座，其次无座（都满足“有票”才会进入 seat_filtered）
-        if _has_ticket_value(pick.get("second")):
-            self.selected_seat_name = "二等座"
-        else:
-            self.selected_seat_name = "无座"
+        self.selected_seat_name = cand["seat_name"]
         self.log(
-            f"[PICK] {pick['train_code']} {pick['start']}->{pick['arrive']} "
+            f"[PICK] ({self.candidate_index + 1}/{len(self.candidates)}) "
+            f"{pick['train_code']} {pick['start']}->{pick['arrive']} 席别:{cand['seat_name']} "
             f"二等:{pick['second']} 无座:{pick['no_seat']} 一等:{pick['first']}"
         )
         return pick
 
     def submit_order(self, train):
         self.log("[STEP] 提交下单请求(不支付)")
+        self.last_sold_out = False
         url = f"{BASE_URL}/otn/leftTicket/submitOrderRequest"
         data = {
             "secretStr": urllib.parse.unquote(train["secret_str"]),
@@ -92,19 +205,10 @@ class OrderFlow:
             "cancel_flag": "2",
         }
         resp = self.session.post(url, data=data, timeout=10, verify=False)
-        if resp.status_code != 200:
-            self.log(f"[FAIL] submitOrderRequest 状态码 {resp.status_code}")
-            return False
-        try:
-            res = resp.json()
-        except Exception:
-            self.log(f"[FAIL] submitOrderRequest 非JSON: {resp.text[:200]}")
-            return False
-        if not res.get("status"):
-            self.log(f"[FAIL] submitOrderRequest 返回失败: {res}")
+        if not self._decode(resp, "submitOrderRequest").ok:
             return False
         self.log("[OK] submitOrderRequest 成功")
-        time.sleep(1.5)  # 放慢节奏，避免风控
+        self._pace(1.5)  # 放慢节奏，避免风控
         return True
 
     def init_dc(self):
@@ -117,10 +221,10 @@ class OrderFlow:
             "X-Requested-With": "XMLHttpRequest",
         }
         resp = self.session.post(url, data={"_json_att": ""}, headers=headers, timeout=10, verify=False)
-        if resp.status_code != 200:
-            self.log(f"[FAIL] initDc 状态码 {resp.status_code}")
+        dec = self._decode(resp, "initDc", expect="html")
+        if not dec.ok:
             return False
-        html = resp.text
+        html = dec.data
         # 保存一份页面，便于排查字段（不会包含提交订单动作）
         try:
             with open("confirm_initDc.html", "w", encoding="utf-8") as f:
@@ -129,10 +233,10 @@ class OrderFlow:
         except Exception:
             pass
         self.init_html = html
-        # 解析确认页面中的 ticketInfoForPassengerForm（包含席别与票价等信息）
-        self.ticket_info, self.ticket_info_raw = self._parse_ticket_info_from_html(html)
-
-        m = re.search(r"globalRepeatSubmitToken\s*=\s*'([0-9a-zA-Z]+)'", html)
+        with self.phases.measure("parse"):
+            # 解析确认页面中的 ticketInfoForPassengerForm（包含席别与票价等信息）
+            self.ticket_info, self.ticket_info_raw = self._parse_ticket_info_from_html(html)
+            m = re.search(r"globalRepeatSubmitToken\s*=\s*'([0-9a-zA-Z]+)'", html)
         if not m:
             self.log("[FAIL] 未找到 repeat submit token")
             return False
@@ -145,7 +249,7 @@ class OrderFlow:
                 f"席别:{self.selected_seat_name}"
             )
         self.log(f"[OK] 获取 token: {self.repeat_token}")
-        time.sleep(1.0)  # 放慢节奏
+        self._pace(1.0)  # 放慢节奏
         return True
 
     def _parse_ticket_info_from_html(self, html: str):
@@ -229,147 +333,123 @@ class OrderFlow:
 
     def get_passengers(self):
         self.log("[STEP] 获取乘车人列表")
-        url = f"{BASE_URL}/otn/confirmPassenger/getPassengerDTOs"
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-            "Origin": "https://kyfw.12306.cn",
-            "Referer": "https://kyfw.12306.cn/otn/confirmPassenger/initDc",
-            "X-Requested-With": "XMLHttpRequest",
-        }
-        resp = self.session.post(
-            url,
-            data={"_json_att": "", "REPEAT_SUBMIT_TOKEN": self.repeat_token},
-            headers=headers,
-            timeout=10,
-            verify=False,
-        )
-        try:
-            res = resp.json()
-        except Exception:
-            self.log(f"[FAIL] getPassengerDTOs 非JSON: {resp.text[:200]}")
+        resp = self.templates["getPassengerDTOs"].send(self.session, REPEAT_SUBMIT_TOKEN=self.repeat_token)
+        dec = self._decode(resp, "getPassengerDTOs")
+        if not dec.ok:
             return []
-        passengers = res.get("data", {}).get("normal_passengers") or []
+        passengers = (dec.data.get("data") or {}).get("normal_passengers") or []
         self.log(f"[OK] 乘车人数量: {len(passengers)}")
-        time.sleep(0.8)  # 放慢节奏
+        if passengers:
+            self.passengers = passengers
+        self._pace(0.8)  # 放慢节奏
         return passengers
 
+    def select_passenger(self, name: str):
+        """按姓名选择乘车人；乘车人列表已缓存时不再请求 getPassengerDTOs"""
+        passengers = self.passengers or self.get_passengers()
+        if not passengers:
+            self.log("[WARN] 未拿到乘车人列表")
+            return None
+        target = next((p for p in passengers if p.get("passenger_name") == name), None)
+        if not target:
+            self.log(f"[WARN] 未找到 {name}，可选乘车人: {[p.get('passenger_name') for p in passengers]}")
+            return None
+        self.log(f"[OK] 找到乘车人: {name}")
+        self.selected_passenger = target
+        return target
+
+    def build_passenger_strs(self):
+        """按当前席别与乘车人构造 passengerTicketStr / oldPassengerStr（成人票）"""
+        seat_code = "O" if self.selected_seat_name == "二等座" else "WZ"
+        ticket_type = "1"  # 成人
+        passenger_flag = "N"
+        p = self.selected_passenger or {}
+        passenger_ticket_str = ",".join([
+            seat_code,
+            "0",
+            ticket_type,
+            p.get("passenger_name", ""),
+            p.get("passenger_id_type_code", ""),
+            p.get("passenger_id_no", ""),
+            p.get("mobile_no", ""),
+            passenger_flag
+        ])
+        # oldPassengerStr: name,id_type,id_no,passenger_type_
+        old_passenger_str = ",".join([
+            p.get("passenger_name", ""),
+            p.get("passenger_id_type_code", ""),
+            p.get("passenger_id_no", ""),
+            p.get("passenger_type", "1")
+        ]) + "_"
+        return passenger_ticket_str, old_passenger_str
+
     def check_order_info(self, passenger_ticket_str: str, old_passenger_str: str):
         self.log("[STEP] 校验订单 checkOrderInfo")
-        url = f"{BASE_URL}/otn/confirmPassenger/checkOrderInfo"
-        data = {
-            "cancel_flag": "2",
-            "bed_level_order_num": "000000000000000000000000000000",
-            "passengerTicketStr": passenger_ticket_str,
-            "oldPassengerStr": old_passenger_str,
-            "tour_flag": "dc",
-            "randCode": "",
-            "whatsSelect": "1",
-            "_json_att": "",
-            "REPEAT_SUBMIT_TOKEN": self.repeat_token,
-        }
-        # 使用完整的浏览器 headers
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-            "Origin": "https://kyfw.12306.cn",
-            "Referer": "https://kyfw.12306.cn/otn/confirmPassenger/initDc",
-            "X-Requested-With": "XMLHttpRequest",
-        }
-        resp = self.session.post(url, data=data, headers=headers, timeout=10, verify=False)
-        try:
-            res = resp.json()
-        except Exception:
-            self.log(f"[FAIL] checkOrderInfo 非JSON: {resp.text[:200]}")
+        self.last_sold_out = False
+        resp = self.templates["checkOrderInfo"].send(
+            self.session,
+            passengerTicketStr=passenger_ticket_str,
+            oldPassengerStr=old_passenger_str,
+            REPEAT_SUBMIT_TOKEN=self.repeat_token,
+        )
+        dec = self._decode(resp, "checkOrderInfo")
+        if not dec.ok:
             return False
-        if not res.get("status"):
-            self.log(f"[FAIL] checkOrderInfo 返回失败: {res}")
+        if (dec.data.get("data") or {}).get("submitStatus") is False:
+            self.last_sold_out = is_sold_out(dec.data)
+            self.log(f"[FAIL] checkOrderInfo 返回失败: {dec.data}")
             return False
         self.log("[OK] checkOrderInfo 通过")
-        time.sleep(1.0)  # 放慢节奏
+        self._pace(1.0)  # 放慢节奏
         return True
 
     def get_queue_count(self):
         self.log("[STEP] 获取排队信息 getQueueCount")
-        url = f"{BASE_URL}/otn/confirmPassenger/getQueueCount"
         ti = self.ticket_info or {}
-        train_date = ti.get("queryLeftTicketRequestDTO", {}).get("train_date") or TRAVEL_DATE
-        data = {
-            "train_date": train_date,  # 12306期望格式为 GMT 字符串，但这里先用原值；若失败将直接返回错误
-            "train_no": ti.get("queryLeftTicketRequestDTO", {}).get("train_no", ""),
-            "stationTrainCode": ti.get("queryLeftTicketRequestDTO", {}).get("station_train_code", ""),
-            "seatType": "O" if self.selected_seat_name == "二等座" else "WZ",
-            "fromStationTelecode": ti.get("queryLeftTicketRequestDTO", {}).get("from_station", ""),
-            "toStationTelecode": ti.get("queryLeftTicketRequestDTO", {}).get("to_station", ""),
-            "leftTicket": ti.get("leftTicketStr", ""),
-            "purpose_codes": ti.get("purpose_codes", "00"),
-            "train_location": ti.get("train_location", ""),
-            "_json_att": "",
-            "REPEAT_SUBMIT_TOKEN": self.repeat_token,
-        }
-        
-        # 完全模拟浏览器请求：设置完整的 headers
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Accept": "application/json, text/javascript, */*; q=0.01",
-            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-            "Accept-Encoding": "gzip, deflate, br",
-            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-            "Origin": "https://kyfw.12306.cn",
-            "Referer": "https://kyfw.12306.cn/otn/confirmPassenger/initDc",
-            "X-Requested-With": "XMLHttpRequest",
-            "Connection": "keep-alive",
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-origin",
-        }
-        
-        # 使用独立的请求，确保 headers 正确
-        resp = self.session.post(url, data=data, headers=headers, timeout=10, verify=False)
-        try:
-            res = resp.json()
-        except Exception:
-            self.log(f"[FAIL] getQueueCount 非JSON: {resp.text[:200]}")
-            return False
-        if not res.get("status"):
-            self.log(f"[FAIL] getQueueCount 返回失败: {res}")
+        dto = ti.get("queryLeftTicketRequestDTO", {})
+        train_date = dto.get("train_date") or TRAVEL_DATE
+        # 固定请求头/字段已在模板中编码好，这里只填动态字段
+        resp = self.templates["getQueueCount"].send(
+            self.session,
+            train_date=js_date_str(train_date),
+            train_no=dto.get("train_no", ""),
+            stationTrainCode=dto.get("station_train_code", ""),
+            seatType="O" if self.selected_seat_name == "二等座" else "WZ",
+            fromStationTelecode=dto.get("from_station", ""),
+            toStationTelecode=dto.get("to_station", ""),
+            leftTicket=ti.get("leftTicketStr", ""),
+            purpose_codes=ti.get("purpose_codes", "00"),
+            train_location=ti.get("train_location", ""),
+            REPEAT_SUBMIT_TOKEN=self.repeat_token,
+        )
+        dec = self._decode(resp, "getQueueCount")
+        if not dec.ok:
             return False
-        self.log(f"[OK] getQueueCount result: {res.get('data')}")
-        time.sleep(1.0)  # 放慢节奏
+        self.log(f"[OK] getQueueCount result: {dec.data.get('data')}")
+        self._pace(1.0)  # 放慢节奏
         return True
 
     def confirm_single_for_queue(self, passenger_ticket_str: str, old_passenger_str: str):
         self.log("[STEP] 提交排队确认 confirmSingleForQueue（将生成待支付订单）")
-        url = f"{BASE_URL}/otn/confirmPassenger/confirmSingleForQueue"
         ti = self.ticket_info or {}
-        data = {
-            "passengerTicketStr": passenger_ticket_str,
-            "oldPassengerStr": old_passenger_str,
-            "randCode": "",
-            "purpose_codes": ti.get("purpose_codes", "00"),
-            "key_check_isChange": ti.get("key_check_isChange", ""),
-            "leftTicketStr": ti.get("leftTicketStr", ""),
-            "train_location": ti.get("train_location", ""),
-            "choose_seats": "",
-            "seatDetailType": "000",
-            "whatsSelect": "1",
-            "roomType": "00",
-            "dwAll": "N",
-            "_json_att": "",
-            "REPEAT_SUBMIT_TOKEN": self.repeat_token,
-        }
-        resp = self.session.post(url, data=data, timeout=10, verify=False)
-        try:
-            res = resp.json()
-        except Exception:
-            self.log(f"[FAIL] confirmSingleForQueue 非JSON: {resp.text[:200]}")
-            return False
+        resp = self.templates["confirmSingleForQueue"].send(
+            self.session,
+            passengerTicketStr=passenger_ticket_str,
+            oldPassengerStr=old_passenger_str,
+            purpose_codes=ti.get("purpose_codes", "00"),
+            key_check_isChange=ti.get("key_check_isChange", ""),
+            leftTicketStr=ti.get("leftTicketStr", ""),
+            train_location=ti.get("train_location", ""),
+            REPEAT_SUBMIT_TOKEN=self.repeat_token,
+        )
 
         # 第一层：HTTP/接口状态
-        if not res.get("status"):
-            self.log(f"[FAIL] confirmSingleForQueue 接口返回失败: {res}")
+        dec = self._decode(resp, "confirmSingleForQueue")
+        if not dec.ok:
             return False
 
         # 第二层：业务状态 data.submitStatus（是否真正生成待支付订单）
-        data_obj = res.get("data") or {}
+        data_obj = dec.data.get("data") or {}
         submit_status = data_obj.get("submitStatus")
         err_msg = data_obj.get("errMsg") or data_obj.get("err_msg") or ""
         order_id = data_obj.get("orderId") or data_obj.get("order_id")
@@ -390,6 +470,15 @@ class OrderFlow:
 
         return True
 
+    def wait_for_order(self, timeout: float = 300):
+        """confirmSingleForQueue 之后轮询排队结果，返回 orderId（失败/超时返回 None）"""
+        poller = OrderQueuePoller(self.session, self.repeat_token, base_url=BASE_URL, timeout=timeout)
+        order_id = poller.poll()
+        if order_id is None and poller.last_result is not None:
+            self.last_result = poller.last_result
+        poller.print_breakdown(self.state.history[self.run_history_start:])
+        return order_id
+
     def get_order_info(self):
         """
         获取确认页的订单信息（包含席别/票价等），仅用于日志展示，不会提交订单。
@@ -402,77 +491,131 @@ class OrderFlow:
             timeout=10,
             verify=False,
         )
-        try:
-            res = resp.json()
-        except Exception:
-            # 保存原始响应便于排查（可能被重定向到 error.html 或返回空）
-            try:
-                with open("getOrderInfo_response.bin", "wb") as f:
-                    f.write(resp.content or b"")
-                self.log("[FAIL] getOrderInfo 非JSON，已保存: getOrderInfo_response.bin")
-            except Exception:
-                self.log("[FAIL] getOrderInfo 非JSON（且保存失败）")
-            return None
-        if not res.get("status"):
-            self.log(f"[FAIL] getOrderInfo 返回失败: {res}")
+        dec = self._decode(resp, "getOrderInfo")
+        if not dec.ok:
+            if dec.kind != BUSINESS_FAIL:
+                # 保存原始响应便于排查（可能被重定向到 error.html 或返回空）
+                try:
+                    with open("getOrderInfo_response.bin", "wb") as f:
+                        f.write(resp.content or b"")
+                    self.log("[INFO] 已保存原始响应: getOrderInfo_response.bin")
+                except Exception:
+                    pass
             return None
-        data = res.get("data") or {}
+        data = dec.data.get("data") or {}
         return data
 
+    def _run_step(self, step: str, passenger_name: str, start_time: str, end_time: str, limit: str):
+        if step == "query":
+            return self.query_and_pick(start_time, end_time) is not None
+        if step == "submit":
+            return self.submit_order(self.selected_train)
+        if step == "init_dc":
+            return self.init_dc()
+        if step == "passenger":
+            return self.select_passenger(passenger_name) is not None
+        if step == "check_order":
+            return self.check_order_info(*self.build_passenger_strs())
+        if step == "queue_count":
+            ok = self.get_queue_count()
+            if not ok and limit != "queue_count":
+                self.log("[WARN] getQueueCount 失败，尝试继续提交")
+                return True
+            return ok
+        if step == "confirm":
+            return self.confirm_single_for_queue(*self.build_passenger_strs())
+        raise ValueError(f"未知步骤: {step}")
+
+    def run(self, passenger_name: str = DEFAULT_PASSENGER, start_time: str = DEFAULT_START_TIME,
+            end_time: str = DEFAULT_END_TIME, stop_after: str = "confirm", checkpoint: str = None):
+        """
+        按状态机执行下单流程，从第一个失效的步骤开始（车次仍有效则不重新查询，token 未过期则不重跑 initDc）。
+        stop_after: 执行完该步骤后停止（如 "queue_count" 表示不提交排队确认）；
+            恢复出的步骤已在 stop_after 之后时不再执行任何步骤
+        checkpoint: 检查点文件路径，每次状态迁移后写入；流程全部完成或已执行到 stop_after 后删除
+            （只执行到某一步的流程失败时，检查点记下 stop_after，从它恢复的 run 同样不会越过该步骤）
+        返回 True 表示已执行到 stop_after
+        """
+        st = self.state
+        self.run_history_start = len(st.history)
+        limit = st.limit(stop_after)
+        if limit != stop_after:
+            self.log(f"[WARN] 检查点来自只执行到 {limit} 的流程，本次同样在 {limit} 后停止")
+        st.stop_after = limit if limit != STATE_DONE else None
+        step = st.resume_step()
+        if step and st.state != STATE_START:
+            self.log(f"[INFO] 从检查点恢复：已完成 {st.state}，从 {step} 继续")
+        retries = 0
+        while step:
+            if st.past(step, limit):
+                self.log(f"[INFO] 已完成 {limit}，不执行 {step}")
+                break
+            st.begin(step)
+            self.last_result = None
+            self.phases.enter(step)
+            try:
+                ok = self._run_step(step, passenger_name, start_time, end_time, limit)
+            finally:
+                self.phases.leave()
+            if not ok:
+                dec = self.last_result
+                # 限流/服务端错误：退避后原地重试当前步骤
+                if dec is not None and dec.retryable and retries < STEP_RETRIES:
+                    retries += 1
+                    delay = RETRY_BACKOFF * retries
+                    self.log(f"[INFO] {step} 失败（{dec.kind}），{delay:.1f}s 后第 {retries} 次重试")
+                    self._pace(delay)
+                    continue
+                # 登录失效：重试没有意义，交给调用方重新登录
+                if dec is not None and dec.kind == SESSION_EXPIRED:
+                    if checkpoint:
+                        st.save(checkpoint)
+                    self.log("[FAIL] 登录已失效，需要重新登录后再继续")
+                    return False
+                # 余票不足：换下一个候选，从 submit 重新开始（复用 session 与乘车人）
+                if step in ("submit", "check_order") and self.last_sold_out and self.next_candidate():
+                    self.log("[INFO] 余票不足，切换下一个候选")
+                    st.rewind("submit")
+                    if checkpoint:
+                        st.save(checkpoint)
+                    step = "submit"
+                    continue
+                if checkpoint:
+                    st.save(checkpoint)
+                self.log(f"[FAIL] 步骤 {step} 失败，已记录进度（当前状态: {st.state}）")
+                return False
+            retries = 0
+            st.advance(step)
+            if checkpoint:
+                st.save(checkpoint)
+            if step == limit:
+                break
+            step = st.resume_step()
+        self.log("[INFO] 各步骤耗时:\n" + st.timing_summary())
+        # 已执行到 stop_after：之后的步骤不属于本次 run，不留下可恢复的检查点（避免下一次 run 直接 confirm）
+        st.stop_after = None
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        return True
+
 
 def main():
-    flow = OrderFlow()
-    train = flow.query_and_pick(DEFAULT_START_TIME, DEFAULT_END_TIME)
-    if not train:
-        return
-    if not flow.submit_order(train):
-        return
-    if not flow.init_dc():
-        return
-    # 不再调用 getOrderInfo / 票价接口，只记录席别与乘车人
-    passengers = flow.get_passengers()
-    if not passengers:
-        flow.log("[WARN] 未拿到乘车人列表")
-        return
-    default_name = DEFAULT_PASSENGER
-    target = next((p for p in passengers if p.get("passenger_name") == default_name), None)
-    if target:
-        flow.log(f"[OK] 找到默认乘车人: {default_name}")
-        flow.selected_passenger = target
-    else:
-        flow.log(f"[WARN] 未找到 {default_name}，可选乘车人: {[p.get('passenger_name') for p in passengers]}")
-        return
-
-    # 构造乘车人字符串（成人票，seat_type: 二等/O 或 无座/WZ）
-    seat_code = "O" if flow.selected_seat_name == "二等座" else "WZ"
-    ticket_type = "1"  # 成人
-    passenger_flag = "N"
-    p = flow.selected_passenger
-    passenger_ticket_str = ",".join([
-        seat_code,
-        "0",
-        ticket_type,
-        p.get("passenger_name", ""),
-        p.get("passenger_id_type_code", ""),
-        p.get("passenger_id_no", ""),
-        p.get("mobile_no", ""),
-        passenger_flag
-    ])
-    # oldPassengerStr: name,id_type,id_no,passenger_type_
-    old_passenger_str = ",".join([
-        p.get("passenger_name", ""),
-        p.get("passenger_id_type_code", ""),
-        p.get("passenger_id_no", ""),
-        p.get("passenger_type", "1")
-    ]) + "_"
-
-    if not flow.check_order_info(passenger_ticket_str, old_passenger_str):
-        return
-    if not flow.get_queue_count():
-        flow.log("[WARN] getQueueCount 失败，尝试继续提交")
-    if not flow.confirm_single_for_queue(passenger_ticket_str, old_passenger_str):
-        return
-    flow.log("[STOP] 已提交生成待支付订单，请在手机端付款/取消")
+    # 有检查点时从上次中断的地方继续，失败后同样按检查点重试
+    flow = OrderFlow.from_checkpoint(CHECKPOINT_FILE)
+    try:
+        for attempt in range(3):
+            if attempt:
+                flow.log(f"[INFO] 第 {attempt + 1} 次尝试")
+            if flow.run(DEFAULT_PASSENGER, DEFAULT_START_TIME, DEFAULT_END_TIME, checkpoint=CHECKPOINT_FILE):
+                if POLL_ORDER_QUEUE:
+                    flow.wait_for_order()
+                flow.log("[STOP] 已提交生成待支付订单，请在手机端付款/取消")
+                return
+            if flow.last_result is not None and flow.last_result.kind == SESSION_EXPIRED:
+                break
+    finally:
+        flow.metrics.print_summary()
+        flow.log(f"[INFO] 已导出请求耗时统计: {flow.metrics.export_json()}")
 
 
 if __name__ == "__main__":
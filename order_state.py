@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+下单流程状态机：记录 OrderFlow 的进度，支持保存/加载检查点，失败后从第一个失效的步骤继续
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# 步骤顺序：state 记录的是“最近完成的步骤”
+STEPS = [
+    "query",         # 查询并选定候选车次
+    "submit",        # submitOrderRequest
+    "init_dc",       # 进入确认页，拿到 REPEAT_SUBMIT_TOKEN
+    "passenger",     # 选定乘车人
+    "check_order",   # checkOrderInfo
+    "queue_count",   # getQueueCount
+    "confirm",       # confirmSingleForQueue
+]
+STATE_START = "start"
+STATE_DONE = "confirm"
+
+# 查询结果（secretStr）的有效期，超过后必须重新查询
+TRAIN_TTL = 300
+# REPEAT_SUBMIT_TOKEN 的有效期，超过后需要重新 submitOrderRequest + initDc
+TOKEN_TTL = 600
+
+CHECKPOINT_FILE = "order_checkpoint.json"
+# 检查点中保留的状态迁移记录条数（反复重试/恢复时 history 会一直增长，只保留最近的）
+HISTORY_LIMIT = 50
+
+
+class OrderState:
+    """下单进度（可序列化为检查点文件）"""
+
+    def __init__(self):
+        self.state = STATE_START
+        self.repeat_token = ""
+        self.token_time = 0.0
+        self.ticket_info = None
+        self.selected_train = None
+        self.selected_seat_name = None
+        self.selected_passenger = None
+        self.candidates = []
+        self.candidate_index = -1
+        self.passengers = None
+        self.query_time = 0.0
+        # 写入检查点的那次 run 的 stop_after（只执行到某一步的流程，如演练）；
+        # 从这样的检查点恢复时不会越过该步骤，正常跑到 stop_after 后清空
+        self.stop_after = None
+        # 每次状态迁移：{"from", "to", "elapsed", "at"}
+        self.history = []
+        self._step_start = None
+
+    # ---------- 状态迁移 ----------
+
+    def begin(self, step: str):
+        """开始执行某个步骤（用于计时）"""
+        self._step_start = (step, time.perf_counter())
+
+    def advance(self, step: str):
+        """步骤完成，迁移到 step 状态并记录耗时"""
+        if step not in STEPS:
+            raise ValueError(f"未知步骤: {step}")
+        elapsed = 0.0
+        if self._step_start and self._step_start[0] == step:
+            elapsed = time.perf_counter() - self._step_start[1]
+        self._step_start = None
+        self.history.append({
+            "from": self.state,
+            "to": step,
+            "elapsed": round(elapsed, 4),
+            "at": time.time(),
+        })
+        self.state = step
+        if step == "query":
+            self.query_time = time.time()
+
+    def rewind(self, step: str):
+        """回退到 step 之前（step 需要重新执行）"""
+        idx = STEPS.index(step)
+        self.state = STEPS[idx - 1] if idx > 0 else STATE_START
+
+    def set_token(self, token: str):
+        self.repeat_token = token or ""
+        self.token_time = time.time() if token else 0.0
+
+    def invalidate_token(self):
+        """token 被服务端判定失效时调用，下次从 submit 重新开始"""
+        self.repeat_token = ""
+        self.token_time = 0.0
+
+    # ---------- 有效性判断 ----------
+
+    def done(self, step: str) -> bool:
+        if self.state == STATE_START:
+            return False
+        return STEPS.index(self.state) >= STEPS.index(step)
+
+    def train_valid(self) -> bool:
+        return bool(self.selected_train) and time.time() - self.query_time < TRAIN_TTL
+
+    def token_valid(self) -> bool:
+        return bool(self.repeat_token) and time.time() - self.token_time < TOKEN_TTL
+
+    def limit(self, stop_after: str) -> str:
+        """本次 run 实际的终点：检查点限定的步骤更早时以检查点为准"""
+        if self.stop_after in STEPS and STEPS.index(self.stop_after) < STEPS.index(stop_after):
+            return self.stop_after
+        return stop_after
+
+    def past(self, step: str, stop_after: str) -> bool:
+        """step 是否在 stop_after 之后（不应在本次 run 中执行）"""
+        return STEPS.index(step) > STEPS.index(stop_after)
+
+    def resume_step(self) -> Optional[str]:
+        """
+        返回重试时应该从哪个步骤开始（第一个失效的步骤）；流程已完成时返回 None
+        - 车次失效 -> query
+        - token 失效 -> submit（initDc 依赖同一次 submitOrderRequest，不能单独重跑）
+        - 否则从最近完成步骤的下一步继续
+        """
+        if self.state == STATE_DONE:
+            return None
+        if not self.train_valid():
+            return "query"
+        if self.done("init_dc") and not self.token_valid():
+            return "submit"
+        if self.state == STATE_START:
+            return "query"
+        return STEPS[STEPS.index(self.state) + 1]
+
+    # ---------- 检查点 ----------
+
+    def to_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "repeat_token": self.repeat_token,
+            "token_time": self.token_time,
+            "ticket_info": self.ticket_info,
+            "selected_train": self.selected_train,
+            "selected_seat_name": self.selected_seat_name,
+            "selected_passenger": self.selected_passenger,
+            "candidates": self.candidates,
+            "candidate_index": self.candidate_index,
+            "passengers": self.passengers,
+            "query_time": self.query_time,
+            "stop_after": self.stop_after,
+            "history": self.history[-HISTORY_LIMIT:],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "OrderState":
+        st = cls()
+        for key, value in data.items():
+            if hasattr(st, key) and not key.startswith("_"):
+                setattr(st, key, value)
+        # score 在 JSON 中会变成列表，这里不需要还原为元组（只用于排序展示）
+        return st
+
+    def save(self, path: str = CHECKPOINT_FILE):
+        """写入检查点（先写临时文件再替换，避免中断时留下半个文件）"""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = CHECKPOINT_FILE) -> Optional["OrderState"]:
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except Exception as e:
+            print(f"[WARN] 加载检查点失败: {str(e)}")
+            return None
+
+    def timing_summary(self) -> str:
+        """各步骤耗时汇总（按迁移顺序）"""
+        lines = []
+        for h in self.history:
+            lines.append(f"  {h['from']:>12} -> {h['to']:<12} {h['elapsed'] * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+
+# 演练模式瀑布图中的耗时分类（network 由 http_metrics 按接口统计，其余由 PhaseTimer 记录）
+PHASES = ("network", "parse", "pace", "log")
+
+
+class PhaseTimer:
+    """按步骤累计解析、节奏等待（sleep）、日志输出的耗时，包含失败重试的每一次尝试"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.current = None
+        self._entered = None
+        # step -> {"start": 相对 origin 的秒数, "wall": 累计秒数, "attempts": 次数, phase: 秒数}
+        self.steps = {}
+
+    def enter(self, step: str):
+        now = time.perf_counter()
+        row = self.steps.get(step)
+        if row is None:
+            row = self.steps[step] = {"start": now - self.origin, "wall": 0.0, "attempts": 0}
+        row["attempts"] += 1
+        self.current = step
+        self._entered = now
+
+    def leave(self):
+        if self.current is None:
+            return
+        self.steps[self.current]["wall"] += time.perf_counter() - self._entered
+        self.current = None
+        self._entered = None
+
+    def add(self, phase: str, seconds: float):
+        """记到当前步骤；不在任何步骤内（如流程结束后的汇总日志）时忽略"""
+        if self.current is None:
+            return
+        row = self.steps[self.current]
+        row[phase] = row.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def measure(self, phase: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - t0)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+按条件等待：代替 playwright_flow 里点击前后的固定 time.sleep
+- response：执行一个动作（点击等），等页面因此发出的某个接口的响应
+- selector：等元素达到某个状态（visible / attached / hidden）
+- url：等页面地址变为某个模式
+- load_state：等页面加载状态
+每个等待都有上限，超时不抛异常而是返回 None / False，由调用方决定怎么处理；
+每次等待的实际耗时都会记录下来，流程结束时 print_summary 输出（看哪一步最慢，超时的标出来）
+用于 async Playwright：各等待方法都是协程，response 的 action 为协程函数
+"""
+import re
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+from playwright.async_api import TimeoutError as PWTimeout
+
+# 默认等待上限（毫秒）
+DEFAULT_TIMEOUT = 10000
+
+
+def _log(msg):
+    try:
+        print(msg)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((str(msg) + "\n").encode("utf-8", errors="backslashreplace"))
+        sys.stdout.buffer.flush()
+
+
+def response_matcher(target: Union[str, "re.Pattern", Callable]) -> Callable:
+    """接口名 / URL 子串、正则或函数 -> response 判断函数（3xx 跳转本身不算）"""
+    if callable(target):
+        return target
+    if isinstance(target, str):
+        return lambda r: target in r.url and not 300 <= r.status < 400
+    return lambda r: bool(target.search(r.url)) and not 300 <= r.status < 400
+
+
+class PageWaiter:
+    """
+    一个页面上的按条件等待，records 按顺序保存每次等待：
+    {"label": 说明, "kind": response/selector/url/load_state, "elapsed": 秒, "ok": 是否在上限内满足}
+    """
+
+    def __init__(self, page, log: Optional[Callable] = None, timeout: float = DEFAULT_TIMEOUT):
+        self.page = page
+        self.log = log or _log
+        self.timeout = timeout
+        self.records: List[Dict] = []
+
+    def _record(self, kind: str, label: str, started: float, ok: bool):
+        self.records.append({"label": label, "kind": kind, "elapsed": time.perf_counter() - started, "ok": ok})
+
+    async def response(self, target, action: Callable[[], Awaitable], timeout: Optional[float] = None,
+                       label: str = ""):
+        """
+        执行 action 并等待匹配的响应；等响应超时返回 None
+        action 抛出的异常（包括点击超时的 TimeoutError）原样抛出，调用方据此判断动作本身是否完成
+        """
+        started = time.perf_counter()
+        action_failed = False
+        try:
+            async with self.page.expect_response(response_matcher(target), timeout=timeout or self.timeout) as info:
+                try:
+                    await action()
+                except Exception:
+                    action_failed = True
+                    raise
+            response = await info.value
+        except PWTimeout:
+            self._record("response", label or str(target), started, False)
+            if action_failed:
+                raise
+            return None
+        self._record("response", label or str(target), started, True)
+        return response
+
+    async def selector(self, selector: str, state: str = "visible", timeout: Optional[float] = None,
+                       label: str = "") -> bool:
+        started = time.perf_counter()
+        try:
+            await self.page.wait_for_selector(selector, state=state, timeout=timeout or self.timeout)
+            ok = True
+        except PWTimeout:
+            ok = False
+        self._record("selector", label or f"{selector} {state}", started, ok)
+        return ok
+
+    async def url(self, pattern, timeout: Optional[float] = None, label: str = "") -> bool:
+        """pattern 为 glob、正则或函数（同 page.wait_for_url）"""
+        started = time.perf_counter()
+        try:
+            await self.page.wait_for_url(pattern, timeout=timeout or self.timeout, wait_until="domcontentloaded")
+            ok = True
+        except PWTimeout:
+            ok = False
+        if not label:
+            label = pattern if isinstance(pattern, str) else getattr(pattern, "pattern", "URL 条件")
+        self._record("url", label, started, ok)
+        return ok
+
+    async def load_state(self, state: str = "domcontentloaded", timeout: Optional[float] = None,
+                         label: str = "") -> bool:
+        started = time.perf_counter()
+        try:
+            await self.page.wait_for_load_state(state, timeout=timeout or self.timeout)
+            ok = True
+        except PWTimeout:
+            ok = False
+        self._record("load_state", label or state, started, ok)
+        return ok
+
+    @property
+    def total(self) -> float:
+        return sum(r["elapsed"] for r in self.records)
+
+    def print_summary(self):
+        if not self.records:
+            return
+        self.log(f"[INFO] 页面等待 {len(self.records)} 次，共 {self.total:.2f} 秒:")
+        for r in self.records:
+            flag = "" if r["ok"] else "  [超时]"
+            self.log(f"  {r['elapsed'] * 1000:>8.0f} ms  {r['kind']:<10} {r['label']}{flag}")
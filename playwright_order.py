@@ -18,6 +18,7 @@ from config import (
     DEFAULT_START_TIME,
     DEFAULT_END_TIME,
 )
+from browser_daemon import lease_page_async
 from query import query_left_tickets, filter_by_time, filter_by_seat, _has_ticket_value
 
 
@@ -68,29 +69,38 @@ def build_passenger_str(p, seat_code: str):
 async def main():
     log("[STEP] 启动 Playwright")
     async with async_playwright() as p:
-        browser = await p.chromium.launch_persistent_context(
-            USER_DATA_DIR,
-            headless=True,
-            args=["--disable-blink-features=AutomationControlled"],
-        )
-        page = await browser.new_page()
-
-        # 注入 cookies
-        jar = []
-        for k, v in INITIAL_COOKIES.items():
-            jar.append(
-                {
-                    "name": k,
-                    "value": v,
-                    "domain": "kyfw.12306.cn",
-                    "path": "/",
-                    "httpOnly": False,
-                    "secure": True,
-                    "sameSite": "Lax",
-                }
+        # 浏览器常驻进程在运行时直接租一个页面（browser.close() 只断开连接并归还页面）
+        lease = await lease_page_async(p)
+        if lease is not None:
+            browser, page = lease.browser, lease.page
+            log("[OK] 已从浏览器常驻进程租到页面")
+        else:
+            browser = await p.chromium.launch_persistent_context(
+                USER_DATA_DIR,
+                headless=True,
+                args=["--disable-blink-features=AutomationControlled"],
             )
-        await page.context.add_cookies(jar)
-        log(f"[INFO] 已注入 {len(jar)} 个 cookies")
+            page = await browser.new_page()
+
+        # 注入 cookies（租到的页面属于常驻进程共享的已登录上下文，注入 config 中的旧 Cookie 会覆盖当前登录）
+        if lease is not None:
+            log("[INFO] 沿用常驻浏览器的登录状态，不注入 Cookie")
+        else:
+            jar = []
+            for k, v in INITIAL_COOKIES.items():
+                jar.append(
+                    {
+                        "name": k,
+                        "value": v,
+                        "domain": "kyfw.12306.cn",
+                        "path": "/",
+                        "httpOnly": False,
+                        "secure": True,
+                        "sameSite": "Lax",
+                    }
+                )
+            await page.context.add_cookies(jar)
+            log(f"[INFO] 已注入 {len(jar)} 个 cookies")
 
         # 用 browser 请求 API，复用 query.py 的解析
         async def api_get(path, params=None, method="GET", data=None):
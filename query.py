@@ -1,5 +1,7 @@
 import requests
 import urllib3
+from http_metrics import instrument_session
+from response_decoder import decode_response
 from config import (
     BASE_URL,
     HEADERS,
@@ -59,7 +61,8 @@ def parse_train_item(item):
     }
 
 
-def query_left_tickets(session, date, from_code, to_code):
+def fetch_left_tickets(session, date, from_code, to_code):
+    """请求余票接口，返回 response_decoder.Decoded（调用方可按类别判断是否重试）"""
     # 官方可能返回 c_url 提示用 queryG，先请求 queryZ，如被提示则自动切换
     url = f"{BASE_URL}/otn/leftTicket/queryZ"
     params = {
@@ -75,13 +78,20 @@ def query_left_tickets(session, date, from_code, to_code):
     if resp.status_code in (302, 301) and ("queryG" in loc or not loc):
         url = f"{BASE_URL}/otn/leftTicket/queryG"
         resp = session.get(url, params=params, timeout=10, verify=False, allow_redirects=True)
-    resp.raise_for_status()
-    try:
-        data = resp.json()
-    except Exception:
-        print(f"[FAIL] 响应无法解析为JSON, 状态{resp.status_code}, 内容前200: {resp.text[:200]}")
+    return decode_response(resp)
+
+
+def query_left_tickets(session, date, from_code, to_code):
+    dec = fetch_left_tickets(session, date, from_code, to_code)
+    if not dec.ok:
+        print(f"[FAIL] 余票查询失败: {dec.describe()[:300]}")
         return []
-    if data.get("httpstatus") != 200 or not data.get("data", {}).get("result"):
+    return trains_from_result(dec.data)
+
+
+def trains_from_result(data):
+    """queryZ/queryG 的 JSON -> parse_train_item 列表"""
+    if data.get("httpstatus") != 200 or not (data.get("data") or {}).get("result"):
         return []
     return [parse_train_item(item) for item in data["data"]["result"]]
 
@@ -133,11 +143,62 @@ def filter_by_seat(trains, allow_second=True, allow_no_seat=True):
     return filtered
 
 
+# 候选席别（按优先级）：字段名、席别名称、下单用 seatType 代码
+SEAT_CLASSES = [
+    ("second", "二等座", "O"),
+    ("no_seat", "无座", "WZ"),
+]
+
+
+def seat_count(v):
+    """
+    把余票字段换算成张数，用于排序：
+    - 数字按原值
+    - "有" 表示 20 张及以上，按 20 计
+    - 其它“有票”取值（如 "少"、"*"）按 1 计
+    """
+    if not _has_ticket_value(v):
+        return 0
+    s = str(v).strip()
+    if s.isdigit():
+        return int(s)
+    if s == "有":
+        return 20
+    return 1
+
+
+def rank_candidates(trains, allow_second=True, allow_no_seat=True):
+    """
+    生成按优先级排好序的候选列表（车次 + 席别）
+    排序依据：席别优先级（二等座优先）> 余票张数（多的优先）> 出发时间（早的优先）
+    同一车次二等座、无座都有票时会生成两个候选，下单失败可以直接换下一个
+    """
+    allowed = {"second": allow_second, "no_seat": allow_no_seat}
+    candidates = []
+    for t in trains:
+        for rank, (field, seat_name, seat_code) in enumerate(SEAT_CLASSES):
+            if not allowed.get(field):
+                continue
+            count = seat_count(t.get(field))
+            if count <= 0:
+                continue
+            candidates.append({
+                "train": t,
+                "seat_name": seat_name,
+                "seat_code": seat_code,
+                "count": count,
+                "score": (rank, -count, time_to_minutes(t["start"])),
+            })
+    candidates.sort(key=lambda c: c["score"])
+    return candidates
+
+
 def main():
     session = requests.Session()
     session.headers.update(HEADERS)
     session.cookies.update(INITIAL_COOKIES)
     session.verify = False
+    metrics = instrument_session(session)
 
     try:
         trains = query_left_tickets(session, TRAVEL_DATE, FROM_STATION, TO_STATION)
@@ -159,6 +220,7 @@ def main():
             f"二等:{t['second']} 一等:{t['first']} 商务/特等:{t['business']} "
             f"软卧:{t['soft_sleep']} 硬卧:{t['hard_sleep']} 硬座:{t['hard_seat']} 无座:{t['no_seat']}"
         )
+    metrics.print_summary()
 
 
 if __name__ == "__main__":
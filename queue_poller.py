@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+排队结果轮询：confirmSingleForQueue 之后轮询 queryOrderWaitTime，直到拿到 orderId
+轮询间隔由服务端返回的 waitTime（预计等待秒数）和 waitCount（排队人数）决定
+登录失效、业务失败（status=false / waitTime=-2、-3 或带 msg 的负数）立即停止；限流、服务端错误按最小间隔重试直到超时
+"""
+import sys
+import time
+import threading
+from typing import Callable, Optional, List, Dict, Tuple
+
+import requests
+import urllib3
+
+from config import BASE_URL
+from response_decoder import decode_response, Decoded, OK, BUSINESS_FAIL, SESSION_EXPIRED
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# 排队失败的 waitTime：-2 排队失败（余票不足/限制购票等），-3 订单已取消
+QUEUE_FAILED_WAIT_TIMES = (-2, -3)
+
+
+class OrderQueuePoller:
+    """轮询 /otn/confirmPassenger/queryOrderWaitTime"""
+
+    def __init__(self, session: requests.Session, repeat_token: str, base_url: str = BASE_URL,
+                 min_interval: float = 0.5, max_interval: float = 5.0, timeout: float = 300):
+        self.session = session
+        self.repeat_token = repeat_token
+        self.base_url = base_url
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.order_id = None
+        self.error = None
+        # 最近一次轮询的解码结果（失败时调用方按 kind 判断是否需要重新登录）
+        self.last_result: Optional[Decoded] = None
+        # 每次轮询：{"at", "elapsed", "waitTime", "waitCount"}
+        self.polls = []
+        self.started_at = None
+        self.finished_at = None
+
+    def log(self, msg):
+        try:
+            print(msg)
+        except UnicodeEncodeError:
+            sys.stdout.buffer.write((str(msg) + "\n").encode("utf-8", errors="backslashreplace"))
+            sys.stdout.buffer.flush()
+
+    def next_delay(self, wait_time: int, wait_count: int) -> float:
+        """
+        根据服务端提示计算下次轮询间隔：
+        - 排在队首（waitCount<=1）或预计等待很短时，按最小间隔轮询
+        - 否则取预计等待时间的一半，限制在 [min_interval, max_interval]
+        """
+        if wait_count <= 1 or wait_time <= 1:
+            return self.min_interval
+        return max(self.min_interval, min(self.max_interval, wait_time / 2.0))
+
+    def query_once(self) -> Decoded:
+        """请求一次 queryOrderWaitTime，返回解码结果（正常响应同时记入 polls）"""
+        url = f"{self.base_url}/otn/confirmPassenger/queryOrderWaitTime"
+        params = {
+            "random": str(int(time.time() * 1000)),
+            "tourFlag": "dc",
+            "_json_att": "",
+            "REPEAT_SUBMIT_TOKEN": self.repeat_token,
+        }
+        headers = {
+            "Referer": f"{self.base_url}/otn/confirmPassenger/initDc",
+            "X-Requested-With": "XMLHttpRequest",
+        }
+        t0 = time.perf_counter()
+        resp = self.session.get(url, params=params, headers=headers, timeout=10, verify=False)
+        elapsed = time.perf_counter() - t0
+        dec = decode_response(resp)
+        self.last_result = dec
+        if dec.kind != OK:
+            self.log(f"[WARN] queryOrderWaitTime {dec.describe()}")
+            return dec
+        data = dec.data.get("data") or {}
+        self.polls.append({
+            "at": time.time(),
+            "elapsed": round(elapsed, 4),
+            "waitTime": data.get("waitTime"),
+            "waitCount": data.get("waitCount"),
+        })
+        return dec
+
+    def _fail(self, error) -> None:
+        self.error = error
+        self.finished_at = time.time()
+        self.log(f"[FAIL] 排队失败: {self.error}")
+
+    def poll(self) -> Optional[str]:
+        """轮询直到出现 orderId；失败、登录失效或超时返回 None（原因见 error / last_result）"""
+        self.started_at = time.time()
+        deadline = self.started_at + self.timeout
+        self.log("[STEP] 轮询排队结果 queryOrderWaitTime")
+        while time.time() < deadline:
+            try:
+                dec = self.query_once()
+            except Exception as e:
+                self.log(f"[WARN] queryOrderWaitTime 异常: {str(e)}")
+                dec = None
+            # 登录失效、业务失败再查也不会变：立即停止
+            if dec is not None and dec.kind in (SESSION_EXPIRED, BUSINESS_FAIL):
+                self._fail(f"{dec.kind} {dec.reason} {dec.messages or ''}".strip())
+                return None
+            if dec is None or not dec.ok:
+                time.sleep(self.min_interval)
+                continue
+            res = dec.data
+            data = res.get("data") or {}
+            order_id = data.get("orderId")
+            if order_id:
+                self.order_id = order_id
+                self.finished_at = time.time()
+                self.log(f"[OK] 排队完成，orderId={order_id}（轮询 {len(self.polls)} 次）")
+                return order_id
+            try:
+                wait_time = int(data.get("waitTime", -1))
+                wait_count = int(data.get("waitCount", 0))
+            except (TypeError, ValueError):
+                wait_time, wait_count = -1, 0
+            # waitTime=-2/-3 为排队失败/订单已取消，其他负数带 msg 时同样是终态，msg 中有原因
+            # （waitTime=-1 且没有 msg 表示仍在处理，继续轮询）
+            if wait_time in QUEUE_FAILED_WAIT_TIMES or (wait_time < 0 and data.get("msg")):
+                self._fail(data.get("msg") or res.get("messages") or str(res))
+                return None
+            delay = self.next_delay(wait_time, wait_count)
+            self.log(f"[INFO] 排队中：waitTime={wait_time}s waitCount={wait_count}，{delay:.1f}s 后再查")
+            time.sleep(delay)
+        self.finished_at = time.time()
+        self.log(f"[FAIL] 轮询超时（{self.timeout}秒），请在手机端查询订单")
+        return None
+
+    def latency_breakdown(self, history: List[Dict] = None) -> List[Dict]:
+        """
+        从查询到拿到 orderId 的耗时分解（毫秒）
+        history: 本次 run 的 OrderState.history（各步骤耗时），为空时只统计排队阶段；
+            total 从其中第一条记录的开始时间算起，不要传入从检查点恢复前的记录
+        """
+        rows = []
+        for h in history or []:
+            rows.append({"phase": h["to"], "ms": round(h["elapsed"] * 1000, 1)})
+        if self.started_at and self.finished_at:
+            rows.append({"phase": "queue_wait", "ms": round((self.finished_at - self.started_at) * 1000, 1)})
+            begin = self.started_at
+            if history:
+                begin = history[0]["at"] - history[0]["elapsed"]
+            rows.append({"phase": "total", "ms": round((self.finished_at - begin) * 1000, 1)})
+        return rows
+
+    def print_breakdown(self, history: List[Dict] = None):
+        self.log("[INFO] 查询 -> orderId 耗时分解:")
+        for row in self.latency_breakdown(history):
+            self.log(f"  {row['phase']:<12} {row['ms']:10.1f} ms")
+
+
+def mock_wait_reply(wait_time: int, wait_count: int, order_id: str = None, msg: str = "") -> Tuple[int, Dict, bytes]:
+    """模拟服务的一次 queryOrderWaitTime JSON 响应：(状态码, 响应头, 响应体)"""
+    import json
+
+    data = {"queryOrderWaitTimeStatus": True, "count": 0, "tourFlag": "dc",
+            "waitTime": wait_time, "waitCount": wait_count, "orderId": order_id}
+    if msg:
+        data["msg"] = msg
+    body = json.dumps({"status": True, "httpstatus": 200, "data": data}, ensure_ascii=False).encode("utf-8")
+    return 200, {"Content-Type": "application/json;charset=UTF-8"}, body
+
+
+def _default_script(ready_after: int) -> Callable[[int], Tuple[int, Dict, bytes]]:
+    """前 ready_after 次返回排队中（waitTime 递减），之后返回 orderId"""
+    def reply(n: int):
+        remaining = ready_after - n
+        if remaining <= 0:
+            return mock_wait_reply(-1, 0, "EMOCK000001")
+        return mock_wait_reply(remaining * 2, remaining)
+    return reply
+
+
+def _run_mock_server(port: int = 0, ready_after: int = 3, script: Callable[[int], Tuple[int, Dict, bytes]] = None):
+    """
+    本地模拟排队接口，返回 (server, base_url)
+    script(n) 返回第 n 次（从 1 开始）请求的 (状态码, 响应头, 响应体)；不传时按 ready_after 排队后出票
+    server.hits 为已收到的请求数
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    script = script or _default_script(ready_after)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if "/otn/confirmPassenger/queryOrderWaitTime" not in self.path:
+                self.send_response(404)
+                self.end_headers()
+                return
+            with lock:
+                server.hits += 1
+                n = server.hits
+            status, headers, body = script(n)
+            self.send_response(status)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.hits = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    """对本地模拟服务跑一遍轮询：python queue_poller.py"""
+    server, base_url = _run_mock_server()
+    poller = OrderQueuePoller(requests.Session(), "MOCKTOKEN", base_url=base_url, min_interval=0.2, timeout=30)
+    poller.poll()
+    poller.print_breakdown()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
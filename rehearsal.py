@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+下单演练模式：查询 -> submitOrderRequest -> initDc -> 乘车人 -> checkOrderInfo -> getQueueCount，然后停止
+不调用 confirmSingleForQueue，不会生成订单；结束后输出关键路径耗时瀑布图：
+网络（http_metrics 按接口统计）、解析、节奏等待（sleep）、日志输出，以及剩余的其它耗时
+用法：python rehearsal.py
+"""
+import sys
+import time
+from typing import Dict, List
+
+from http_metrics import RequestMetrics, MetricsAdapter, STEP_OF_ENDPOINT
+from order_flow import OrderFlow
+from order_state import STEPS, PHASES
+from config import DEFAULT_PASSENGER, DEFAULT_START_TIME, DEFAULT_END_TIME
+
+# 演练执行到这一步为止
+REHEARSAL_STOP = "queue_count"
+
+# 瀑布图宽度（字符）与各分类使用的字符
+BAR_WIDTH = 60
+BAR_CHARS = {"network": "N", "parse": "P", "pace": "S", "log": "L", "other": "."}
+
+
+def _log(msg):
+    try:
+        print(msg)
+    except UnicodeEncodeError:
+        sys.stdout.buffer.write((str(msg) + "\n").encode("utf-8", errors="backslashreplace"))
+        sys.stdout.buffer.flush()
+
+
+def _network_by_step(metrics: RequestMetrics) -> Dict[str, Dict]:
+    """按 OrderFlow 步骤汇总网络耗时（秒）与请求数"""
+    result = {}
+    with metrics._lock:
+        for name, st in metrics.endpoints.items():
+            step = STEP_OF_ENDPOINT.get(name)
+            if step is None:
+                continue
+            row = result.setdefault(step, {"seconds": 0.0, "requests": 0})
+            row["seconds"] += st.total.total / 1_000_000
+            row["requests"] += st.total.count
+    return result
+
+
+def build_waterfall(flow: OrderFlow, metrics: RequestMetrics) -> List[Dict]:
+    """
+    合并 PhaseTimer 与请求统计，返回按步骤顺序排列的行（毫秒）：
+    {"step", "start", "wall", "network", "parse", "pace", "log", "other", "attempts", "requests"}
+    """
+    network = _network_by_step(metrics)
+    rows = []
+    for step in STEPS:
+        timed = flow.phases.steps.get(step)
+        if timed is None:
+            continue
+        row = {"step": step, "start": timed["start"] * 1000, "wall": timed["wall"] * 1000,
+               "attempts": timed["attempts"], "requests": network.get(step, {}).get("requests", 0)}
+        row["network"] = network.get(step, {}).get("seconds", 0.0) * 1000
+        for phase in PHASES[1:]:
+            row[phase] = timed.get(phase, 0.0) * 1000
+        row["other"] = max(0.0, row["wall"] - sum(row[p] for p in PHASES))
+        rows.append(row)
+    return rows
+
+
+def _bar(row: Dict, scale: float) -> str:
+    offset = int(round(row["start"] * scale))
+    cells = ""
+    for phase in PHASES + ("other",):
+        cells += BAR_CHARS[phase] * int(round(row[phase] * scale))
+    return " " * offset + (cells or "|")
+
+
+def print_waterfall(rows: List[Dict]):
+    if not rows:
+        _log("[WARN] 没有可输出的步骤耗时")
+        return
+    end = max(r["start"] + r["wall"] for r in rows)
+    scale = BAR_WIDTH / end if end > 0 else 0.0
+    _log("[INFO] 关键路径耗时瀑布图（毫秒；N=网络 P=解析 S=节奏等待 L=日志 .=其它）:")
+    _log(f"  {'step':<12} {'start':>8} {'wall':>8} {'network':>8} {'parse':>7} {'pace':>8} "
+         f"{'log':>6} {'other':>7} {'try':>3} {'req':>3}")
+    for r in rows:
+        _log(f"  {r['step']:<12} {r['start']:8.1f} {r['wall']:8.1f} {r['network']:8.1f} {r['parse']:7.1f} "
+             f"{r['pace']:8.1f} {r['log']:6.1f} {r['other']:7.1f} {r['attempts']:>3} {r['requests']:>3}  "
+             f"{_bar(r, scale)}")
+    totals = {p: sum(r[p] for r in rows) for p in PHASES + ("other", "wall")}
+    _log(f"  {'total':<12} {'':>8} {totals['wall']:8.1f} {totals['network']:8.1f} {totals['parse']:7.1f} "
+         f"{totals['pace']:8.1f} {totals['log']:6.1f} {totals['other']:7.1f}")
+    if totals["wall"] > 0:
+        share = "  ".join(f"{p} {totals[p] / totals['wall'] * 100:.1f}%" for p in PHASES + ("other",))
+        _log(f"  占比: {share}")
+
+
+def rehearse(flow: OrderFlow = None, passenger_name: str = DEFAULT_PASSENGER,
+             start_time: str = DEFAULT_START_TIME, end_time: str = DEFAULT_END_TIME) -> Dict:
+    """
+    执行一次演练（到 getQueueCount 为止），返回 {"ok", "rows", "metrics"}
+    flow: 可传入已加载 Cookie 的 OrderFlow；演练使用独立的请求统计，不写检查点
+    """
+    flow = flow or OrderFlow()
+    metrics = RequestMetrics()
+    adapter = MetricsAdapter(metrics)
+    flow.session.mount("https://", adapter)
+    flow.session.mount("http://", adapter)
+    flow.metrics = metrics
+
+    _log("[STEP] 下单演练：执行到 getQueueCount 后停止（不提交排队确认）")
+    t0 = time.perf_counter()
+    ok = flow.run(passenger_name, start_time, end_time, stop_after=REHEARSAL_STOP)
+    elapsed = time.perf_counter() - t0
+    if ok:
+        _log(f"[OK] 演练完成，用时 {elapsed * 1000:.1f} ms，已停在 {REHEARSAL_STOP}")
+    else:
+        _log(f"[FAIL] 演练在 {flow.state.resume_step()} 步骤前停止，用时 {elapsed * 1000:.1f} ms")
+    rows = build_waterfall(flow, metrics)
+    print_waterfall(rows)
+    metrics.print_summary()
+    return {"ok": ok, "rows": rows, "metrics": metrics}
+
+
+def main():
+    # 只需要 Cookie 文件，不启动浏览器
+    from cookie_manager import load_cookies_to_requests_session
+
+    flow = OrderFlow()
+    if not load_cookies_to_requests_session(flow.session):
+        _log("[WARN] 未加载到保存的 Cookie，使用 config 中的 INITIAL_COOKIES")
+    result = rehearse(flow)
+    _log(f"[INFO] 已导出请求耗时统计: {result['metrics'].export_json()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+离线回放服务器：在本地冒充 kyfw.12306.cn，按接口返回录制好的响应，用于不联网的端到端性能测试
+响应来源（后者覆盖前者）：
+- 内置默认响应：checkUser、submitOrderRequest、confirmSingleForQueue、queryOrderWaitTime，
+  以及 queryZ -> queryG 的 302 跳转
+- 捕获日志（network_requests_*.json / network_capture_* / .har）中每个接口最后一次带响应体的记录
+- confirm_initDc.html（initDc 确认页，捕获中的 HTML 被截断过）
+- --responses 目录下的 <接口名>.json / <接口名>.html
+可配置固定延迟 + 抖动、按接口单独设置延迟，以及按比例注入错误（5xx / 限流页 / 登录失效跳转）
+
+用法：
+  python replay_server.py --port 8306 --latency 30 --jitter 10 --error-rate 0.02
+  然后设置环境变量 KYFW_BASE_URL=http://127.0.0.1:8306 再运行 rehearsal.py / query.py / playwright_order.py
+"""
+import argparse
+import json
+import os
+import random
+import ssl
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from http_metrics import endpoint_of
+from network_analyzer import find_latest_network_log, iter_log_records
+
+DEFAULT_PORT = 8306
+INIT_DC_FILE = "confirm_initDc.html"
+
+JSON_TYPE = "application/json;charset=UTF-8"
+HTML_TYPE = "text/html;charset=utf-8"
+
+# 错误注入的种类
+ERROR_KINDS = ("5xx", "throttle", "expired")
+
+
+def _json_body(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _ok_json(data) -> Dict:
+    """12306 JSON 接口的外层结构"""
+    return {"validateMessagesShowId": "_validatorMessage", "status": True, "httpstatus": 200,
+            "data": data, "messages": [], "validateMessages": {}}
+
+
+class Reply:
+    """一个录制好的响应"""
+
+    __slots__ = ("status", "headers", "body", "source")
+
+    def __init__(self, status: int, body: bytes = b"", content_type: str = JSON_TYPE,
+                 headers: Optional[Dict[str, str]] = None, source: str = "default"):
+        self.status = status
+        self.body = body
+        self.headers = {"Content-Type": content_type, **(headers or {})}
+        self.source = source
+
+
+def default_replies() -> Dict[str, Reply]:
+    return {
+        # 余票查询：queryZ 提示改用 queryG（fetch_left_tickets 会跟随）
+        "queryZ": Reply(302, headers={"Location": "/otn/leftTicket/queryG"}),
+        "queryG": Reply(200, _json_body({"httpstatus": 200, "data": {"result": [], "flag": "1", "map": {}},
+                                         "messages": "", "status": True})),
+        "checkUser": Reply(200, _json_body(_ok_json({"flag": True}))),
+        "submitOrderRequest": Reply(200, _json_body(_ok_json("N"))),
+        "confirmSingleForQueue": Reply(200, _json_body(_ok_json({"isAsync": "1", "submitStatus": True}))),
+        "queryOrderWaitTime": Reply(200, _json_body(_ok_json({
+            "queryOrderWaitTimeStatus": True, "count": 0, "waitTime": -1, "requestId": 0,
+            "waitCount": 0, "tourFlag": "dc", "orderId": "E000000000",
+        }))),
+    }
+
+
+def error_reply(kind: str) -> Reply:
+    if kind == "throttle":
+        body = "<html><body>网络可能存在问题，请您重试一下！</body></html>".encode("utf-8")
+        return Reply(200, body, HTML_TYPE, source="inject")
+    if kind == "expired":
+        return Reply(302, headers={"Location": "/otn/login/userLogin"}, source="inject")
+    return Reply(502, b"", HTML_TYPE, source="inject")
+
+
+def replies_from_log(path: str) -> Dict[str, Reply]:
+    """捕获日志中每个接口最后一次带响应体的记录"""
+    replies = {}
+    for record in iter_log_records(path):
+        resp = record.get("response") or {}
+        body = resp.get("body")
+        if body is None or resp.get("body_truncated") or not resp.get("status"):
+            continue
+        endpoint = endpoint_of(record.get("url", ""))
+        if isinstance(body, str):
+            replies[endpoint] = Reply(resp["status"], body.encode("utf-8"), resp.get("content_type") or HTML_TYPE,
+                                      source=os.path.basename(path))
+        else:
+            replies[endpoint] = Reply(resp["status"], _json_body(body), JSON_TYPE, source=os.path.basename(path))
+    return replies
+
+
+def replies_from_dir(directory: str) -> Dict[str, Reply]:
+    """<接口名>.json / <接口名>.html 文件"""
+    replies = {}
+    for name in sorted(os.listdir(directory)):
+        endpoint, ext = os.path.splitext(name)
+        if ext not in (".json", ".html"):
+            continue
+        with open(os.path.join(directory, name), "rb") as f:
+            body = f.read()
+        replies[endpoint] = Reply(200, body, JSON_TYPE if ext == ".json" else HTML_TYPE, source=name)
+    return replies
+
+
+def load_replies(log_path: Optional[str] = None, responses_dir: Optional[str] = None,
+                 init_dc_file: str = INIT_DC_FILE) -> Dict[str, Reply]:
+    replies = default_replies()
+    log_path = log_path or find_latest_network_log()
+    if log_path and os.path.exists(log_path):
+        replies.update(replies_from_log(log_path))
+    if init_dc_file and os.path.exists(init_dc_file):
+        with open(init_dc_file, "rb") as f:
+            replies["initDc"] = Reply(200, f.read(), HTML_TYPE, source=init_dc_file)
+    if responses_dir:
+        replies.update(replies_from_dir(responses_dir))
+    return replies
+
+
+class ReplayServer:
+    """
+    线程化的本地回放服务器
+    latency / jitter 单位毫秒；endpoint_latency 按接口覆盖 latency；error_rate 为注入错误的比例
+    """
+
+    def __init__(self, replies: Dict[str, Reply], host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                 latency: float = 0.0, jitter: float = 0.0, endpoint_latency: Optional[Dict[str, float]] = None,
+                 error_rate: float = 0.0, error_kind: str = "5xx", certfile: Optional[str] = None,
+                 keyfile: Optional[str] = None, seed: Optional[int] = None):
+        self.replies = replies
+        self.latency = latency
+        self.jitter = jitter
+        self.endpoint_latency = endpoint_latency or {}
+        self.error_rate = error_rate
+        self.error_kind = error_kind
+        self.error = error_reply(error_kind)
+        self.random = random.Random(seed)
+        self.counts: Dict[str, int] = {}
+        self.errors = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.scheme = "http"
+        if certfile:
+            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            ctx.load_cert_chain(certfile, keyfile)
+            self.httpd.socket = ctx.wrap_socket(self.httpd.socket, server_side=True)
+            self.scheme = "https"
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"{self.scheme}://{host}:{port}"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和响应体合并成一次发送，并关闭 Nagle，避免 keep-alive 下每个请求多等一次延迟 ACK（约 40 ms）
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                server.handle(self)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                server.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def pick(self, endpoint: str) -> Optional[Reply]:
+        """本次请求的响应：按 error_rate 注入错误，否则返回录制的响应（没有录制时返回 None）"""
+        with self._lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+            inject = self.error_rate > 0 and self.random.random() < self.error_rate
+            if inject:
+                self.errors += 1
+            delay = self.endpoint_latency.get(endpoint, self.latency)
+            if self.jitter:
+                delay = max(0.0, delay + self.random.uniform(-self.jitter, self.jitter))
+        if delay:
+            time.sleep(delay / 1000)
+        return self.error if inject else self.replies.get(endpoint)
+
+    def handle(self, req: BaseHTTPRequestHandler):
+        parts = urlsplit(req.path)
+        endpoint = endpoint_of(parts.path)
+        reply = self.pick(endpoint)
+        if reply is None:
+            reply = Reply(404, f"replay_server: 没有 {endpoint} 的录制响应".encode("utf-8"), HTML_TYPE)
+        req.send_response(reply.status)
+        for k, v in reply.headers.items():
+            if k == "Location" and parts.query and endpoint == "queryZ":
+                # 跳转时带上原查询参数
+                v = f"{v}?{parts.query}"
+            req.send_header(k, v)
+        req.send_header("Content-Length", str(len(reply.body)))
+        req.end_headers()
+        req.wfile.write(reply.body)
+
+    def start(self) -> "ReplayServer":
+        """在后台线程运行（供性能测试在同一进程内使用）"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def print_summary(self):
+        total = sum(self.counts.values())
+        print(f"[INFO] 回放服务器共处理 {total} 个请求，注入错误 {self.errors} 个")
+        for endpoint, n in sorted(self.counts.items(), key=lambda kv: -kv[1]):
+            print(f"  {endpoint:<28} {n:>6}")
+
+
+def _parse_endpoint_latency(items) -> Dict[str, float]:
+    result = {}
+    for item in items or ():
+        name, _, ms = item.partition("=")
+        result[name] = float(ms)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="离线回放 kyfw.12306.cn 的录制响应")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--log", help="捕获日志（默认使用最新的 network_requests_* / network_capture_*）")
+    parser.add_argument("--responses", help="<接口名>.json / .html 响应文件所在目录")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟（毫秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟抖动范围 ±毫秒")
+    parser.add_argument("--latency-for", action="append", metavar="接口=毫秒", help="按接口设置延迟，可重复")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的比例 0~1")
+    parser.add_argument("--error-kind", choices=ERROR_KINDS, default="5xx")
+    parser.add_argument("--cert", help="HTTPS 证书（PEM）；不指定则使用 HTTP")
+    parser.add_argument("--key", help="HTTPS 私钥（PEM）")
+    parser.add_argument("--seed", type=int, help="随机种子（延迟抖动/错误注入可复现）")
+    args = parser.parse_args(argv)
+
+    replies = load_replies(args.log, args.responses)
+    server = ReplayServer(
+        replies, args.host, args.port, latency=args.latency, jitter=args.jitter,
+        endpoint_latency=_parse_endpoint_latency(args.latency_for), error_rate=args.error_rate,
+        error_kind=args.error_kind, certfile=args.cert, keyfile=args.key, seed=args.seed,
+    )
+    print(f"[OK] 回放服务器已启动: {server.base_url}")
+    for endpoint in sorted(replies):
+        print(f"  {endpoint:<28} {replies[endpoint].status}  {replies[endpoint].source}")
+    print(f"[INFO] 使用方式: 设置环境变量 KYFW_BASE_URL={server.base_url} 后运行 rehearsal.py 等脚本")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        server.print_summary()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
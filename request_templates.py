@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+下单接口的请求模板：把固定的请求头和表单字段预先编码好，调用时只填写动态字段
+（REPEAT_SUBMIT_TOKEN、leftTicket、train_no、seatType 等）
+默认模板与 OrderFlow 原来手写的请求一致；有 Playwright 捕获日志时，用捕获到的真实请求编译模板
+"""
+import time
+import urllib.parse
+from types import MappingProxyType
+from typing import Dict, Optional, Tuple
+
+from config import BASE_URL
+
+# 使用模板的下单接口
+ORDER_ENDPOINTS = ("getPassengerDTOs", "checkOrderInfo", "getQueueCount", "confirmSingleForQueue")
+
+# 每个接口调用时填写的字段，其余字段按模板原样发送
+DYNAMIC_SLOTS = {
+    "getPassengerDTOs": ("REPEAT_SUBMIT_TOKEN",),
+    "checkOrderInfo": ("passengerTicketStr", "oldPassengerStr", "REPEAT_SUBMIT_TOKEN"),
+    "getQueueCount": (
+        "train_date", "train_no", "stationTrainCode", "seatType", "fromStationTelecode",
+        "toStationTelecode", "leftTicket", "purpose_codes", "train_location", "REPEAT_SUBMIT_TOKEN",
+    ),
+    "confirmSingleForQueue": (
+        "passengerTicketStr", "oldPassengerStr", "purpose_codes", "key_check_isChange",
+        "leftTicketStr", "train_location", "REPEAT_SUBMIT_TOKEN",
+    ),
+}
+
+# 由 requests 自己维护、不能从捕获中照搬的请求头
+UNCOPIED_HEADERS = {"cookie", "content-length", "host"}
+
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded; charset=UTF-8"
+XHR_HEADERS = {
+    "Content-Type": FORM_CONTENT_TYPE,
+    "Origin": "https://kyfw.12306.cn",
+    "Referer": "https://kyfw.12306.cn/otn/confirmPassenger/initDc",
+    "X-Requested-With": "XMLHttpRequest",
+}
+
+
+def js_date_str(date: str) -> str:
+    """
+    2026-02-01 / 20260201 -> Sun Feb 01 2026 00:00:00 GMT+0800 (中国标准时间)
+    getQueueCount 的 train_date 在浏览器里是 JS Date 的字符串形式；其它格式原样返回
+    """
+    for fmt in ("%Y-%m-%d", "%Y%m%d"):
+        try:
+            t = time.strptime(date, fmt)
+        except (TypeError, ValueError):
+            continue
+        return time.strftime("%a %b %d %Y 00:00:00 GMT+0800 (中国标准时间)", t)
+    return date
+
+
+class RequestTemplate:
+    """
+    预编译的 POST 表单请求
+    固定字段在构造时编码成字符串，send() 只编码动态字段再拼接
+    """
+
+    __slots__ = ("endpoint", "url", "headers", "slots", "_static_body", "source")
+
+    def __init__(self, endpoint: str, path: str, fields, headers: Dict[str, str],
+                 slots: Tuple[str, ...], source: str = "default"):
+        self.endpoint = endpoint
+        self.url = BASE_URL + path
+        self.slots = tuple(slots)
+        static = [(k, v) for k, v in fields if k not in self.slots]
+        self._static_body = urllib.parse.urlencode(static)
+        headers = dict(headers)
+        if not any(k.lower() == "content-type" for k in headers):
+            headers["Content-Type"] = FORM_CONTENT_TYPE
+        self.headers = MappingProxyType(headers)
+        self.source = source
+
+    def body(self, **values) -> str:
+        """拼出表单：固定部分 + 动态字段（未给出的动态字段发送空值）"""
+        dynamic = urllib.parse.urlencode([(k, values.get(k, "")) for k in self.slots])
+        if not self._static_body:
+            return dynamic
+        return f"{self._static_body}&{dynamic}" if dynamic else self._static_body
+
+    def send(self, session, timeout: float = 10, **values):
+        return session.post(self.url, data=self.body(**values).encode("utf-8"), headers=self.headers,
+                            timeout=timeout, verify=False)
+
+    @classmethod
+    def from_capture(cls, req: Dict) -> Optional["RequestTemplate"]:
+        """由一条捕获记录（network_requests_*.json 中的请求）编译模板"""
+        parts = urllib.parse.urlsplit(req.get("url", ""))
+        endpoint = parts.path.rstrip("/").rsplit("/", 1)[-1]
+        if endpoint not in DYNAMIC_SLOTS or (req.get("method") or "").upper() != "POST":
+            return None
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        fields = urllib.parse.parse_qsl(req.get("post_data") or "", keep_blank_values=True)
+        headers = {k: v for k, v in (req.get("headers") or {}).items() if k.lower() not in UNCOPIED_HEADERS}
+        # 捕获里没有的动态字段也要发送
+        names = {k for k, _ in fields}
+        fields += [(k, "") for k in DYNAMIC_SLOTS[endpoint] if k not in names]
+        return cls(endpoint, path, fields, headers, DYNAMIC_SLOTS[endpoint], source="capture")
+
+
+def default_templates() -> Dict[str, RequestTemplate]:
+    """与 OrderFlow 原手写请求一致的模板"""
+    getqueue_headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "Accept": "application/json, text/javascript, */*; q=0.01",
+        "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+        "Accept-Encoding": "gzip, deflate, br",
+        "Connection": "keep-alive",
+        "Sec-Fetch-Dest": "empty",
+        "Sec-Fetch-Mode": "cors",
+        "Sec-Fetch-Site": "same-origin",
+        **XHR_HEADERS,
+    }
+    return {
+        "getPassengerDTOs": RequestTemplate(
+            "getPassengerDTOs", "/otn/confirmPassenger/getPassengerDTOs",
+            [("_json_att", "")], XHR_HEADERS, DYNAMIC_SLOTS["getPassengerDTOs"],
+        ),
+        "checkOrderInfo": RequestTemplate(
+            "checkOrderInfo", "/otn/confirmPassenger/checkOrderInfo",
+            [("cancel_flag", "2"), ("bed_level_order_num", "000000000000000000000000000000"),
+             ("tour_flag", "dc"), ("randCode", ""), ("whatsSelect", "1"), ("_json_att", "")],
+            XHR_HEADERS, DYNAMIC_SLOTS["checkOrderInfo"],
+        ),
+        "getQueueCount": RequestTemplate(
+            "getQueueCount", "/otn/confirmPassenger/getQueueCount",
+            [("_json_att", "")], getqueue_headers, DYNAMIC_SLOTS["getQueueCount"],
+        ),
+        "confirmSingleForQueue": RequestTemplate(
+            "confirmSingleForQueue", "/otn/confirmPassenger/confirmSingleForQueue",
+            [("randCode", ""), ("choose_seats", ""), ("seatDetailType", "000"), ("whatsSelect", "1"),
+             ("roomType", "00"), ("dwAll", "N"), ("_json_att", "")],
+            XHR_HEADERS, DYNAMIC_SLOTS["confirmSingleForQueue"],
+        ),
+    }
+
+
+def compile_templates(network_log=None) -> Dict[str, RequestTemplate]:
+    """
+    编译下单接口模板；network_log（NetworkLog 或请求列表）中捕获到的接口使用捕获的请求，其余用默认模板
+    """
+    templates = default_templates()
+    if not network_log:
+        return templates
+    for endpoint in ORDER_ENDPOINTS:
+        if hasattr(network_log, "find"):
+            req = network_log.find(endpoint, method="POST")
+        else:
+            req = next((r for r in network_log if endpoint in r.get("url", "")), None)
+        tpl = RequestTemplate.from_capture(req) if req else None
+        if tpl is not None:
+            templates[endpoint] = tpl
+    return templates
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+统一的响应解码：先看状态码、Location、Content-Type 和响应体开头几个字节，再决定怎么解析，
+并把结果归类，调用方按类别分支，不用再对整个 HTML 做一次失败的 JSON 解析
+（响应体此时已由 requests 整个下载到内存，嗅探开头只是省掉解析；同一份 content 只解码一次）
+"""
+import json
+from typing import Optional
+
+from requests.structures import CaseInsensitiveDict
+
+# 结果类别
+OK = "ok"                            # 正常（JSON 接口 status=true，或期望 HTML 且拿到 HTML）
+BUSINESS_FAIL = "business_fail"      # 接口正常返回但业务失败（status=false / 余票不足等）
+SESSION_EXPIRED = "session_expired"  # 登录失效（重定向到登录页、返回登录页 HTML、提示未登录）
+THROTTLED = "throttled"              # 风控/限流（429/403、error.html、系统繁忙）
+SERVER_ERROR = "server_error"        # 5xx、空响应、无法解析等
+
+# 可以原样重试的类别
+RETRYABLE = {THROTTLED, SERVER_ERROR}
+
+LOGIN_MARKERS = ("/otn/login", "userLogin", "resources/login", "/otn/passport", "passport/web/login")
+# 登录页 HTML 特征
+LOGIN_PAGE_MARKERS = ("login-hd-code", "J-qrImg", "resources/login.html", "/otn/resources/js/login")
+THROTTLE_MARKERS = ("error.html", "网络可能存在问题", "请您重试一下", "系统繁忙", "操作过于频繁")
+# JSON 业务失败中表示登录失效的提示
+LOGIN_MESSAGES = ("未登录", "登录已失效", "请重新登录", "用户未登录")
+
+# 按响应体开头这么多字节判断格式
+SNIFF_BYTES = 512
+# 期望 JSON 却拿到 HTML 时，只在开头这么多字节里找登录页/错误页特征
+MARKER_BYTES = 4096
+
+
+class Decoded:
+    """解码结果"""
+
+    __slots__ = ("kind", "data", "text", "status_code", "reason")
+
+    def __init__(self, kind: str, data=None, text: str = "", status_code: int = 0, reason: str = ""):
+        self.kind = kind
+        self.data = data            # JSON 接口为 dict；HTML 接口为完整文本
+        self.text = text            # 响应体开头（用于日志）
+        self.status_code = status_code
+        self.reason = reason
+
+    @property
+    def ok(self) -> bool:
+        return self.kind == OK
+
+    @property
+    def retryable(self) -> bool:
+        return self.kind in RETRYABLE
+
+    @property
+    def messages(self) -> list:
+        if isinstance(self.data, dict):
+            return list(self.data.get("messages") or [])
+        return []
+
+    def describe(self) -> str:
+        """日志用的简短描述"""
+        if isinstance(self.data, dict):
+            return f"{self.kind} {self.reason} {self.data}"
+        return f"{self.kind} {self.reason} 状态{self.status_code} 内容前200: {self.text[:200]}"
+
+
+def _head(content: bytes) -> bytes:
+    return content[:SNIFF_BYTES].lstrip(b"\xef\xbb\xbf \t\r\n")
+
+
+def _text(resp, content: bytes) -> str:
+    """按响应声明的编码解码（未声明时按 UTF-8），不再经过 resp.text 重新取一遍响应体"""
+    encoding = getattr(resp, "encoding", None) or "utf-8"
+    try:
+        return content.decode(encoding, errors="replace")
+    except LookupError:
+        return content.decode("utf-8", errors="replace")
+
+
+def classify_json(res, status_code: int = 200) -> Decoded:
+    """对已解析的 12306 JSON 结果归类（status=false 时区分登录失效/限流/业务失败）"""
+    if not isinstance(res, dict):
+        return Decoded(SERVER_ERROR, res, status_code=status_code, reason="JSON 不是对象")
+    if res.get("status") is False or (res.get("httpstatus") not in (None, 200)):
+        texts = " ".join(str(m) for m in (res.get("messages") or []))
+        if any(m in texts for m in LOGIN_MESSAGES):
+            return Decoded(SESSION_EXPIRED, res, status_code=status_code, reason="接口提示未登录")
+        if any(m in texts for m in THROTTLE_MARKERS):
+            return Decoded(THROTTLED, res, status_code=status_code, reason="接口提示系统繁忙")
+        return Decoded(BUSINESS_FAIL, res, status_code=status_code, reason="status=false")
+    return Decoded(OK, res, status_code=status_code)
+
+
+def decode_response(resp, expect: str = "json") -> Decoded:
+    """
+    解码 requests 响应
+    expect="json"：期望 JSON 接口；expect="html"：期望页面（如 initDc）
+    """
+    status = resp.status_code
+    location = resp.headers.get("Location") or ""
+    content_type = (resp.headers.get("Content-Type") or "").lower()
+
+    # 1. 状态码 + Location：不读响应体就能判断
+    if 300 <= status < 400:
+        if any(m in location for m in LOGIN_MARKERS):
+            return Decoded(SESSION_EXPIRED, status_code=status, reason=f"重定向到登录页 {location}")
+        if "error.html" in location:
+            return Decoded(THROTTLED, status_code=status, reason=f"重定向到错误页 {location}")
+        return Decoded(SERVER_ERROR, status_code=status, reason=f"意外重定向 {location}")
+    if status in (403, 429):
+        return Decoded(THROTTLED, status_code=status, reason=f"状态码 {status}")
+    if status >= 500:
+        return Decoded(SERVER_ERROR, status_code=status, reason=f"状态码 {status}")
+    # 跟随重定向后落到登录页/错误页
+    final_url = getattr(resp, "url", "") or ""
+    if getattr(resp, "history", None):
+        if any(m in final_url for m in LOGIN_MARKERS):
+            return Decoded(SESSION_EXPIRED, status_code=status, reason=f"被重定向到登录页 {final_url}")
+        if "error.html" in final_url:
+            return Decoded(THROTTLED, status_code=status, reason=f"被重定向到错误页 {final_url}")
+
+    # 2. Content-Type + 开头字节
+    content = resp.content or b""
+    head = _head(content)
+    if not head:
+        return Decoded(SERVER_ERROR, status_code=status, reason="空响应")
+    is_html = "text/html" in content_type or head[:1] == b"<"
+    if is_html:
+        head_text = head.decode("utf-8", errors="replace")
+        if expect == "html":
+            text = _text(resp, content)
+            if "err_text" in text[:MARKER_BYTES]:
+                return Decoded(THROTTLED, text=head_text, status_code=status, reason="返回错误页")
+            if any(m in final_url for m in LOGIN_MARKERS) or any(m in text[:MARKER_BYTES] for m in LOGIN_PAGE_MARKERS):
+                return Decoded(SESSION_EXPIRED, text=head_text, status_code=status, reason="返回登录页")
+            return Decoded(OK, text, text=head_text, status_code=status)
+        # 期望 JSON 却拿到 HTML：只看开头判断是登录页还是错误页
+        text = _text(resp, content[:MARKER_BYTES])
+        if "err_text" in text or any(m in text for m in THROTTLE_MARKERS):
+            return Decoded(THROTTLED, text=head_text, status_code=status, reason="JSON 接口返回错误页")
+        if any(m in text for m in LOGIN_PAGE_MARKERS):
+            return Decoded(SESSION_EXPIRED, text=head_text, status_code=status, reason="JSON 接口返回登录页")
+        return Decoded(SERVER_ERROR, text=head_text, status_code=status, reason="JSON 接口返回 HTML")
+
+    if expect == "html":
+        return Decoded(SERVER_ERROR, text=head.decode("utf-8", errors="replace"), status_code=status,
+                       reason="期望页面但不是 HTML")
+    if head[:1] not in (b"{", b"["):
+        return Decoded(SERVER_ERROR, text=head.decode("utf-8", errors="replace"), status_code=status,
+                       reason="无法识别的响应格式")
+    try:
+        res = json.loads(content)
+    except ValueError:
+        return Decoded(SERVER_ERROR, text=head.decode("utf-8", errors="replace"), status_code=status,
+                       reason="JSON 解析失败")
+    return classify_json(res, status)
+
+
+class _BrowserResponse:
+    """浏览器（Playwright）响应的状态码、头、URL 和响应体，按 requests 响应的接口提供给 decode_response"""
+
+    def __init__(self, status: int, headers: dict, url: str, redirected: bool, content: bytes):
+        self.status_code = status
+        self.headers = CaseInsensitiveDict(headers)
+        self.url = url
+        self.history = [url] if redirected else []
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+
+async def decode_browser_response(response, expect: str = "json") -> Decoded:
+    """解码 Playwright（async API）的 Response，归类规则与 decode_response 相同"""
+    content = b""
+    if not 300 <= response.status < 400:
+        try:
+            content = await response.body()
+        except Exception:
+            pass
+    return decode_response(_BrowserResponse(response.status, response.headers, response.url,
+                                            response.request.redirected_from is not None, content), expect)
+
+
+def find_message(decoded: Decoded, keywords) -> Optional[str]:
+    """在 messages / data.errMsg 中查找关键字，返回命中的那条提示"""
+    if not isinstance(decoded.data, dict):
+        return None
+    data_obj = decoded.data.get("data") if isinstance(decoded.data.get("data"), dict) else {}
+    texts = decoded.messages + [data_obj.get("errMsg") or ""]
+    for t in texts:
+        if any(k in str(t) for k in keywords):
+            return str(t)
+    return None
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+会话保持：在共享的 requests session 上定时请求 checkUser（很小的 JSON 响应），代替浏览器定时刷新页面
+- 下一次心跳时间由两者决定：最近一次确认登录有效的时间（任何需要登录的接口正常返回都算）+ 间隔，
+  以及登录 Cookie 中最早的过期时间（提前 margin 秒）
+- 心跳拿到新 Cookie 时，若有浏览器（CookieBridge），交给浏览器线程同步过去
+start() 用后台线程运行（sync Playwright / 纯 requests）；start_task() 在事件循环里作为 asyncio 任务运行
+（async Playwright，心跳请求本身放到线程池，不阻塞事件循环）
+"""
+import asyncio
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import requests
+
+from config import KEEPALIVE_INTERVAL
+from session_validity import IDENTITY_COOKIES, SessionValidity, check_user, track_session
+
+
+class SessionKeeper:
+    """后台心跳（线程或 asyncio 任务）"""
+
+    def __init__(self, session: requests.Session, bridge=None, interval: float = KEEPALIVE_INTERVAL,
+                 min_interval: float = 30, margin: float = 60, validity: SessionValidity = None):
+        self.session = session
+        self.bridge = bridge
+        self.interval = interval
+        self.min_interval = min_interval
+        self.margin = margin
+        self.validity = track_session(session, validity)
+        self.beats = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._task = None
+
+    def log(self, msg):
+        try:
+            print(msg)
+        except UnicodeEncodeError:
+            sys.stdout.buffer.write((str(msg) + "\n").encode("utf-8", errors="backslashreplace"))
+            sys.stdout.buffer.flush()
+
+    def earliest_expiry(self) -> Optional[float]:
+        """登录 Cookie 中尚未过期的最早过期时间（会话 Cookie 没有过期时间，不参与）"""
+        now = time.time()
+        expiries = [c.expires for c in self.session.cookies
+                    if c.name in IDENTITY_COOKIES and c.expires and c.expires > now]
+        return min(expiries) if expiries else None
+
+    def next_delay(self) -> float:
+        now = time.time()
+        if self.validity.valid is True:
+            due = self.validity.confirmed_at + self.interval
+        else:
+            # 登录状态未知：尽快确认一次
+            due = now
+        expiry = self.earliest_expiry()
+        if expiry is not None:
+            due = min(due, expiry - self.margin)
+        return max(self.min_interval, due - now)
+
+    def _cookie_snapshot(self):
+        return {(c.domain, c.name, c.path): c.value for c in self.session.cookies}
+
+    def beat(self) -> Optional[bool]:
+        """发送一次心跳，返回 True 有效 / False 已失效 / None 无法判断"""
+        before = self._cookie_snapshot()
+        ok = check_user(self.session)
+        self.beats += 1
+        if ok is True:
+            # 未挂 hook 的 session 在这里补记确认时间
+            self.validity.mark_good("keep-alive")
+            self.log(f"[KEEP-ALIVE] 会话保持：{datetime.now().strftime('%H:%M:%S')}")
+        elif ok is False:
+            self.validity.mark_bad("keep-alive checkUser 返回未登录")
+        else:
+            self.log("[WARN] 会话保持：checkUser 无法判断登录状态，稍后重试")
+        if self.bridge is not None and self._cookie_snapshot() != before:
+            self.bridge.schedule_push()
+        return ok
+
+    def _run(self):
+        while not self._stop.wait(self.next_delay()):
+            try:
+                self.beat()
+            except Exception as e:
+                self.log(f"[WARN] 会话保持失败: {str(e)}")
+
+    def start(self) -> "SessionKeeper":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            self.log(f"[INFO] 已启动会话保持（HTTP 心跳，最长 {int(self.interval) // 60} 分钟一次）")
+        return self
+
+    async def _run_async(self):
+        while not self._stop.is_set():
+            await asyncio.sleep(self.next_delay())
+            try:
+                await asyncio.to_thread(self.beat)
+            except Exception as e:
+                self.log(f"[WARN] 会话保持失败: {str(e)}")
+
+    def start_task(self) -> "SessionKeeper":
+        """在当前事件循环里作为任务运行（必须在协程中调用）"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run_async())
+            self.log(f"[INFO] 已启动会话保持（HTTP 心跳任务，最长 {int(self.interval) // 60} 分钟一次）")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+登录状态跟踪：从 session 的每个响应判断登录是否有效，不再每次启动都单独请求 checkUser
+- 重定向到登录页 / 返回登录页 HTML -> 失效
+- 需要登录的接口正常返回 -> 有效（刷新确认时间）
+只有最近一次确认超过 SESSION_CHECK_TTL 时，ensure() 才会实际请求一次 checkUser
+确认结果按 Cookie（tk/JSESSIONID/uKey）保存到文件，下次启动 Cookie 未变且仍在有效期内时直接复用
+每个 session 有自己的跟踪对象（track_session 挂载时绑定，之后不再改变），保存时按它观察的 session 计算身份
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from config import BASE_URL, SESSION_CHECK_TTL
+from response_decoder import decode_response, LOGIN_MARKERS, LOGIN_PAGE_MARKERS, OK, SESSION_EXPIRED
+
+SESSION_VALIDITY_FILE = "session_validity.json"
+
+# 需要登录才能正常返回的接口（路径片段）
+LOGIN_REQUIRED_PATHS = (
+    "/otn/leftTicket/submitOrderRequest",
+    "/otn/confirmPassenger/",
+    "/otn/login/checkUser",
+    "/otn/index/initMy12306",
+)
+# 上面接口中返回 HTML 页面的
+HTML_ENDPOINTS = ("initDc", "initMy12306")
+# 标识登录身份的 Cookie（任一变化说明换了会话，之前的确认结果作废）
+IDENTITY_COOKIES = ("tk", "JSESSIONID", "uKey")
+
+
+def cookie_identity(session: requests.Session) -> str:
+    """当前会话身份的摘要（不保存 Cookie 原文）"""
+    values = []
+    for name in IDENTITY_COOKIES:
+        values.append(f"{name}={session.cookies.get(name) or ''}")
+    return hashlib.sha1("&".join(values).encode("utf-8")).hexdigest()
+
+
+# 登录状态探测结果
+LOGGED_IN = "logged_in"
+EXPIRED = "expired"
+UNKNOWN = "unknown"
+
+
+def check_user_result(res) -> Optional[bool]:
+    """checkUser 的 JSON -> True 已登录 / False 未登录 / None 无法判断"""
+    if not isinstance(res, dict):
+        return None
+    data = res.get("data") or {}
+    if data.get("flag") is True or (res.get("status") is True and data.get("loginCheck") == "Y"):
+        return True
+    if res.get("status") is True:
+        return False
+    return None
+
+
+def login_state(ok: Optional[bool]) -> str:
+    if ok is True:
+        return LOGGED_IN
+    if ok is False:
+        return EXPIRED
+    return UNKNOWN
+
+
+def check_user(session: requests.Session, timeout: float = 10) -> Optional[bool]:
+    """
+    请求 checkUser 判断登录状态（一次往返）
+    返回 True 已登录 / False 未登录或已失效 / None 无法判断（网络异常、限流等）
+    """
+    url = f"{BASE_URL}/otn/login/checkUser"
+    headers = {
+        "Referer": f"{BASE_URL}/otn/index/initMy12306",
+        "X-Requested-With": "XMLHttpRequest",
+    }
+    try:
+        resp = session.get(url, headers=headers, timeout=timeout, verify=False, allow_redirects=False)
+    except requests.RequestException:
+        return None
+    dec = decode_response(resp)
+    if dec.kind == SESSION_EXPIRED:
+        return False
+    return check_user_result(dec.data)
+
+
+class SessionValidity:
+    """
+    一个 session 的登录状态：valid 为 True/False/None（未知），confirmed_at 为最近一次确认有效的时间
+    session 为观察的 requests session（由 track_session 绑定），保存时按它当前的 Cookie 计算身份
+    """
+
+    def __init__(self, session: requests.Session = None, ttl: float = SESSION_CHECK_TTL,
+                 path: str = SESSION_VALIDITY_FILE):
+        self.ttl = ttl
+        self.path = path
+        self.valid = None
+        self.confirmed_at = 0.0
+        self.reason = ""
+        self.identity = ""
+        self.session = session
+        self._saved_at = 0.0
+
+    # ---------- 标记 ----------
+
+    def mark_good(self, reason: str = ""):
+        changed = self.valid is not True
+        self.valid = True
+        self.confirmed_at = time.time()
+        self.reason = reason
+        # 状态变化时立即保存；一直有效时每半个 TTL 保存一次确认时间
+        if changed or self.confirmed_at - self._saved_at > self.ttl / 2:
+            self.save()
+
+    def mark_bad(self, reason: str = ""):
+        changed = self.valid is not False
+        self.valid = False
+        self.reason = reason
+        if changed:
+            print(f"[WARN] 登录已失效: {reason}")
+            self.save()
+
+    def fresh(self) -> bool:
+        """最近一次确认有效且未超过 TTL"""
+        return self.valid is True and time.time() - self.confirmed_at < self.ttl
+
+    # ---------- 从响应判断 ----------
+
+    def observe(self, resp, *args, **kwargs):
+        """requests 响应 hook：按响应内容更新登录状态，原样返回响应"""
+        try:
+            self._observe(resp)
+        except Exception:
+            pass
+        return resp
+
+    def _observe(self, resp):
+        url = resp.url or ""
+        path = urlsplit(url).path
+        # 登录流程本身的请求不参与判断
+        if any(m in path for m in LOGIN_MARKERS) and "checkUser" not in path:
+            return
+        location = resp.headers.get("Location") or ""
+        if 300 <= resp.status_code < 400:
+            if any(m in location for m in LOGIN_MARKERS):
+                self.mark_bad(f"{path} 重定向到登录页")
+            return
+        content_type = (resp.headers.get("Content-Type") or "").lower()
+        if "text/html" in content_type:
+            head = resp.content[:4096].decode("utf-8", errors="replace")
+            if any(m in head for m in LOGIN_PAGE_MARKERS):
+                self.mark_bad(f"{path} 返回登录页")
+                return
+        if not any(p in path for p in LOGIN_REQUIRED_PATHS) or resp.status_code != 200:
+            return
+        name = path.rstrip("/").rsplit("/", 1)[-1]
+        dec = decode_response(resp, "html" if name in HTML_ENDPOINTS else "json")
+        if dec.kind == SESSION_EXPIRED:
+            self.mark_bad(f"{name} {dec.reason}")
+        elif name == "checkUser":
+            ok = check_user_result(dec.data)
+            if ok is True:
+                self.mark_good(name)
+            elif ok is False:
+                self.mark_bad("checkUser 返回未登录")
+        elif dec.kind == OK:
+            self.mark_good(name)
+
+    # ---------- 按需确认 ----------
+
+    def ensure(self) -> bool:
+        """
+        确认会话可用：最近确认仍在 TTL 内时直接返回 True，否则请求一次 checkUser
+        checkUser 无法判断（网络异常等）时沿用已知状态，未知则按有效处理，交给后续请求的响应判断
+        """
+        session = self.session
+        identity = cookie_identity(session)
+        if identity != self.identity:
+            self.load(identity)
+        if self.valid is False:
+            return False
+        if self.fresh():
+            print(f"[INFO] 登录状态 {int(time.time() - self.confirmed_at)} 秒前已确认，跳过 checkUser")
+            return True
+        ok = check_user(session)
+        if ok is None:
+            print("[WARN] checkUser 无法判断登录状态，继续执行")
+            return self.valid is not False
+        # observe hook 已经处理过响应；未挂 hook 的 session 在这里补记
+        if ok:
+            self.mark_good("checkUser")
+        else:
+            self.mark_bad("checkUser 返回未登录")
+        return ok
+
+    # ---------- 持久化 ----------
+
+    def load(self, identity: str):
+        """
+        加载同一会话身份的确认结果；身份不同则从未知状态开始
+        只恢复“有效”的确认，上次记录的失效状态仍会重新请求 checkUser 确认
+        """
+        self.identity = identity
+        self.valid = None
+        self.confirmed_at = 0.0
+        self.reason = ""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return
+        if data.get("identity") == identity and data.get("valid") is True:
+            self.valid = True
+            self.confirmed_at = float(data.get("confirmed_at") or 0.0)
+            self.reason = data.get("reason") or ""
+
+    def save(self):
+        if self.session is None:
+            return
+        self.identity = cookie_identity(self.session)
+        data = {"identity": self.identity, "valid": self.valid,
+                "confirmed_at": self.confirmed_at, "reason": self.reason}
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self._saved_at = time.time()
+        except OSError:
+            pass
+
+
+def tracker_of(session: requests.Session) -> Optional[SessionValidity]:
+    """session 上已挂载的跟踪对象，没有时返回 None"""
+    for h in session.hooks.get("response", []):
+        if isinstance(getattr(h, "__self__", None), SessionValidity):
+            return h.__self__
+    return None
+
+
+def track_session(session: requests.Session, tracker: SessionValidity = None) -> SessionValidity:
+    """
+    给 session 挂上登录状态跟踪（重复调用不会重复挂载），返回该 session 的跟踪对象
+    不传 tracker 时为 session 新建一个；传入的 tracker 必须未绑定或已绑定同一个 session
+    """
+    existing = tracker_of(session)
+    if existing is not None:
+        return existing
+    tracker = tracker or SessionValidity(session)
+    if tracker.session is None:
+        tracker.session = session
+    elif tracker.session is not session:
+        raise ValueError("SessionValidity 已绑定其它 session")
+    session.hooks.setdefault("response", []).append(tracker.observe)
+    return tracker
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+测试公共配置：模块都在仓库根目录（平铺），把根目录加入 sys.path
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
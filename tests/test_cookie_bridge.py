@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+cookie_bridge：Playwright 与 requests 之间的 Cookie 格式转换，CookieBridge 的增量同步（_apply_pull / _collect_push）
+"""
+import time
+
+import requests
+
+from cookie_bridge import CookieBridge, pw_to_requests_cookie, requests_to_pw_cookie
+
+
+class FakeContext:
+    """只提供 CookieBridge 用到的接口"""
+
+    def __init__(self, cookies=()):
+        self.jar = list(cookies)
+        self.added = []
+
+    def on(self, event, handler):
+        pass
+
+    def cookies(self):
+        return list(self.jar)
+
+    def add_cookies(self, cookies):
+        self.added.extend(cookies)
+
+
+def pw_cookie(name, value, domain="kyfw.12306.cn", path="/", expires=-1, **extra):
+    c = {"name": name, "value": value, "domain": domain, "path": path, "expires": expires,
+         "httpOnly": False, "secure": False}
+    c.update(extra)
+    return c
+
+
+def make_bridge(cookies=()):
+    return CookieBridge(FakeContext(cookies), requests.Session())
+
+
+def test_cookie_conversion_round_trip():
+    expires = int(time.time()) + 3600
+    c = pw_cookie("tk", "abc", domain=".12306.cn", path="/otn", expires=expires,
+                  httpOnly=True, secure=True, sameSite="Lax")
+    back = requests_to_pw_cookie(pw_to_requests_cookie(c))
+    assert back == {**c, "expires": float(expires)}
+
+
+def test_session_cookie_has_no_expiry():
+    assert pw_to_requests_cookie(pw_cookie("a", "1")).expires is None
+    assert "expires" not in requests_to_pw_cookie(pw_to_requests_cookie(pw_cookie("a", "1")))
+
+
+def test_apply_pull_incremental():
+    bridge = make_bridge()
+    cookies = [pw_cookie("tk", "1"), pw_cookie("JSESSIONID", "s1", path="/otn"),
+               pw_cookie("other", "x", domain="example.com")]
+    assert bridge._apply_pull(cookies) == 2
+    assert bridge.session.cookies.get("tk") == "1"
+    assert bridge.session.cookies.get("other") is None
+    # 没有变化时不再写入
+    assert bridge._apply_pull(cookies) == 0
+    cookies[0] = pw_cookie("tk", "2")
+    assert bridge._apply_pull(cookies) == 1
+    assert bridge.session.cookies.get("tk") == "2"
+    assert bridge.pulls == 2
+
+
+def test_apply_pull_removes_deleted():
+    bridge = make_bridge()
+    bridge._apply_pull([pw_cookie("tk", "1"), pw_cookie("uKey", "k")])
+    assert bridge._apply_pull([pw_cookie("tk", "1")]) == 1
+    assert bridge.session.cookies.get("uKey") is None
+    assert bridge.session.cookies.get("tk") == "1"
+
+
+def test_collect_push_only_changes():
+    bridge = make_bridge()
+    bridge._apply_pull([pw_cookie("tk", "1")])
+    # 刚从浏览器同步过来的不需要再推回去
+    assert bridge._collect_push() == []
+    bridge.session.cookies.set("tk", "2", domain="kyfw.12306.cn", path="/")
+    bridge.session.cookies.set("foo", "bar", domain="example.com", path="/")
+    changed = bridge._collect_push()
+    assert [(c["name"], c["value"]) for c in changed] == [("tk", "2")]
+    assert bridge._collect_push() == []
+
+
+def test_collect_push_skips_expired():
+    bridge = make_bridge()
+    bridge.session.cookies.set("old", "x", domain="kyfw.12306.cn", path="/", expires=int(time.time()) - 10)
+    assert bridge._collect_push() == []
+
+
+def test_push_and_pull_through_context():
+    bridge = make_bridge([pw_cookie("tk", "1")])
+    bridge.attach()
+    assert bridge.session.cookies.get("tk") == "1"
+    bridge.session.cookies.set("uamtk", "u", domain="kyfw.12306.cn", path="/")
+    # 在创建它的线程里，schedule_push 立即写入浏览器
+    bridge.schedule_push()
+    assert [c["name"] for c in bridge.context.added] == ["uamtk"]
+    assert bridge.pushes == 1
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+har：捕获记录 -> HAR -> 捕获记录 往返一致；HAR 文件可直接交给 NetworkLog 建索引读取
+"""
+import json
+
+from har import HAR_VERSION, entry_to_record, export_har, record_to_entry
+from network_analyzer import NetworkLog
+
+RECORDS = [
+    {
+        "url": "https://kyfw.12306.cn/otn/leftTicket/queryZ?leftTicketDTO.train_date=2026-02-01&purpose_codes=ADULT",
+        "method": "GET",
+        "headers": {"accept": "application/json", "x-requested-with": "XMLHttpRequest"},
+        "post_data": None,
+        "timestamp": 1769900000.125,
+        "elapsed": 0.25,
+        "response": {"status": 200, "headers": {"content-type": "application/json;charset=UTF-8"},
+                     "content_type": "application/json;charset=UTF-8",
+                     "body": {"status": True, "data": {"result": ["a|b|深圳"]}}},
+    },
+    {
+        "url": "https://kyfw.12306.cn/otn/confirmPassenger/getQueueCount",
+        "method": "POST",
+        "headers": {"content-type": "application/x-www-form-urlencoded; charset=UTF-8"},
+        "post_data": "train_date=Sun+Feb+01+2026&seatType=O",
+        "timestamp": 1769900001.5,
+        "elapsed": 0.1,
+        "response": {"status": 200, "headers": {"content-type": "text/html"}, "content_type": "text/html",
+                     "body": "<html>排队</html>"},
+    },
+    {
+        "url": "https://kyfw.12306.cn/otn/leftTicket/init",
+        "method": "GET",
+        "headers": {},
+        "post_data": None,
+        "timestamp": 1769900002.0,
+        "elapsed": 1.0,
+    },
+]
+
+
+def test_entry_round_trip():
+    for record in RECORDS:
+        assert entry_to_record(record_to_entry(record)) == record
+
+
+def test_entry_fields():
+    entry = record_to_entry(RECORDS[1])
+    assert entry["request"]["postData"]["mimeType"].startswith("application/x-www-form-urlencoded")
+    assert entry["request"]["bodySize"] == len(RECORDS[1]["post_data"])
+    assert entry["time"] == 100.0
+    assert entry["startedDateTime"].endswith("Z")
+    query = record_to_entry(RECORDS[0])["request"]["queryString"]
+    assert {"name": "purpose_codes", "value": "ADULT"} in query
+
+
+def test_http2_pseudo_headers_dropped():
+    entry = record_to_entry(RECORDS[0])
+    entry["request"]["headers"].append({"name": ":authority", "value": "kyfw.12306.cn"})
+    assert ":authority" not in entry_to_record(entry)["headers"]
+
+
+def test_export_and_index(tmp_path):
+    path = str(tmp_path / "capture.har")
+    assert export_har(iter(RECORDS), path) == len(RECORDS)
+    with open(path, encoding="utf-8") as f:
+        har = json.load(f)
+    assert har["log"]["version"] == HAR_VERSION
+    assert len(har["log"]["entries"]) == len(RECORDS)
+    log = NetworkLog.open(path)
+    assert list(log) == RECORDS
+    assert log.find("getQueueCount")["post_data"] == RECORDS[1]["post_data"]
+
+
+def test_export_empty(tmp_path):
+    path = str(tmp_path / "empty.har")
+    assert export_har([], path) == 0
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["log"]["entries"] == []
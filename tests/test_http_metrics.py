@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+http_metrics.LatencyHistogram：分桶精度与百分位；instrument_session 的挂载
+"""
+import random
+
+import requests
+
+from http_metrics import METRICS, LatencyHistogram, MetricsAdapter, RequestMetrics, instrument_session
+
+
+def test_empty():
+    h = LatencyHistogram()
+    assert h.percentile(50) == 0
+    assert h.to_dict()["count"] == 0
+
+
+def test_small_values_exact():
+    h = LatencyHistogram(sub_bits=7)
+    for us in range(1, 101):
+        h.record(us / 1_000_000)
+    assert h.percentile(50) == 50
+    assert h.percentile(90) == 90
+    assert h.percentile(99) == 99
+    assert h.percentile(100) == 100
+    assert (h.min, h.max) == (1, 100)
+
+
+def test_relative_error():
+    rng = random.Random(1)
+    values = sorted(rng.randint(1_000, 5_000_000) for _ in range(5000))
+    h = LatencyHistogram(sub_bits=7)
+    for us in values:
+        h.record(us / 1_000_000)
+    for p in (50, 90, 99):
+        exact = values[int(round(len(values) * p / 100.0)) - 1]
+        # 桶取下界，误差不超过 1/2**(sub_bits-1)
+        assert exact * (1 - 1 / 64) <= h.percentile(p) <= exact
+
+
+def test_bucket_lower_bound():
+    h = LatencyHistogram(sub_bits=2)
+    h.record(0.000007)
+    assert h.percentile(100) == 6
+    assert h.max == 7
+
+
+def test_to_dict():
+    h = LatencyHistogram()
+    for ms in (10, 20, 30):
+        h.record(ms / 1000)
+    d = h.to_dict()
+    assert d["count"] == 3
+    assert d["mean_us"] == 20000
+    assert d["min_us"] == 10000 and d["max_us"] == 30000
+    assert sum(d["buckets"].values()) == 3
+
+
+def test_instrument_session_once():
+    session = requests.Session()
+    assert instrument_session(session) is METRICS
+    adapter = session.get_adapter("https://")
+    assert isinstance(adapter, MetricsAdapter)
+    assert instrument_session(session) is METRICS
+    assert session.get_adapter("https://") is adapter
+
+
+def test_instrument_session_explicit_metrics():
+    session = requests.Session()
+    instrument_session(session)
+    metrics = RequestMetrics()
+    assert instrument_session(session, metrics) is metrics
+    assert session.get_adapter("https://").metrics is metrics
+    assert session.get_adapter("http://").metrics is metrics
+    # 不传 metrics 时沿用已挂载的统计对象
+    assert instrument_session(session) is metrics
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+left_table.expect_left_tickets：用假页面模拟余票查询响应（含 c_url 重发），检查不会漏掉读取响应体期间到达的重发响应
+"""
+import asyncio
+import json
+
+import pytest
+
+from left_table import expect_left_tickets, is_left_ticket_response
+from response_decoder import OK, SERVER_ERROR
+
+QUERY_Z = "https://kyfw.12306.cn/otn/leftTicket/queryZ?leftTicketDTO.train_date=2026-02-01"
+QUERY_G = "https://kyfw.12306.cn/otn/leftTicket/queryG?leftTicketDTO.train_date=2026-02-01"
+
+
+class FakeRequest:
+    redirected_from = None
+
+
+class FakeResponse:
+    def __init__(self, url, data, status=200, on_body=None):
+        self.url = url
+        self.status = status
+        self.headers = {"content-type": "application/json;charset=UTF-8"}
+        self.request = FakeRequest()
+        self._body = json.dumps(data).encode("utf-8")
+        self._on_body = on_body
+
+    async def body(self):
+        await asyncio.sleep(0)
+        if self._on_body:
+            self._on_body()
+        return self._body
+
+
+class FakePage:
+    def __init__(self):
+        self.handlers = []
+
+    def on(self, event, handler):
+        assert event == "response"
+        self.handlers.append(handler)
+
+    def remove_listener(self, event, handler):
+        self.handlers.remove(handler)
+
+    def emit(self, response):
+        for h in list(self.handlers):
+            h(response)
+
+
+RESULT = {"status": True, "httpstatus": 200, "data": {"result": [], "flag": "1"}}
+SWITCH = {"status": False, "c_url": "leftTicket/queryG"}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_retried_query_during_body_read():
+    page = FakePage()
+    # 页面在读取第一个响应体期间就已收到重发的 queryG 响应
+    retried = FakeResponse(QUERY_G, RESULT)
+    first = FakeResponse(QUERY_Z, SWITCH, on_body=lambda: page.emit(retried))
+
+    async def trigger():
+        page.emit(FakeResponse("https://kyfw.12306.cn/otn/leftTicket/queryTicketPrice?x=1", {}))
+        page.emit(first)
+
+    decoded = run(expect_left_tickets(page, trigger, timeout=500))
+    assert decoded.kind == OK
+    assert decoded.data["httpstatus"] == 200
+    assert page.handlers == []
+
+
+def test_timeout():
+    page = FakePage()
+
+    async def trigger():
+        pass
+
+    decoded = run(expect_left_tickets(page, trigger, timeout=50))
+    assert decoded.kind == SERVER_ERROR
+    assert page.handlers == []
+
+
+def test_trigger_error_propagates():
+    page = FakePage()
+
+    async def trigger():
+        raise LookupError("未找到查询按钮")
+
+    with pytest.raises(LookupError):
+        run(expect_left_tickets(page, trigger, timeout=50))
+    assert page.handlers == []
+
+
+def test_is_left_ticket_response():
+    assert is_left_ticket_response(FakeResponse(QUERY_Z, {}))
+    assert not is_left_ticket_response(FakeResponse(QUERY_Z, {}, status=302))
+    assert not is_left_ticket_response(FakeResponse("https://kyfw.12306.cn/otn/leftTicket/queryTicketPrice?a", {}))
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+network_analyzer.NetworkLog：旁路索引按字节偏移读取的结果与整个文件解析的结果一致
+"""
+import json
+import os
+
+import pytest
+
+import network_analyzer
+from har import record_to_entry
+from network_analyzer import INDEX_SUFFIX, NetworkLog, load_network_log, scan_array_items
+
+RECORDS = [
+    {"url": "https://kyfw.12306.cn/otn/leftTicket/init", "method": "GET", "headers": {},
+     "timestamp": 1.0, "response": {"status": 200, "content_type": "text/html", "body": "<html>深圳 → 长沙</html>"}},
+    {"url": "https://kyfw.12306.cn/otn/confirmPassenger/getQueueCount", "method": "POST", "headers": {"a": "b"},
+     "post_data": "train_date=Sun+Feb+01+2026", "timestamp": 2.0,
+     "response": {"status": 200, "content_type": "application/json",
+                  "body": {"status": True, "data": {"ticket": "二等座,12"}}}},
+    {"url": "https://kyfw.12306.cn/otn/confirmPassenger/getQueueCount", "method": "GET", "headers": {},
+     "timestamp": 3.0},
+    {"url": "https://kyfw.12306.cn/otn/leftTicket/query", "method": "GET", "headers": {}, "timestamp": 4.0,
+     "response": {"status": 200, "content_type": "text/plain",
+                  "body": "引号 \\\" 反斜杠 \\\\ 括号 ]}[{ 逗号, 冒号: \\u4e2d"}},
+]
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "network_requests_20260101_000000.json"
+    path.write_text(json.dumps(RECORDS, ensure_ascii=False, indent=2), encoding="utf-8")
+    return str(path)
+
+
+def test_index_matches_full_load(log_file):
+    log = NetworkLog.open(log_file)
+    assert os.path.exists(log_file + INDEX_SUFFIX)
+    with open(log_file, encoding="utf-8") as f:
+        full = json.load(f)
+    assert list(log) == full
+    assert list(NetworkLog.open(log_file).stream()) == full
+    assert [e["endpoint"] for e in log.entries] == ["init", "getQueueCount", "getQueueCount", "query"]
+
+
+def test_find(log_file):
+    log = load_network_log(log_file)
+    assert log.find("getQueueCount")["post_data"] == "train_date=Sun+Feb+01+2026"
+    assert log.find("getQueueCount", method="GET")["timestamp"] == 3.0
+    assert len(log.find_all("getQueueCount")) == 2
+    assert log.find("confirmSingleForQueue") is None
+
+
+def test_index_reused(log_file, monkeypatch):
+    NetworkLog.open(log_file)
+    monkeypatch.setattr(NetworkLog, "build_index", staticmethod(lambda path: pytest.fail("索引应被复用")))
+    assert len(NetworkLog.open(log_file)) == len(RECORDS)
+
+
+def test_stale_index_rebuilt(log_file):
+    NetworkLog.open(log_file)
+    with open(log_file, "w", encoding="utf-8") as f:
+        json.dump(RECORDS[:1], f, ensure_ascii=False)
+    log = NetworkLog.open(log_file)
+    assert list(log) == RECORDS[:1]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64, 1 << 20])
+def test_scan_offsets_any_chunk_size(log_file, chunk_size):
+    with open(log_file, "rb") as f:
+        raw = f.read()
+        f.seek(0)
+        items = list(scan_array_items(f, chunk_size=chunk_size))
+    assert [json.loads(raw[offset:offset + length]) for _, offset, length in items] == RECORDS
+    # 只保留索引字段，不保留响应体
+    assert items[1][0] == {("url",): RECORDS[1]["url"], ("method",): "POST", ("timestamp",): 2.0,
+                           ("response", "status"): 200}
+    assert ("response", "status") not in items[2][0]
+
+
+def test_har_index(tmp_path):
+    path = tmp_path / "capture.har"
+    har = {"log": {"version": "1.2", "creator": {"name": "x", "version": "1"},
+                   "entries": [record_to_entry(r) for r in RECORDS]}}
+    path.write_text(json.dumps(har, ensure_ascii=False), encoding="utf-8")
+    log = NetworkLog.open(str(path))
+    assert [e["endpoint"] for e in log.entries] == ["init", "getQueueCount", "getQueueCount", "query"]
+    assert [e["status"] for e in log.entries] == [200, 200, None, 200]
+    assert [r["url"] for r in log.stream()] == [r["url"] for r in RECORDS]
+
+
+def test_find_latest(tmp_path):
+    for name in ("network_requests_20260101_000000.json", "network_requests_20260102_000000.json",
+                 "network_capture_20260101_120000.000.ndjson.gz", "other.json"):
+        (tmp_path / name).write_text("[]", encoding="utf-8")
+    latest = network_analyzer.find_latest_network_log(str(tmp_path))
+    assert os.path.basename(latest) == "network_requests_20260102_000000.json"
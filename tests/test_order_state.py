@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+order_state.OrderState：恢复步骤判断、检查点读写；order_flow.OrderFlow.run 的 stop_after 限制
+"""
+import os
+import time
+
+import pytest
+
+import order_flow
+from order_state import HISTORY_LIMIT, OrderState, TOKEN_TTL, TRAIN_TTL
+
+
+def _state(done: str, token: str = "tok") -> OrderState:
+    st = OrderState()
+    st.selected_train = {"train_code": "G1"}
+    st.query_time = time.time()
+    st.set_token(token)
+    st.state = done
+    return st
+
+
+def test_resume_from_start():
+    assert OrderState().resume_step() == "query"
+
+
+def test_resume_next_step():
+    assert _state("passenger").resume_step() == "check_order"
+
+
+def test_resume_done():
+    assert _state("confirm").resume_step() is None
+
+
+def test_resume_train_expired():
+    st = _state("check_order")
+    st.query_time = time.time() - TRAIN_TTL - 1
+    assert st.resume_step() == "query"
+
+
+def test_resume_token_expired():
+    st = _state("check_order")
+    st.token_time = time.time() - TOKEN_TTL - 1
+    assert st.resume_step() == "submit"
+
+
+def test_rewind_and_advance():
+    st = _state("check_order")
+    st.rewind("submit")
+    assert st.state == "query"
+    st.begin("submit")
+    st.advance("submit")
+    assert st.state == "submit"
+    assert st.history[-1]["from"] == "query"
+    with pytest.raises(ValueError):
+        st.advance("pay")
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    st = _state("init_dc")
+    st.candidates = [{"train_code": "G1", "seat": "second"}]
+    st.stop_after = "queue_count"
+    st.save(path)
+    loaded = OrderState.load(path)
+    assert loaded.to_dict() == st.to_dict()
+    assert loaded.resume_step() == "passenger"
+
+
+def test_checkpoint_history_capped(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    st = _state("query")
+    for _ in range(HISTORY_LIMIT + 5):
+        st.rewind("query")
+        st.advance("query")
+    st.save(path)
+    loaded = OrderState.load(path)
+    assert len(loaded.history) == HISTORY_LIMIT
+    assert loaded.history == st.history[-HISTORY_LIMIT:]
+
+
+def test_checkpoint_missing_or_broken(tmp_path):
+    assert OrderState.load(str(tmp_path / "none.json")) is None
+    bad = tmp_path / "bad.json"
+    bad.write_text("{", encoding="utf-8")
+    assert OrderState.load(str(bad)) is None
+
+
+def test_limit():
+    st = OrderState()
+    assert st.limit("confirm") == "confirm"
+    st.stop_after = "queue_count"
+    assert st.limit("confirm") == "queue_count"
+    assert st.limit("check_order") == "check_order"
+
+
+# ---------- OrderFlow.run 与 stop_after ----------
+
+class FakeFlow(order_flow.OrderFlow):
+    """不发请求：每个步骤直接成功，fail 中的步骤返回失败"""
+
+    def __init__(self, state=None, fail=(), queue_count_ok=True):
+        super().__init__(state)
+        self.calls = []
+        self.fail = set(fail)
+        self.queue_count_ok = queue_count_ok
+        self.phases.add = lambda *a: None
+
+    def log(self, msg):
+        pass
+
+    def get_queue_count(self):
+        return self.queue_count_ok
+
+    def _run_step(self, step, *args):
+        self.calls.append(step)
+        if step in self.fail:
+            return False
+        if step == "queue_count":
+            return super()._run_step(step, *args)
+        if step == "query":
+            self.selected_train = {"train_code": "G1"}
+            self.state.query_time = time.time()
+        if step == "init_dc":
+            self.repeat_token = "tok"
+        return True
+
+
+def test_run_stops_after(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    flow = FakeFlow()
+    assert flow.run(stop_after="queue_count", checkpoint=path)
+    assert flow.calls[-1] == "queue_count"
+    # 提前停止的 run 不留下可恢复到 confirm 的检查点
+    assert not os.path.exists(path)
+    flow.calls.clear()
+    assert flow.run(stop_after="queue_count", checkpoint=path)
+    assert flow.calls == []
+
+
+def test_run_staged():
+    flow = FakeFlow()
+    assert flow.run(stop_after="check_order")
+    flow.calls.clear()
+    assert flow.run(stop_after="queue_count")
+    assert flow.calls == ["queue_count"]
+
+
+def test_limited_checkpoint_never_confirms(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    assert not FakeFlow(fail={"queue_count"}).run(stop_after="queue_count", checkpoint=path)
+    state = OrderState.load(path)
+    assert state.stop_after == "queue_count"
+    resumed = FakeFlow(state)
+    assert resumed.run(checkpoint=path)
+    assert resumed.calls == ["queue_count"]
+    assert not os.path.exists(path)
+
+
+def test_full_run_from_start():
+    flow = FakeFlow()
+    assert flow.run()
+    assert flow.calls == ["query", "submit", "init_dc", "passenger", "check_order", "queue_count", "confirm"]
+    assert flow.state.resume_step() is None
+
+
+def test_run_history_start():
+    flow = FakeFlow()
+    assert flow.run(stop_after="check_order")
+    resumed = FakeFlow(flow.state)
+    assert resumed.run()
+    # 恢复后的耗时分解只取本次 run 的步骤
+    assert [h["to"] for h in resumed.state.history[resumed.run_history_start:]] == ["queue_count", "confirm"]
+
+
+def test_queue_count_failure_uses_checkpoint_limit(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    assert not FakeFlow(fail={"queue_count"}).run(stop_after="queue_count", checkpoint=path)
+    # 恢复的 run 没有传 stop_after，但检查点限制在 queue_count：getQueueCount 失败不应当作成功
+    resumed = FakeFlow(OrderState.load(path), queue_count_ok=False)
+    assert not resumed.run(checkpoint=path)
+    assert resumed.calls == ["queue_count"]
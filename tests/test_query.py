@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+query.rank_candidates / seat_count：候选按席别优先级、余票张数、出发时间排序
+"""
+from query import rank_candidates, seat_count
+
+
+def _train(code, start, second="", no_seat=""):
+    return {"train_code": code, "start": start, "second": second, "no_seat": no_seat}
+
+
+def test_seat_count():
+    assert seat_count("12") == 12
+    assert seat_count("有") == 20
+    assert seat_count("少") == 1
+    assert seat_count("无") == 0
+    assert seat_count("--") == 0
+    assert seat_count("") == 0
+
+
+def test_rank_order():
+    trains = [
+        _train("G3", "09:00", second="5", no_seat="有"),
+        _train("G1", "08:00", second="5"),
+        _train("G2", "10:00", second="有"),
+        _train("G4", "07:00", no_seat="3"),
+    ]
+    ranked = [(c["train"]["train_code"], c["seat_name"]) for c in rank_candidates(trains)]
+    # 二等座优先；同席别余票多的优先；余票相同出发早的优先；之后才是无座
+    assert ranked == [("G2", "二等座"), ("G1", "二等座"), ("G3", "二等座"), ("G3", "无座"), ("G4", "无座")]
+
+
+def test_rank_candidate_fields():
+    c = rank_candidates([_train("G1", "08:00", second="7")])[0]
+    assert (c["seat_code"], c["count"]) == ("O", 7)
+
+
+def test_rank_seat_filters():
+    trains = [_train("G1", "08:00", second="5", no_seat="5")]
+    assert [c["seat_name"] for c in rank_candidates(trains, allow_second=False)] == ["无座"]
+    assert [c["seat_name"] for c in rank_candidates(trains, allow_no_seat=False)] == ["二等座"]
+    assert rank_candidates([_train("G1", "08:00", second="无")]) == []
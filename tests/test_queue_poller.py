@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+queue_poller.OrderQueuePoller：对本地模拟排队接口轮询，检查按 waitTime 的轮询节奏和各种结束状态
+sleep 换成假时钟（记录每次等待的秒数并推进时间），测试不实际等待
+"""
+import json
+import time
+import types
+
+import pytest
+import requests
+
+import queue_poller
+from queue_poller import OrderQueuePoller, _run_mock_server, mock_wait_reply
+from response_decoder import BUSINESS_FAIL, SESSION_EXPIRED
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = types.SimpleNamespace(now=time.time(), sleeps=[])
+
+    def sleep(seconds):
+        fake.sleeps.append(seconds)
+        fake.now += seconds
+
+    monkeypatch.setattr(queue_poller, "time", types.SimpleNamespace(
+        time=lambda: fake.now, sleep=sleep, perf_counter=time.perf_counter))
+    return fake
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(**kwargs):
+        server, base_url = _run_mock_server(**kwargs)
+        servers.append(server)
+        poller = OrderQueuePoller(requests.Session(), "TOKEN", base_url=base_url,
+                                  min_interval=0.5, max_interval=5.0, timeout=30)
+        poller.log = lambda msg: None
+        return server, poller
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _script(*replies):
+    """按顺序返回 replies，之后一直返回最后一个"""
+    return lambda n: replies[min(n, len(replies)) - 1]
+
+
+def test_paced_by_wait_time(clock, serve):
+    server, poller = serve(ready_after=3)
+    assert poller.poll() == "EMOCK000001"
+    assert server.hits == 3
+    # waitTime=4 waitCount=2 -> 2 秒；waitCount=1（队首）-> 最小间隔
+    assert clock.sleeps == [2.0, 0.5]
+    assert [p["waitCount"] for p in poller.polls] == [2, 1, 0]
+
+
+def test_delay_capped(clock, serve):
+    server, poller = serve(script=_script(mock_wait_reply(120, 50), mock_wait_reply(-1, 0, "E1")))
+    assert poller.poll() == "E1"
+    assert clock.sleeps == [5.0]
+
+
+def test_queue_failed(clock, serve):
+    server, poller = serve(script=_script(mock_wait_reply(-2, 0, msg="没有足够的票")))
+    assert poller.poll() is None
+    assert server.hits == 1
+    assert poller.error == "没有足够的票"
+    assert clock.sleeps == []
+
+
+@pytest.mark.parametrize("reply", [mock_wait_reply(-3, 0, msg="订单已撤销"), mock_wait_reply(-4, 0, msg="出票失败")])
+def test_negative_wait_time_with_msg_stops(clock, serve, reply):
+    server, poller = serve(script=_script(reply))
+    assert poller.poll() is None
+    assert server.hits == 1
+    assert poller.error == json.loads(reply[2])["data"]["msg"]
+
+
+def test_cancelled_without_msg_stops(clock, serve):
+    server, poller = serve(script=_script(mock_wait_reply(-3, 0)))
+    assert poller.poll() is None
+    assert server.hits == 1
+
+
+def test_breakdown_from_current_run(clock):
+    poller = OrderQueuePoller(requests.Session(), "TOKEN")
+    poller.started_at, poller.finished_at = 100.0, 101.0
+    # 本次 run 从 98.5 秒开始（第一步耗时 0.5 秒，完成于 99.0 秒）
+    history = [{"from": "start", "to": "query", "elapsed": 0.5, "at": 99.0},
+               {"from": "query", "to": "confirm", "elapsed": 1.0, "at": 100.0}]
+    rows = {row["phase"]: row["ms"] for row in poller.latency_breakdown(history)}
+    assert rows["queue_wait"] == 1000.0
+    assert rows["total"] == 2500.0
+
+
+def test_session_expired_stops(clock, serve):
+    redirect = (302, {"Location": "/otn/login/init"}, b"")
+    server, poller = serve(script=_script(redirect))
+    assert poller.poll() is None
+    assert server.hits == 1
+    assert poller.last_result.kind == SESSION_EXPIRED
+
+
+def test_business_fail_stops(clock, serve):
+    body = json.dumps({"status": False, "httpstatus": 200, "messages": ["非法请求"]}).encode("utf-8")
+    server, poller = serve(script=_script((200, {"Content-Type": "application/json"}, body)))
+    assert poller.poll() is None
+    assert server.hits == 1
+    assert poller.last_result.kind == BUSINESS_FAIL
+    assert "非法请求" in poller.error
+
+
+def test_server_error_retried(clock, serve):
+    error = (503, {"Content-Type": "text/html"}, b"<html>busy</html>")
+    server, poller = serve(script=_script(error, error, mock_wait_reply(-1, 0, "E2")))
+    assert poller.poll() == "E2"
+    assert server.hits == 3
+    assert clock.sleeps == [0.5, 0.5]
+
+
+def test_timeout(clock, serve):
+    server, poller = serve(script=_script(mock_wait_reply(8, 3)))
+    assert poller.poll() is None
+    assert poller.order_id is None
+    assert sum(clock.sleeps) >= poller.timeout
+    assert all(s == 4.0 for s in clock.sleeps)
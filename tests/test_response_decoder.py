@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+response_decoder.decode_response / classify_json：按状态码、Location、Content-Type 和响应体归类
+"""
+import json
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from response_decoder import (
+    BUSINESS_FAIL,
+    OK,
+    SERVER_ERROR,
+    SESSION_EXPIRED,
+    THROTTLED,
+    classify_json,
+    decode_response,
+    find_message,
+)
+
+
+def make_response(status=200, body=b"", content_type="application/json;charset=UTF-8", location=None,
+                  url="https://kyfw.12306.cn/otn/x", history=()):
+    resp = requests.Response()
+    resp.status_code = status
+    headers = {"Content-Type": content_type} if content_type else {}
+    if location:
+        headers["Location"] = location
+    resp.headers = CaseInsensitiveDict(headers)
+    resp._content = body.encode("utf-8") if isinstance(body, str) else body
+    resp.url = url
+    resp.history = list(history)
+    resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+    return resp
+
+
+def json_body(**res):
+    return json.dumps(res, ensure_ascii=False)
+
+
+def test_ok_json():
+    dec = decode_response(make_response(body=json_body(status=True, httpstatus=200, data={"a": 1})))
+    assert dec.kind == OK and dec.ok
+    assert dec.data["data"] == {"a": 1}
+
+
+def test_json_with_bom_and_whitespace():
+    body = b"\xef\xbb\xbf\n  " + json_body(status=True).encode("utf-8")
+    assert decode_response(make_response(body=body)).kind == OK
+
+
+def test_business_fail():
+    dec = decode_response(make_response(body=json_body(status=False, messages=["余票不足"])))
+    assert dec.kind == BUSINESS_FAIL
+    assert not dec.retryable
+    assert find_message(dec, ("余票不足",)) == "余票不足"
+
+
+def test_json_login_message():
+    dec = decode_response(make_response(body=json_body(status=False, messages=["用户未登录"])))
+    assert dec.kind == SESSION_EXPIRED
+
+
+def test_json_throttle_message():
+    dec = decode_response(make_response(body=json_body(status=False, messages=["系统繁忙，请稍后重试"])))
+    assert dec.kind == THROTTLED and dec.retryable
+
+
+def test_redirect_to_login():
+    dec = decode_response(make_response(302, content_type=None, location="https://kyfw.12306.cn/otn/login/init"))
+    assert dec.kind == SESSION_EXPIRED
+
+
+def test_redirect_to_error_page():
+    dec = decode_response(make_response(302, content_type=None, location="/mormhweb/logFiles/error.html"))
+    assert dec.kind == THROTTLED
+
+
+def test_followed_redirect_to_login():
+    resp = make_response(body="<html></html>", content_type="text/html",
+                         url="https://kyfw.12306.cn/otn/resources/login.html", history=[object()])
+    assert decode_response(resp).kind == SESSION_EXPIRED
+
+
+def test_status_codes():
+    assert decode_response(make_response(429)).kind == THROTTLED
+    assert decode_response(make_response(403)).kind == THROTTLED
+    assert decode_response(make_response(502)).kind == SERVER_ERROR
+
+
+def test_empty_body():
+    dec = decode_response(make_response(body=b""))
+    assert dec.kind == SERVER_ERROR and dec.reason == "空响应"
+
+
+def test_html_login_page_for_json():
+    body = '<!DOCTYPE html><html><div class="login-hd-code"></div></html>'
+    dec = decode_response(make_response(body=body, content_type="text/html;charset=utf-8"))
+    assert dec.kind == SESSION_EXPIRED
+
+
+def test_html_error_page_for_json():
+    body = "<html><body>网络可能存在问题，请您重试一下</body></html>"
+    dec = decode_response(make_response(body=body, content_type="text/html;charset=utf-8"))
+    assert dec.kind == THROTTLED
+
+
+def test_html_expected():
+    body = "<html><script>var globalRepeatSubmitToken = 'abc';</script></html>"
+    dec = decode_response(make_response(body=body, content_type="text/html;charset=utf-8"), expect="html")
+    assert dec.kind == OK
+    assert "globalRepeatSubmitToken" in dec.data
+
+
+def test_html_expected_but_json():
+    dec = decode_response(make_response(body=json_body(status=True)), expect="html")
+    assert dec.kind == SERVER_ERROR
+
+
+def test_broken_json():
+    assert decode_response(make_response(body='{"status": tru')).kind == SERVER_ERROR
+    assert decode_response(make_response(body="not json")).kind == SERVER_ERROR
+
+
+def test_classify_json_non_object():
+    assert classify_json([1, 2]).kind == SERVER_ERROR
+    assert classify_json({"status": True, "httpstatus": 500}).kind == BUSINESS_FAIL
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+session_validity.track_session：每个 session 一个跟踪对象，保存时按它观察的 session 计算身份
+"""
+import json
+
+import pytest
+import requests
+
+from session_validity import SessionValidity, cookie_identity, track_session, tracker_of
+
+
+def _session(tk: str) -> requests.Session:
+    session = requests.Session()
+    session.cookies.set("tk", tk, domain="kyfw.12306.cn")
+    return session
+
+
+def test_one_tracker_per_session():
+    a, b = _session("A"), _session("B")
+    ta, tb = track_session(a), track_session(b)
+    assert ta is not tb
+    assert ta.session is a and tb.session is b
+    assert track_session(a) is ta
+    assert tracker_of(a) is ta
+    assert a.hooks["response"].count(ta.observe) == 1
+
+
+def test_tracker_bound_to_other_session():
+    tracker = track_session(_session("A"))
+    with pytest.raises(ValueError):
+        track_session(_session("B"), tracker)
+
+
+def test_save_uses_observed_session(tmp_path):
+    path = str(tmp_path / "validity.json")
+    a, b = _session("A"), _session("B")
+    ta = track_session(a, SessionValidity(path=path))
+    track_session(b, SessionValidity(path=path))
+    ta.mark_good("checkUser")
+    with open(path, encoding="utf-8") as f:
+        saved = json.load(f)
+    assert saved["identity"] == cookie_identity(a)
+    assert saved["valid"] is True
+
+
+def test_ensure_reuses_fresh_confirmation(tmp_path, monkeypatch):
+    path = str(tmp_path / "validity.json")
+    a = _session("A")
+    track_session(a, SessionValidity(path=path)).mark_good("checkUser")
+    monkeypatch.setattr("session_validity.check_user", lambda session: pytest.fail("不应请求 checkUser"))
+    # 同一身份的新 session：从文件恢复确认结果
+    assert track_session(_session("A"), SessionValidity(path=path)).ensure() is True
+    # 身份不同：需要确认
+    monkeypatch.setattr("session_validity.check_user", lambda session: False)
+    assert track_session(_session("B"), SessionValidity(path=path)).ensure() is False